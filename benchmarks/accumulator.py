@@ -0,0 +1,76 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Times collecting N UDF records through the ResultAccumulator against
+building them with a pandas.concat() per record, as mantis-monitor did
+before. The accumulator's time per record should stay flat as N grows;
+concat's grows with N.
+
+Usage: python benchmarks/accumulator.py [N ...]
+"""
+
+import sys
+import time
+import warnings
+
+import pandas
+
+from mantis_monitor.accumulator import ResultAccumulator
+
+def compare(*sizes):
+    """
+    Time collecting N UDF records through the ResultAccumulator() and through
+    a pandas.concat() per record, as the results were built before, for
+    each N in sizes
+    """
+    columns = ["benchmark_name", "collector_name", "iteration", "timescale", "units", "measurements"]
+    counters = ["counter_{}".format(index) for index in range(8)]
+
+    def record(iteration):
+        record = {"benchmark_name": "benchmark", "benchmark_set": "benchmark", \
+            "collector_name": "PerfCollector_{}".format(iteration % 3), "iteration": iteration, \
+            "timescale": 1000, "units": "count per timescale milliseconds", "measurements": counters, \
+            "duration": 1.0}
+        for counter in counters:
+            record[counter] = [[second, float(second)] for second in range(50)]
+        return record
+
+    for size in sizes or (250, 500, 1000, 2000):
+        records = [record(iteration) for iteration in range(size)]
+
+        started = time.perf_counter()
+        accumulator = ResultAccumulator(columns)
+        for data in records:
+            accumulator.extend([data])
+        accumulated = accumulator.to_dataframe()
+        accumulator_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        concatenated = pandas.DataFrame(columns = columns)
+        with warnings.catch_warnings():
+            # pandas warns about concatenating onto the empty first frame
+            warnings.simplefilter("ignore", FutureWarning)
+            for data in records:
+                concatenated = pandas.concat([concatenated, pandas.DataFrame([data])])
+        concat_time = time.perf_counter() - started
+
+        assert accumulated.shape == concatenated.shape
+        print("{} records: accumulator {:.1f} us per record, concat {:.1f} us per record ({:.1f}x)".format( \
+            size, accumulator_time / size * 1e6, concat_time / size * 1e6, concat_time / accumulator_time))
+
+if __name__ == "__main__":
+    compare(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,72 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Times one sample of a tree of sleeping processes through the procfs
+reader (ProcessTreeTracker and ProcSampler) and through psutil, as the PFS
+Collector's default reader does.
+
+Usage: python benchmarks/procfs.py [processes [samples]]
+"""
+
+import asyncio
+import subprocess
+import sys
+import time
+
+import psutil
+
+from mantis_monitor.collector.procfs import ProcSampler, ProcessTreeTracker
+
+def compare(processes = 256, samples = 20):
+    """
+    Time one sample of a tree of sleeping processes, through the
+    ProcSampler and through psutil as PFSTimeTestRun does
+    """
+    shell = subprocess.Popen("for i in $(seq {}); do sleep 60 & done; wait".format(processes), shell = True)
+    try:
+        time.sleep(1)
+        tracker = ProcessTreeTracker(shell.pid)
+        tracker.refresh()
+        sampler = ProcSampler(tracker)
+        started = time.perf_counter()
+        for _ in range(samples):
+            tracker.refresh()
+            sampler.sample()
+        procfs_time = (time.perf_counter() - started) / samples
+        sampler.close()
+        asyncio.run(tracker.stop())
+
+        shell_proc = psutil.Process(shell.pid)
+        started = time.perf_counter()
+        for _ in range(samples):
+            for child in shell_proc.children(True):
+                try:
+                    child.as_dict(['memory_info', 'cpu_percent', 'io_counters'])
+                except psutil.NoSuchProcess:
+                    continue
+        psutil_time = (time.perf_counter() - started) / samples
+    finally:
+        for child in psutil.Process(shell.pid).children(True):
+            child.kill()
+        shell.kill()
+        shell.wait()
+
+    print("{} processes: procfs {:.3f} ms per sample, psutil {:.3f} ms per sample ({:.1f}x)".format( \
+        processes, procfs_time * 1000, psutil_time * 1000, psutil_time / procfs_time))
+
+if __name__ == "__main__":
+    compare(*(int(arg) for arg in sys.argv[1:]))
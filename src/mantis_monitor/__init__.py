@@ -2,6 +2,6 @@
 Mantis Monitor!
 
 '''
-from . import monitor, configuration, benchmark, collector, formatter
+from . import monitor, configuration, accumulator, checkpoint, scheduler, distributed, live, overhead, benchmark, collector, formatter
 
 __all__ = ['formatter']
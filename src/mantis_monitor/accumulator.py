@@ -0,0 +1,119 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the implementation of the ResultAccumulator.
+
+Every TestRun hands back a single dictionary in the Unified Data Format (UDF).
+Rather than building a new pandas DataFrame for each of these and
+concatenating it onto everything collected so far (which copies the whole
+result on every step), the ResultAccumulator appends each record into one
+growable list per column and builds the final DataFrame exactly once.
+
+Appending a record costs time proportional to the number of columns, so
+collecting N TestRuns is linear in N; benchmarks/accumulator.py times
+both approaches for growing N.
+"""
+
+import math
+
+import pandas
+
+class ResultAccumulator():
+    """
+    Column-wise buffer for UDF records
+
+    Columns are created the first time a record uses them; rows which don't
+    carry a given column are padded with NaN, matching what pandas.concat
+    produced for sparse records.
+
+    :ivar columns: Mapping of column name to the list of values in that column
+    :type columns: dict
+    :ivar index: Row labels; each batch given to extend() is labelled from 0,
+    the same as a DataFrame built from that batch alone
+    :type index: list
+    :ivar length: Number of rows accumulated so far
+    :type length: int
+    """
+
+    def __init__(self, columns = None):
+        """
+        Init the object
+
+        :param columns: Column names which should always be present (and come
+        first) in the built DataFrame, even if no record uses them
+        :type columns: list
+
+        :return: None
+        """
+        self.columns = {}
+        self.index = []
+        self.length = 0
+
+        for column in columns or []:
+            self.columns[column] = []
+
+    def __len__(self):
+        return self.length
+
+    def append(self, record, label = 0):
+        """
+        Add one UDF record as a new row
+
+        :param record: A UDF dictionary, as returned by a TestRun
+        :type record: dict
+        :param label: The index label for this row
+        :type label: int
+
+        :return: None
+        """
+        for key, value in record.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = [math.nan] * self.length
+                self.columns[key] = column
+            column.append(value)
+
+        self.length += 1
+        self.index.append(label)
+
+        # Pad every column this record didn't touch
+        for column in self.columns.values():
+            if len(column) < self.length:
+                column.append(math.nan)
+
+    def extend(self, records):
+        """
+        Add a batch of UDF records, such as the data list of a Collector
+
+        :param records: UDF dictionaries to add; None is treated as empty
+        :type records: list
+
+        :return: None
+        """
+        for label, record in enumerate(records or []):
+            self.append(record, label)
+
+    def to_dataframe(self):
+        """
+        Build the UDF DataFrame from everything accumulated so far
+
+        :return: The UDF, one row per record
+        :rtype: pandas.DataFrame()
+        """
+        return pandas.DataFrame(self.columns, index = self.index)
+
+__all__ = ['ResultAccumulator']
@@ -34,6 +34,7 @@ an extension can be found in XSBench - a custom class to run the
 ECP proxy app XSBench.
 """
 
+import collections.abc
 import logging
 import subprocess
 
@@ -95,6 +96,47 @@ class Benchmark():
             return None
         return Benchmark.implementations[name].generate_benchmarks(arguments)
 
+    @staticmethod
+    def get_benchmark_sets(configuration):
+        """
+        Build every Benchmark named in a Configuration, grouped into the sets
+        which run together
+
+        Without a benchmark_matrix every Benchmark runs alone, in a set named
+        "solo". With one, each row of the matrix is a set of co-running
+        Benchmarks named by joining their names with colons.
+
+        :param configuration: Configuration object from this mantis-monitor instance
+        :type configuration: Configuration()
+
+        :return: (benchmark_set, [Benchmark()]) tuples, in run order
+        :rtype: list
+        """
+        run_benchmarks = []
+
+        # Process benchmark matrix configuration
+        if isinstance(configuration.benchmark_matrix, collections.abc.Sequence):
+            for benchmark_set in configuration.benchmark_matrix:
+                benchmarks = []
+                for bench in benchmark_set:
+                    bench_datas = [ b for b in configuration.contents["benchmarks"] if b["name"] == bench ]
+                    if len(bench_datas) != 1:
+                        raise Exception("Could not match benchmark name " + bench + " to a single configured benchmark")
+                    bench_data = bench_datas[0]
+                    if "type" not in bench_data:
+                        bench_data["type"] = "generic_benchmark"
+                    benchmarks.extend(Benchmark.get_benchmarks(bench_data["type"], bench_data))
+                run_benchmarks.append((':'.join(benchmark_set), benchmarks))
+        else:
+            for bench in configuration.contents["benchmarks"]:
+                if "type" not in bench:
+                    bench["type"] = "generic_benchmark"
+                print("Adding benchmark ", bench["type"], bench["name"])
+                for each_benchmark in Benchmark.get_benchmarks(bench["type"], bench) or []:
+                    run_benchmarks.append(('solo', [each_benchmark]))
+
+        return run_benchmarks
+
     @classmethod
     def generate_benchmarks(cls, arguments):
         return [cls(arguments)]
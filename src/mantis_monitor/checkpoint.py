@@ -0,0 +1,250 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the implementation of the CheckpointLog.
+
+While a campaign is running, every finished TestRun's UDF records are
+appended to a single JSON-lines file, one line per batch, and fsync'd before
+collection continues. Each checkpoint therefore only writes the new data,
+and a run which dies part-way leaves behind everything collected up to the
+last finished TestRun.
+
+Each batch is tagged with the cell it came from, that is the
+(benchmark_name, benchmark_set, collector_name, iteration) tuple, where
+collector_name is the collection mode from the configuration. When a
+Collector has run all of its TestRuns a "done" line is written for its cell,
+which lets a resumed run (mantis-monitor --resume) skip cells that have
+already completed and discard records from cells that were cut short. A
+run started without --resume refuses to replace a leftover log, unless
+given --overwrite.
+
+Once the campaign completes the Formatters write the consolidated output and
+the log is removed. A leftover log can be read back into the UDF with
+CheckpointLog.to_dataframe(), or written out by the configured Formatters,
+as <test_name>_incomplete, with mantis-monitor --consolidate.
+
+Records are written as JSON. NumPy scalars and arrays are converted to
+their JSON equivalents; any other type JSON cannot hold is an error, so a
+resumed run reads back exactly what was collected.
+"""
+
+import json
+import os
+
+import numpy
+
+from mantis_monitor.accumulator import ResultAccumulator
+
+def _to_json(value):
+    """
+    Convert the non-JSON values UDF records may hold (NumPy scalars and
+    arrays) to the JSON types that read back as equal values
+
+    :param value: A value json cannot encode itself
+    :return: The value as an int, float, bool or list
+    :raises TypeError: for any other type, rather than logging a value a
+    resumed run would read back as something else
+    """
+    if isinstance(value, numpy.integer):
+        return int(value)
+    if isinstance(value, numpy.floating):
+        return float(value)
+    if isinstance(value, numpy.bool_):
+        return bool(value)
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    raise TypeError("Cannot write {!r} of type {} to the checkpoint log".format(value, type(value).__name__))
+
+class CheckpointLog():
+    """
+    Append-only, line-per-batch log of UDF records
+
+    :ivar filename: Path of the log file
+    :type filename: str
+    :ivar file: The open log file, or None when closed
+    """
+
+    suffix = ".jsonl"
+
+    def __init__(self, filename):
+        """
+        Init the object
+
+        :param filename: Path of the log file, without the .jsonl suffix
+        :type filename: str
+
+        :return: None
+        """
+        self.filename = filename + self.suffix
+        self.file = None
+
+    def open(self, append = False, overwrite = False):
+        """
+        Open the log for writing
+
+        :param append: Keep any batches already in the log instead of
+        starting a new one
+        :type append: bool
+        :param overwrite: Start a new log even if one is left from an
+        interrupted run, discarding it
+        :type overwrite: bool
+
+        :return: None
+        :raises FileExistsError: if a log exists and neither append nor
+        overwrite is set
+        """
+        self.file = open(self.filename, "a" if append else "w" if overwrite else "x")
+
+    @staticmethod
+    def cell(benchmark_name, benchmark_set, collector_name, iteration):
+        """
+        Build the key identifying one Collector run against one Benchmark
+
+        :param benchmark_name: Name of the Benchmark
+        :type benchmark_name: str
+        :param benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+        :type benchmark_set: str
+        :param collector_name: The collection mode, as named in the configuration
+        :type collector_name: str
+        :param iteration: The statistical or experimental iteration
+        :type iteration: int
+
+        :return: The cell key
+        :rtype: tuple
+        """
+        return (benchmark_name, benchmark_set, collector_name, iteration)
+
+    def _append(self, entry):
+        self.file.write(json.dumps(entry, default = _to_json) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write(self, records, cell = None):
+        """
+        Append one batch of UDF records and flush it to disk
+
+        :param records: UDF dictionaries, usually those from one TestRun
+        :type records: list
+        :param cell: Key of the cell these records belong to, see cell()
+        :type cell: tuple
+
+        :return: None
+        """
+        self._append({"cell": cell, "records": records})
+
+    def mark_done(self, cell):
+        """
+        Record that every TestRun of a cell has been written
+
+        :param cell: Key of the finished cell, see cell()
+        :type cell: tuple
+
+        :return: None
+        """
+        self._append({"done": cell})
+
+    def read(self):
+        """
+        Read back every complete batch in the log
+
+        A torn final line, left by a crash mid-write, is ignored.
+
+        :return: The batches in the order they were written
+        :rtype: list
+        """
+        batches = []
+        if not os.path.exists(self.filename):
+            return batches
+        with open(self.filename, "r") as logfile:
+            for line in logfile:
+                try:
+                    batches.append(json.loads(line))
+                except ValueError:
+                    break
+        return batches
+
+    def completed(self):
+        """
+        Index the cells which finished, according to the log
+
+        :return: Keys of every cell marked done
+        :rtype: set
+        """
+        return set(tuple(batch["done"]) for batch in self.read() if "done" in batch)
+
+    def resume(self, keep):
+        """
+        Rewrite the log so it only holds the given cells, then reopen it
+        for appending
+
+        Records from any other cell, such as one interrupted by a crash, are
+        dropped so that rerunning that cell does not duplicate them.
+
+        :param keep: Keys of the cells to keep
+        :type keep: set
+
+        :return: The kept batches of records, in the order they were written
+        :rtype: list
+        """
+        self.close()
+        batches = [batch for batch in self.read() \
+            if tuple(batch.get("done") or batch.get("cell") or ()) in keep]
+
+        # Write aside and swap in, so a crash here leaves the old log intact
+        with open(self.filename + ".tmp", "w") as logfile:
+            for batch in batches:
+                logfile.write(json.dumps(batch, default = _to_json) + "\n")
+            logfile.flush()
+            os.fsync(logfile.fileno())
+        os.replace(self.filename + ".tmp", self.filename)
+
+        self.open(append = True)
+        return [batch["records"] for batch in batches if "records" in batch]
+
+    def to_dataframe(self):
+        """
+        Build the UDF from every record in the log
+
+        :return: The UDF, one row per record
+        :rtype: pandas.DataFrame()
+        """
+        data_accumulator = ResultAccumulator()
+        for batch in self.read():
+            data_accumulator.extend(batch.get("records"))
+        return data_accumulator.to_dataframe()
+
+    def close(self):
+        """
+        Close the log, if open
+
+        :return: None
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        """
+        Close and delete the log
+
+        :return: None
+        """
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+__all__ = ['CheckpointLog']
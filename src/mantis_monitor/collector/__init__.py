@@ -16,9 +16,17 @@
 # with Mantis. If not, see <https://www.gnu.org/licenses/>.
 
 from . import collector
+from . import cgroup
+from . import procfs
+from . import pmu
+from . import profile
+from . import launch
 from . import nvidia_collector
 from . import pfs_collector
 from . import perf_collector
 from . import ttc_collector
 from . import amdsmi_collector
+from . import bpf_maps
 from . import bpf_collector
+from . import perf_event
+from . import perf_event_collector
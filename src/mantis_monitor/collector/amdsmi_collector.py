@@ -37,7 +37,7 @@ import datetime
 import pprint
 import pandas
 
-from mantis_monitor.collector.collector import Collector
+from mantis_monitor.collector.collector import Collector, SampleBuffer, launch_benchmark, published, samples_to_udf
 
 #logging.basicConfig(filename='testing.log', encoding='utf-8', \
 #    format='%(levelname)s:%(message)s', level=logging.DEBUG)
@@ -62,7 +62,12 @@ class AmdSMICollector(Collector):
     :ivar global_id: An int used to uniquely identify each TestRun()
     :ivar timescale: The time between collections in MS, comes from Configuration()
     :ivar filename: A unique filename to use for intermediate data storage
+
+    :cvar multiplexable: True; amd-smi samples the GPUs alongside a shared launch
     """
+
+    multiplexable = True
+
     def __init__(self, configuration, iteration, benchmark, benchmark_set):
         """
         Init the object
@@ -120,9 +125,11 @@ class AmdSMICollector(Collector):
         with this Collector instance
         """
         for this_testrun in self.testruns:
-            this_testrun.benchmark.before_each()
-            data = await this_testrun.run()
-            this_testrun.benchmark.after_each()
+            if not self.launch:
+                this_testrun.benchmark.before_each()
+            data = await this_testrun.run(self.launch)
+            if not self.launch:
+                this_testrun.benchmark.after_each()
             if isinstance(data, list):
                 self.data.extend(data)
             else:
@@ -177,7 +184,8 @@ class AmdSMIOverTimeTestRun():
         self.measurements = measurements
         self.units = units
         self.duration = 0
-        watchTime = int(self.timescale / 1000)
+        # amd-smi only takes whole seconds between samples
+        watchTime = max(1, round(self.timescale / 1000))
 
         self.smi_runstring = f"amd-smi monitor -w{watchTime} --csv --gfx --mem --encoder --decoder --temperature --power-usage --pcie -v --file /tmp/amdsmi-out.csv"
         self.smi_runcommand = self.smi_runstring
@@ -193,9 +201,14 @@ class AmdSMIOverTimeTestRun():
                         }
 
     # TODO (zcornelius): Fix SMI to use as a process wrapper here, instead of system-wide
-    async def run(self):
+    @published
+    async def run(self, launch = None):
         """
         Call this to run this instance of NVIDIA SMI
+
+        :param launch: Shared launch to observe instead of launching the
+        benchmark, if any
+        :type launch: LaunchHandle()
         """
 
         # Run it
@@ -207,7 +220,13 @@ class AmdSMIOverTimeTestRun():
         # Run benchmark
         print('Running command ' + self.bench_runcommand)
         starttime = datetime.datetime.now()
-        process = await asyncio.create_subprocess_shell(self.bench_runcommand, cwd=self.benchmark.cwd, env=self.benchmark.env)
+        if launch:
+            launch.attached()
+            await launch.wait_released()
+            starttime = datetime.datetime.fromtimestamp(launch.start_time)
+            process = launch.process
+        else:
+            process = await launch_benchmark(self.benchmark, self.bench_runcommand)
         await process.wait()
         # Old subprocess mechanism
         # process = subprocess.run(self.bench_runcommand, shell=True, executable="/bin/bash", cwd=self.benchmark.cwd, env=self.benchmark.env)
@@ -228,7 +247,7 @@ class AmdSMIOverTimeTestRun():
                 for measurement, value in row.items():
                     if measurement in self.measurements and value != "N/A":
                         key = "gpu_{index}_{measurement}".format(index = gpu_index, measurement = measurement)
-                        self.data.setdefault(key, []).append([time, float(value.strip())])
+                        self.data.setdefault(key, SampleBuffer()).append(time, float(value.strip()))
 
         # Clean up files
         os.remove(smi_filename)
@@ -236,7 +255,7 @@ class AmdSMIOverTimeTestRun():
         self.duration = (endtime - starttime).total_seconds()
         self.data["duration"] = self.duration
 
-        return self.data
+        return samples_to_udf(self.data)
 
 
 Collector.register_collector("amdsmi", AmdSMICollector)
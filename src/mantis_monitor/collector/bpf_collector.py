@@ -19,15 +19,37 @@ This file contains the implementation of the BPF Collector.
 
 The BPF Collector launches the target benchmark, discovers its PID (and all
 descendant PIDs), attaches eBPF tracepoints to the running process tree, and
-samples the collected metrics once per second for the duration of the run.
+samples the collected metrics once per timescale (time_count ms in the
+config.yaml) for the duration of the run.
 
 Currently supported metrics (select via the ``metrics`` key in the config):
 
-    - ``io_latency`` — per-second average read latency, write latency, and
-      combined read+write latency, all in nanoseconds.  Values are measured
-      at the Linux syscall boundary (``read``/``write`` syscalls), so they
-      capture time spent waiting in the kernel including filesystem, network,
-      and block-device stacks.
+    - ``io_latency`` — per-interval average read latency, write latency, and
+      combined read+write latency, all in nanoseconds, with their p50, p95
+      and p99 and the log2 latency histograms they are estimated from.
+      Bytes transferred and bandwidth are recorded too, and everything is
+      also split by the kind of file descriptor: regular file, socket, pipe,
+      other, and io_uring.  Values are measured at the Linux syscall
+      boundary (the ``read``/``write``, ``pread64``/``pwrite64``,
+      ``readv``/``writev``, ``preadv``/``pwritev`` and
+      ``preadv2``/``pwritev2`` syscalls), so they capture time spent waiting
+      in the kernel including filesystem, network, and block-device stacks;
+      io_uring reads, writes, sends and receives are timed from submission
+      to completion.  Everything is aggregated in kernel and read once per
+      interval, so no per-event data leaves the kernel.
+
+    - ``runq_latency`` — per-interval time the benchmark's threads spent
+      runnable but waiting for a CPU (from being woken or preempted until
+      running), as a mean, total, p50/p95/p99 and log2 histogram.  This is
+      how co-running benchmarks, or anything else on the node, slow a
+      benchmark down without it showing in its own perf counters.
+
+    - ``offcpu_time`` — the same for the time its threads spent blocked
+      (from switching out while not runnable until woken): IO, locks,
+      sleeps, MPI waits.
+
+      Both come from the ``sched_wakeup``, ``sched_wakeup_new`` and
+      ``sched_switch`` raw tracepoints, and one program, run once for both.
 
 Example ``config.yaml`` entry::
 
@@ -35,13 +57,17 @@ Example ``config.yaml`` entry::
       bpf:
         metrics:
           - io_latency
+          - runq_latency
+          - offcpu_time
 
 Runtime requirements:
     - Python ``bcc`` package (BPF Compiler Collection).  On Debian/Ubuntu:
       ``sudo apt install python3-bcc``.  On RHEL/Fedora: ``sudo dnf install
       python3-bcc``.  See also https://github.com/iovisor/bcc.
-    - Linux kernel ≥ 4.7 (``sys_enter/exit_read`` and
-      ``sys_enter/exit_write`` tracepoints).
+    - Linux kernel ≥ 5.5 (syscall tracepoints, ``bpf_probe_read_kernel``
+      to find each fd's type).  io_uring is traced where the kernel has the
+      ``io_uring`` tracepoints.  On ≥ 5.6 the counters are read and reset
+      with batch map operations.
     - ``CAP_BPF`` + ``CAP_PERFMON`` capabilities, or run as root.
     - ``python3-psutil`` (already a mantis-monitor dependency).
 
@@ -52,13 +78,18 @@ Runtime requirements:
 
 .. note::
 
-   Only ``read(2)`` and ``write(2)`` syscalls are instrumented in this first
-   version.  Future work can extend coverage to ``pread64``, ``pwrite64``,
-   ``readv``, ``writev``, ``preadv``, ``pwritev``, and io_uring operations.
+   All of it is one BPF program, compiled and loaded once per
+   mantis-monitor process and reused by later TestRuns (see
+   ``ProgramCache``).  io_uring
+   requests are counted under their own fd type, since the tracepoints do
+   not say which file a request is on.  ``sendto``/``recvfrom`` and
+   ``sendmsg``/``recvmsg`` are not traced.
 """
 
 import asyncio
 import ctypes
+import functools
+import re
 import time
 import os
 
@@ -71,7 +102,9 @@ except ImportError:          # pragma: no cover
     _BCC_BPF = None
     _HAS_BCC = False
 
-from mantis_monitor.collector.collector import Collector
+from mantis_monitor.collector.bpf_maps import DoubleBufferedCounters
+from mantis_monitor.collector.collector import Collector, OverheadRecorder, PeriodicSampler, SampleBuffer, launch_benchmark, published, samples_to_udf, watch_exit
+from mantis_monitor.collector.procfs import ProcessTreeTracker
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -80,10 +113,13 @@ from mantis_monitor.collector.collector import Collector
 
 _BPF_IO_LATENCY_PROG = r"""
 #include <linux/ptrace.h>
+#include <linux/sched.h>
+#include <linux/fs.h>
+#include <linux/fdtable.h>
 
 /*
  * Dynamic set of TGIDs (Linux "process IDs" as seen from userspace) whose
- * IO syscalls we want to measure.  Updated from Python every second to
+ * IO syscalls we want to measure.  Updated from Python every interval to
  * include newly-spawned children of the benchmark process.
  *
  * Key:   TGID (u32)
@@ -91,26 +127,58 @@ _BPF_IO_LATENCY_PROG = r"""
  */
 BPF_HASH(traced_pids, u32, u8, 1024);
 
+/* Operations, and the kinds of file descriptor they are split by. */
+#define IO_READ      0
+#define IO_WRITE     1
+#define FD_FILE      0
+#define FD_SOCKET    1
+#define FD_PIPE      2
+#define FD_OTHER     3     /* character devices, ttys, eventfds, ...     */
+#define FD_IO_URING  4     /* io_uring requests, whatever their fd       */
+#define FD_TYPES     5
+
 /*
- * Per-thread in-flight start timestamps.  Keyed by TID (the kernel-level
- * thread ID, lower 32 bits of bpf_get_current_pid_tgid()) so that
- * concurrent threads in the same process each track their own syscall.
+ * An in-flight operation: when it started, and what it is.
  */
-BPF_HASH(read_start,  u32, u64);
-BPF_HASH(write_start, u32, u64);
+struct io_entry {
+    u64 ts;
+    u32 op;
+    u32 fd_type;
+};
 
 /*
- * Accumulated statistics for the current 1-second measurement interval.
- * Python resets these to zero after each snapshot.
+ * Per-thread in-flight syscalls.  Keyed by TID (the kernel-level thread ID,
+ * lower 32 bits of bpf_get_current_pid_tgid()) so that concurrent threads
+ * in the same process each track their own syscall.
+ */
+BPF_HASH(io_start, u32, struct io_entry);
+
+/*
+ * Accumulated statistics for a measurement interval, per CPU, so each CPU
+ * adds to its own copy without atomics.  There are two copies, one per
+ * interval slot: the kernel adds to the slot io_slot selects while Python
+ * drains the other (see DoubleBufferedCounters).
+ *
+ * Index                          Meaning
+ * -----                          -------
+ *   (op * FD_TYPES + type) * 3   completed operations
+ *                          + 1   sum of their latencies (nanoseconds)
+ *                          + 2   bytes they transferred
+ *   READ_HIST + i                reads with a latency in [2^(i-1), 2^i) ns
+ *   WRITE_HIST + i               writes with a latency in [2^(i-1), 2^i) ns
  *
- * Index  Meaning
- * -----  -------
- *   0    read_count      — number of completed read() syscalls
- *   1    read_total_ns   — sum of their latencies (nanoseconds)
- *   2    write_count     — number of completed write() syscalls
- *   3    write_total_ns  — sum of their latencies (nanoseconds)
+ * The log2 histograms are only read once per interval, so percentiles come
+ * from map reads, not from per-event output.
  */
-BPF_ARRAY(io_stats, u64, 4);
+#define STAT_FIELDS  3
+#define HIST_SLOTS   64
+#define READ_HIST    (2 * FD_TYPES * STAT_FIELDS)
+#define WRITE_HIST   (READ_HIST + HIST_SLOTS)
+#define IO_COUNTERS  (WRITE_HIST + HIST_SLOTS)
+
+BPF_PERCPU_ARRAY(io_counts_0, u64, IO_COUNTERS);
+BPF_PERCPU_ARRAY(io_counts_1, u64, IO_COUNTERS);
+BPF_ARRAY(io_slot, u32, 1);
 
 /* Return non-zero if the current thread's TGID is in our watch set. */
 static __always_inline int pid_traced(void)
@@ -119,64 +187,461 @@ static __always_inline int pid_traced(void)
     return traced_pids.lookup(&tgid) != NULL;
 }
 
-/* ── read() entry ──────────────────────────────────────────────────────── */
+/* This CPU's copy of one counter in the given interval slot. */
+static __always_inline u64 *io_counter(u32 slot, u32 index)
+{
+    if (slot) return io_counts_1.lookup(&index);
+    return io_counts_0.lookup(&index);
+}
+
+/* Count one completed operation: count, latency, bytes and histogram slot. */
+static __always_inline void record_io(u32 op, u32 fd_type, u64 delta, u64 bytes)
+{
+    u32 zero = 0;
+    u32 *slotp = io_slot.lookup(&zero);
+    u32 slot = slotp ? *slotp : 0;
+    u32 stats = (op * FD_TYPES + fd_type) * STAT_FIELDS;
+    u32 bucket = bpf_log2l(delta);
+    if (bucket >= HIST_SLOTS) bucket = HIST_SLOTS - 1;
+    u32 hist = (op == IO_READ ? READ_HIST : WRITE_HIST) + bucket;
+
+    u64 *cnt = io_counter(slot, stats);      if (cnt) *cnt += 1;
+    u64 *tot = io_counter(slot, stats + 1);  if (tot) *tot += delta;
+    u64 *byt = io_counter(slot, stats + 2);  if (byt) *byt += bytes;
+    u64 *bkt = io_counter(slot, hist);       if (bkt) *bkt += 1;
+}
+
+/* What kind of file a descriptor of the current process refers to. */
+static __always_inline u32 fd_type(u64 fd)
+{
+    struct task_struct *task = (struct task_struct *)bpf_get_current_task();
+    struct files_struct *files = NULL;
+    struct fdtable *fdt = NULL;
+    struct file **fds = NULL;
+    struct file *file = NULL;
+    struct inode *inode = NULL;
+    unsigned int max_fds = 0;
+    umode_t mode = 0;
+
+    bpf_probe_read_kernel(&files, sizeof(files), &task->files);
+    if (!files) return FD_OTHER;
+    bpf_probe_read_kernel(&fdt, sizeof(fdt), &files->fdt);
+    if (!fdt) return FD_OTHER;
+    bpf_probe_read_kernel(&max_fds, sizeof(max_fds), &fdt->max_fds);
+    if (fd >= max_fds) return FD_OTHER;
+    bpf_probe_read_kernel(&fds, sizeof(fds), &fdt->fd);
+    bpf_probe_read_kernel(&file, sizeof(file), &fds[fd]);
+    if (!file) return FD_OTHER;
+    bpf_probe_read_kernel(&inode, sizeof(inode), &file->f_inode);
+    if (!inode) return FD_OTHER;
+    bpf_probe_read_kernel(&mode, sizeof(mode), &inode->i_mode);
+
+    if (S_ISREG(mode))  return FD_FILE;
+    if (S_ISSOCK(mode)) return FD_SOCKET;
+    if (S_ISFIFO(mode)) return FD_PIPE;
+    return FD_OTHER;
+}
 
-TRACEPOINT_PROBE(syscalls, sys_enter_read)
+/* Syscall entry: note the start time and what the syscall is on. */
+static __always_inline int io_enter(u32 op, u64 fd)
 {
     if (!pid_traced()) return 0;
     u32 tid = (u32)bpf_get_current_pid_tgid();
-    u64 ts  = bpf_ktime_get_ns();
-    read_start.update(&tid, &ts);
+    struct io_entry entry = {};
+    entry.ts = bpf_ktime_get_ns();
+    entry.op = op;
+    entry.fd_type = fd_type(fd);
+    io_start.update(&tid, &entry);
     return 0;
 }
 
-/* ── read() exit ───────────────────────────────────────────────────────── */
+/* Syscall exit: count the syscall if its entry was seen. */
+static __always_inline int io_exit(long ret)
+{
+    u32 tid = (u32)bpf_get_current_pid_tgid();
+    struct io_entry *entry = io_start.lookup(&tid);
+    if (!entry) return 0;                  /* no matching entry() — skip   */
+    u64 delta = bpf_ktime_get_ns() - entry->ts;
+    u32 op = entry->op, type = entry->fd_type;
+    io_start.delete(&tid);
+
+    record_io(op, type, delta, ret > 0 ? ret : 0);
+    return 0;
+}
 
-TRACEPOINT_PROBE(syscalls, sys_exit_read)
+/* ── read() family ─────────────────────────────────────────────────────── */
+
+TRACEPOINT_PROBE(syscalls, sys_enter_read)     { return io_enter(IO_READ, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_read)      { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_pread64)  { return io_enter(IO_READ, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_pread64)   { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_readv)    { return io_enter(IO_READ, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_readv)     { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_preadv)   { return io_enter(IO_READ, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_preadv)    { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_preadv2)  { return io_enter(IO_READ, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_preadv2)   { return io_exit(args->ret); }
+
+/* ── write() family ────────────────────────────────────────────────────── */
+
+TRACEPOINT_PROBE(syscalls, sys_enter_write)    { return io_enter(IO_WRITE, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_write)     { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_pwrite64) { return io_enter(IO_WRITE, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_pwrite64)  { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_writev)   { return io_enter(IO_WRITE, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_writev)    { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_pwritev)  { return io_enter(IO_WRITE, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_pwritev)   { return io_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_pwritev2) { return io_enter(IO_WRITE, args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_pwritev2)  { return io_exit(args->ret); }
+
+/* ── io_uring ──────────────────────────────────────────────────────────── */
+
+#ifdef HAVE_IO_URING
+/*
+ * io_uring requests are timed from submission to completion.  Completions
+ * may run in interrupt context, on behalf of no traced process, so they
+ * are matched to submissions by ring and user_data rather than by PID.
+ * Only the fields every kernel since 5.5 has (ctx, user_data, opcode, res)
+ * are used; the submission tracepoint is io_uring_submit_req since 6.0
+ * and io_uring_submit_sqe before.
+ */
+struct uring_key {
+    u64 ctx;
+    u64 user_data;
+};
+
+BPF_HASH(uring_start, struct uring_key, struct io_entry, 10240);
+
+static __always_inline int uring_submit(void *ring, u64 user_data, u32 opcode)
 {
     if (!pid_traced()) return 0;
-    u32 tid  = (u32)bpf_get_current_pid_tgid();
-    u64 *tsp = read_start.lookup(&tid);
-    if (!tsp) return 0;                    /* no matching entry() — skip   */
-    u64 delta = bpf_ktime_get_ns() - *tsp;
-    read_start.delete(&tid);
-
-    u32 k0 = 0, k1 = 1;
-    u64 *cnt = io_stats.lookup(&k0);  if (cnt) lock_xadd(cnt, 1);
-    u64 *tot = io_stats.lookup(&k1);  if (tot) lock_xadd(tot, delta);
+    struct io_entry entry = {};
+    switch (opcode) {
+    case 1:  /* IORING_OP_READV       */
+    case 4:  /* IORING_OP_READ_FIXED  */
+    case 10: /* IORING_OP_RECVMSG     */
+    case 22: /* IORING_OP_READ        */
+    case 27: /* IORING_OP_RECV        */
+        entry.op = IO_READ;
+        break;
+    case 2:  /* IORING_OP_WRITEV      */
+    case 5:  /* IORING_OP_WRITE_FIXED */
+    case 9:  /* IORING_OP_SENDMSG     */
+    case 23: /* IORING_OP_WRITE       */
+    case 26: /* IORING_OP_SEND        */
+        entry.op = IO_WRITE;
+        break;
+    default:
+        return 0;
+    }
+    struct uring_key key = {};
+    key.ctx = (u64)ring;
+    key.user_data = user_data;
+    entry.ts = bpf_ktime_get_ns();
+    entry.fd_type = FD_IO_URING;
+    uring_start.update(&key, &entry);
     return 0;
 }
 
-/* ── write() entry ─────────────────────────────────────────────────────── */
+#ifdef HAVE_IO_URING_SUBMIT_REQ
+TRACEPOINT_PROBE(io_uring, io_uring_submit_req)
+#else
+TRACEPOINT_PROBE(io_uring, io_uring_submit_sqe)
+#endif
+{
+    return uring_submit(args->ctx, args->user_data, args->opcode);
+}
 
-TRACEPOINT_PROBE(syscalls, sys_enter_write)
+TRACEPOINT_PROBE(io_uring, io_uring_complete)
 {
-    if (!pid_traced()) return 0;
-    u32 tid = (u32)bpf_get_current_pid_tgid();
-    u64 ts  = bpf_ktime_get_ns();
-    write_start.update(&tid, &ts);
+    struct uring_key key = {};
+    key.ctx = (u64)args->ctx;
+    key.user_data = args->user_data;
+    struct io_entry *entry = uring_start.lookup(&key);
+    if (!entry) return 0;
+    u64 delta = bpf_ktime_get_ns() - entry->ts;
+    u32 op = entry->op;
+    long res = args->res;
+    uring_start.delete(&key);
+
+    record_io(op, FD_IO_URING, delta, res > 0 ? res : 0);
+    return 0;
+}
+#endif
+"""
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# BPF C program — run-queue latency and off-CPU time via sched tracepoints
+# ──────────────────────────────────────────────────────────────────────────────
+
+_BPF_SCHED_PROG = r"""
+#include <linux/sched.h>
+
+/* TGIDs of the benchmark process tree, as in the IO latency program. */
+BPF_HASH(traced_pids, u32, u8, 1024);
+
+/*
+ * Per-thread start of the current wait, keyed by TID: since the thread was
+ * made runnable (woken, or preempted while running), and since it blocked.
+ * LRU, since a thread which exits while blocked is never woken.
+ */
+BPF_TABLE("lru_hash", u32, u64, runq_start,   10240);
+BPF_TABLE("lru_hash", u32, u64, offcpu_start, 10240);
+
+/*
+ * Accumulated statistics for a measurement interval, per CPU and per
+ * interval slot, as io_counts in the IO latency program.
+ *
+ * Index             Meaning
+ * -----             -------
+ *   0               runq_count       — waits for a CPU that ended
+ *   1               runq_total_ns    — their total length (nanoseconds)
+ *   2               offcpu_count     — blocked periods that ended
+ *   3               offcpu_total_ns  — their total length (nanoseconds)
+ *   RUNQ_HIST + i   waits for a CPU of [2^(i-1), 2^i) ns
+ *   OFFCPU_HIST + i blocked periods of [2^(i-1), 2^i) ns
+ */
+#define RUNQ            0
+#define OFFCPU          2
+#define HIST_SLOTS      64
+#define RUNQ_HIST       4
+#define OFFCPU_HIST     (RUNQ_HIST + HIST_SLOTS)
+#define SCHED_COUNTERS  (OFFCPU_HIST + HIST_SLOTS)
+
+BPF_PERCPU_ARRAY(sched_counts_0, u64, SCHED_COUNTERS);
+BPF_PERCPU_ARRAY(sched_counts_1, u64, SCHED_COUNTERS);
+BPF_ARRAY(sched_slot, u32, 1);
+
+/* Return non-zero if a task belongs to our watch set. */
+static __always_inline int task_traced(struct task_struct *task)
+{
+    u32 tgid = 0;
+    bpf_probe_read_kernel(&tgid, sizeof(tgid), &task->tgid);
+    return traced_pids.lookup(&tgid) != NULL;
+}
+
+static __always_inline u32 task_tid(struct task_struct *task)
+{
+    u32 tid = 0;
+    bpf_probe_read_kernel(&tid, sizeof(tid), &task->pid);
+    return tid;
+}
+
+/* This CPU's copy of one counter in the given interval slot. */
+static __always_inline u64 *sched_counter(u32 slot, u32 index)
+{
+    if (slot) return sched_counts_1.lookup(&index);
+    return sched_counts_0.lookup(&index);
+}
+
+/* Count one wait of the given kind: its count, total and histogram slot. */
+static __always_inline void record_wait(u32 stats, u32 hist, u64 delta)
+{
+    u32 zero = 0;
+    u32 *slotp = sched_slot.lookup(&zero);
+    u32 slot = slotp ? *slotp : 0;
+    u32 bucket = bpf_log2l(delta);
+    if (bucket >= HIST_SLOTS) bucket = HIST_SLOTS - 1;
+
+    u64 *cnt = sched_counter(slot, stats);         if (cnt) *cnt += 1;
+    u64 *tot = sched_counter(slot, stats + 1);     if (tot) *tot += delta;
+    u64 *bkt = sched_counter(slot, hist + bucket); if (bkt) *bkt += 1;
+}
+
+/* A task is made runnable: a blocked period ends and a wait for a CPU begins. */
+static __always_inline int task_woken(struct task_struct *task)
+{
+    if (!task_traced(task)) return 0;
+    u32 tid = task_tid(task);
+    u64 now = bpf_ktime_get_ns();
+    u64 *blocked = offcpu_start.lookup(&tid);
+    if (blocked) {
+        record_wait(OFFCPU, OFFCPU_HIST, now - *blocked);
+        offcpu_start.delete(&tid);
+    }
+    runq_start.update(&tid, &now);
     return 0;
 }
 
-/* ── write() exit ──────────────────────────────────────────────────────── */
+/* sched_wakeup and sched_wakeup_new: args are (struct task_struct *p) */
+RAW_TRACEPOINT_PROBE(sched_wakeup)
+{
+    return task_woken((struct task_struct *)ctx->args[0]);
+}
 
-TRACEPOINT_PROBE(syscalls, sys_exit_write)
+RAW_TRACEPOINT_PROBE(sched_wakeup_new)
 {
-    if (!pid_traced()) return 0;
-    u32 tid  = (u32)bpf_get_current_pid_tgid();
-    u64 *tsp = write_start.lookup(&tid);
-    if (!tsp) return 0;
-    u64 delta = bpf_ktime_get_ns() - *tsp;
-    write_start.delete(&tid);
-
-    u32 k2 = 2, k3 = 3;
-    u64 *cnt = io_stats.lookup(&k2);  if (cnt) lock_xadd(cnt, 1);
-    u64 *tot = io_stats.lookup(&k3);  if (tot) lock_xadd(tot, delta);
+    return task_woken((struct task_struct *)ctx->args[0]);
+}
+
+/* sched_switch: args are (bool preempt, struct task_struct *prev, *next, ...) */
+RAW_TRACEPOINT_PROBE(sched_switch)
+{
+    struct task_struct *prev = (struct task_struct *)ctx->args[1];
+    struct task_struct *next = (struct task_struct *)ctx->args[2];
+    u64 now = bpf_ktime_get_ns();
+
+    if (task_traced(prev)) {
+        u32 tid = task_tid(prev);
+        long state = 0;
+        bpf_probe_read_kernel(&state, sizeof(prev->TASK_STATE), &prev->TASK_STATE);
+        /* Still runnable (preempted): it waits for a CPU again; else it blocks */
+        if (state == TASK_RUNNING)
+            runq_start.update(&tid, &now);
+        else
+            offcpu_start.update(&tid, &now);
+    }
+
+    if (task_traced(next)) {
+        u32 tid = task_tid(next);
+        u64 *queued = runq_start.lookup(&tid);
+        if (queued) {
+            record_wait(RUNQ, RUNQ_HIST, now - *queued);
+            runq_start.delete(&tid);
+        }
+    }
     return 0;
 }
 """
 
 
+# ──────────────────────────────────────────────────────────────────────────────
+# log2 latency histograms
+# ──────────────────────────────────────────────────────────────────────────────
+
+#: Slots in each histogram; slot i counts latencies in [2**(i-1), 2**i) ns
+HISTOGRAM_SLOTS = 64
+
+#: Kinds of file descriptor IO is split by, in the BPF program's order
+FD_TYPES = ("file", "socket", "pipe", "other", "io_uring")
+
+#: Counters kept per operation and kind of fd, in the BPF program's order
+STAT_FIELDS = ("count", "total_ns", "bytes")
+
+#: Layout of the io_counts arrays, as in the BPF program
+READ_HIST   = 2 * len(FD_TYPES) * len(STAT_FIELDS)
+WRITE_HIST  = READ_HIST + HISTOGRAM_SLOTS
+IO_COUNTERS = WRITE_HIST + HISTOGRAM_SLOTS
+
+#: Percentiles derived from the histograms
+PERCENTILES = (50, 95, 99)
+
+
+def log2_slot_bounds(slot):
+    """
+    The latencies counted in one slot of a log2 histogram (as filled by
+    ``increment(bpf_log2l(value))``).
+
+    :param slot: Slot index
+    :type slot: int
+    :returns: ``(low, high)``, the slot holds values ``low <= v < high``
+    :rtype: tuple
+    """
+    if slot == 0:
+        return 0, 1
+    return 2 ** (slot - 1), 2 ** slot
+
+
+def log2_percentile(counts, percentile):
+    """
+    Estimate a percentile from log2 histogram counts.
+
+    The slot holding the percentile's rank is found from the cumulative
+    counts, and the value is interpolated linearly within that slot, so the
+    estimate is never off by more than the slot's width (a factor of two).
+
+    :param counts: Count per slot, slot 0 first
+    :type counts: list
+    :param percentile: Percentile, 0-100
+    :type percentile: float
+    :returns: Estimated value, or ``None`` for an empty histogram
+    :rtype: float
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for slot, count in enumerate(counts):
+        if count and seen + count >= rank:
+            low, high = log2_slot_bounds(slot)
+            return low + (high - low) * (rank - seen) / count
+        seen += count
+    return float(log2_slot_bounds(len(counts) - 1)[1])
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Loaded programs
+# ──────────────────────────────────────────────────────────────────────────────
+
+class ProgramCache:
+    """
+    BPF programs compiled and loaded once per mantis-monitor process, and
+    reused by every TestRun after, across iterations and benchmarks.
+
+    Compiling a program with LLVM takes about 0.5 s, and loading it and
+    attaching its probes disturbs the node while the benchmark starts, so
+    a TestRun takes a loaded program with :meth:`acquire`, resets the maps
+    it uses, and hands it back with :meth:`release`.  Each program is only
+    used by one TestRun at a time; a TestRun running alongside another (ex
+    for co-running benchmarks) loads a second copy, which is kept as well.
+
+    Programs stay attached until mantis-monitor exits, with an empty PID
+    set, so their probes cost a map lookup per traced event meanwhile.
+    bcc only loads programs it has compiled itself, so nothing is cached
+    across mantis-monitor processes.
+
+    :ivar idle: ``(text, cflags)`` → loaded programs not in use
+    :type idle: dict
+    :ivar loaded: Number of programs compiled and loaded so far
+    :type loaded: int
+    """
+
+    def __init__(self):
+        """
+        Init an empty cache.
+
+        :return: None
+        """
+        self.idle = {}
+        self.loaded = 0
+        self._keys = {}
+
+    def acquire(self, text, cflags=()):
+        """
+        Take a loaded copy of a program, loading one if none is idle.
+
+        :param text: The program's C source
+        :type text: str
+        :param cflags: Compiler flags, ex ``-D`` defines
+        :type cflags: list
+        :return: The BCC ``BPF`` object, whose maps may hold a previous
+            TestRun's data
+        """
+        key = (text, tuple(cflags))
+        idle = self.idle.get(key)
+        if idle:
+            return idle.pop()
+        bpf = _BCC_BPF(text=text, cflags=list(cflags))
+        self.loaded += 1
+        self._keys[id(bpf)] = key
+        return bpf
+
+    def release(self, bpf):
+        """
+        Hand back a program taken with :meth:`acquire`.
+
+        :param bpf: The BCC ``BPF`` object
+        :return: None
+        """
+        self.idle.setdefault(self._keys[id(bpf)], []).append(bpf)
+
+
+_programs = ProgramCache()
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Collector
 # ──────────────────────────────────────────────────────────────────────────────
@@ -191,9 +656,13 @@ class BPFCollector(Collector):
         collection_modes:
           bpf:
             metrics:
-              - io_latency   # read/write syscall latency averaged each second
+              - io_latency   # read/write syscall latency, mean and percentiles each interval
+              - runq_latency # time runnable but waiting for a CPU
+              - offcpu_time  # time blocked
 
     If ``metrics`` is omitted it defaults to ``["io_latency"]``.
+    ``runq_latency`` and ``offcpu_time`` are recorded by one TestRun, so
+    they share a run of the benchmark.
 
     :ivar name: BPFCollector
     :ivar description: Describes this collector
@@ -201,12 +670,18 @@ class BPFCollector(Collector):
     :ivar benchmark_set: Colon-separated list of co-running benchmarks
     :ivar iteration: The statistical or experimental iteration
     :ivar metrics: List of BPF metric names to collect
-    :ivar timescale: Sampling interval in ms (from Configuration; informational
-        only — the BPF metrics are always sampled at 1-second intervals)
-    :ivar testruns: List of TestRun objects, one per requested metric
+    :ivar timescale: Sampling interval in ms (from Configuration)
+    :ivar overhead: Whether to record the cost of each sample (from Configuration)
+    :ivar testruns: List of TestRun objects, one for io_latency and one for
+        the scheduler metrics
     :ivar data: Collected data in the UDF format
+
+    :cvar multiplexable: True; with a single TestRun, the BPF program is
+        loaded against a shared launch's PID before the benchmark starts
     """
 
+    multiplexable = True
+
     def __init__(self, configuration, iteration, benchmark, benchmark_set):
         """
         Init the object and call setup().
@@ -227,6 +702,7 @@ class BPFCollector(Collector):
         self.benchmark_set = benchmark_set
         self.iteration     = iteration
         self.timescale     = configuration.timescale
+        self.overhead      = configuration.overhead
         self.testruns      = []
         self.data          = []
 
@@ -240,12 +716,14 @@ class BPFCollector(Collector):
 
     def setup(self):
         """
-        Create one TestRun instance per requested metric.
+        Create one TestRun instance for io_latency, and one for the
+        scheduler metrics (runq_latency, offcpu_time) together.
 
         Unknown metric names are skipped with a warning printed to stdout.
 
         :return: None
         """
+        sched_metrics = [metric for metric in self.metrics if metric in BPFSchedTestRun.METRICS]
         for metric in self.metrics:
             if metric == "io_latency":
                 self.testruns.append(
@@ -254,12 +732,28 @@ class BPFCollector(Collector):
                         benchmark     = self.benchmark,
                         iteration     = self.iteration,
                         benchmark_set = self.benchmark_set,
+                        timescale     = self.timescale,
+                        overhead      = self.overhead,
+                    )
+                )
+            elif metric in BPFSchedTestRun.METRICS:
+                if metric != sched_metrics[0]:
+                    continue
+                self.testruns.append(
+                    BPFSchedTestRun(
+                        name          = "{}_sched".format(self.name),
+                        benchmark     = self.benchmark,
+                        iteration     = self.iteration,
+                        benchmark_set = self.benchmark_set,
+                        metrics       = sched_metrics,
+                        timescale     = self.timescale,
+                        overhead      = self.overhead,
                     )
                 )
             else:
                 print(
                     "[BPFCollector] Unknown metric '{}' — skipping. "
-                    "Supported metrics: io_latency".format(metric)
+                    "Supported metrics: io_latency, runq_latency, offcpu_time".format(metric)
                 )
 
     async def run_all(self):
@@ -270,43 +764,308 @@ class BPFCollector(Collector):
             with this Collector instance
         """
         for testrun in self.testruns:
-            testrun.benchmark.before_each()
-            data = await testrun.run()
-            testrun.benchmark.after_each()
+            if not self.launch:
+                testrun.benchmark.before_each()
+            data = await testrun.run(self.launch)
+            if not self.launch:
+                testrun.benchmark.after_each()
             self.data.append(data)
+            if testrun.overhead:
+                self.data.append(testrun.overhead.to_record(data))
             yield
 
 
+# ──────────────────────────────────────────────────────────────────────────────
+# TestRun base
+# ──────────────────────────────────────────────────────────────────────────────
+
+class BPFTestRun:
+    """
+    What the BPF TestRuns have in common: each loads one program from the
+    ``ProgramCache``, follows the benchmark's process tree in its
+    ``traced_pids`` map, and drains its per-interval counters, kept in
+    double-buffered per-CPU arrays, once per ``timescale`` window.
+
+    Subclasses set the class attributes below and ``name``, ``benchmark``,
+    ``timescale``, ``overhead`` and ``data``, and implement :meth:`_sample`
+    and :meth:`_finish`.
+
+    :cvar PROGRAM: The BPF C program
+    :cvar COUNTERS: ``(slot 0 map, slot 1 map, selector map, counters per
+        slot)``, the program's interval counters
+    """
+
+    PROGRAM = None
+    COUNTERS = None
+
+    # ── private helpers ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def _on_process_event(traced_pids_map, event, pid, parent):
+        """
+        Keep the ``traced_pids`` BPF map in step with the benchmark's process
+        tree; subscribed to the run's ``ProcessTreeTracker``.
+
+        A forked descendant's TGID is added and an exited one's removed, so
+        the map (bounded at 1 024 entries) only ever holds live processes.
+
+        :param traced_pids_map: BCC table object for the ``traced_pids`` map
+        :param event: ``"fork"`` or ``"exit"``
+        :type event: str
+        :param pid: TGID of the descendant
+        :type pid: int
+        :param parent: TGID of its parent
+        :type parent: int
+        :return: None
+        """
+        if event == "fork":
+            BPFTestRun._trace_pid(traced_pids_map, pid)
+        else:
+            try:
+                del traced_pids_map[ctypes.c_uint32(pid)]
+            except Exception:
+                pass   # never added, or already gone
+
+    @staticmethod
+    def _trace_pid(traced_pids_map, pid):
+        """
+        Add one TGID to the ``traced_pids`` BPF map.
+
+        :param traced_pids_map: BCC table object for the ``traced_pids`` map
+        :param pid: TGID to trace
+        :type pid: int
+        :return: None
+        """
+        key = ctypes.c_uint32(pid)
+        try:
+            traced_pids_map[key] = traced_pids_map.Leaf(1)
+        except Exception:
+            try:
+                # Fallback for BCC versions with different Leaf semantics
+                traced_pids_map[key] = ctypes.c_uint8(1)
+            except Exception:
+                pass   # best-effort; missing a PID means we lose that data
+
+    def _cflags(self):
+        """
+        The compiler flags to build :attr:`PROGRAM` with on this kernel.
+
+        :returns: Flags, none by default
+        :rtype: list
+        """
+        return []
+
+    def _scratch_maps(self, cflags):
+        """
+        The maps, besides ``traced_pids`` and the counters, which a previous
+        run may have left entries in.
+
+        :param cflags: The flags the program was built with
+        :type cflags: list
+        :returns: Map names
+        :rtype: list
+        """
+        return []
+
+    def _sample(self, timestamp, elapsed, counts):
+        """
+        Record one window.
+
+        :param timestamp: Window end, in seconds since the start
+        :type timestamp: float
+        :param elapsed: Window length, in seconds
+        :type elapsed: float
+        :param counts: The window's total of each counter, over all CPUs
+        :type counts: list
+        :return: None
+        """
+        raise NotImplementedError
+
+    def _finish(self):
+        """
+        Record whatever covers the whole run, once the benchmark has exited.
+
+        :return: None
+        """
+
+    # ── main entry point ─────────────────────────────────────────────────────
+
+    @published
+    async def run(self, launch=None):
+        """
+        Load the BPF program, start the benchmark, collect per-window
+        samples until the benchmark exits, then return the accumulated data
+        dictionary.
+
+        Flow:
+
+        1. Take the eBPF program, with the flags :meth:`_cflags` gives,
+           from the ``ProgramCache``, and reset its maps.  Only the first
+           run in a mantis-monitor process (or one
+           overlapping another) compiles and loads it, which takes ~0.5 s
+           of LLVM compilation.
+        2. Launch the benchmark via ``launch_benchmark``.
+        3. Seed ``traced_pids`` with the shell's PID and start a
+           ``ProcessTreeTracker`` which adds and removes its descendants.
+        4. Monitoring loop — at every ``timescale`` deadline (see
+           ``PeriodicSampler``):
+           a. Swap the ``COUNTERS`` interval slots, and drain the one the
+              kernel stopped writing (see ``DoubleBufferedCounters``).
+           b. Hand the window's counts to :meth:`_sample`.
+        5. Wait for the subprocess to exit, record total duration, call
+           :meth:`_finish`, and return the program to the cache.
+
+        Given a shared ``LaunchHandle``, steps 2 and 3 use its process and
+        tracker instead, and the benchmark is only released once the program
+        is loaded and the PID set seeded.
+
+        :param launch: Shared launch to observe, if any
+        :type launch: LaunchHandle
+        :return: Populated ``self.data`` dictionary
+        :rtype: dict
+        :raises RuntimeError: if the ``bcc`` package is not installed
+        """
+        if not _HAS_BCC:
+            raise RuntimeError(
+                "{} requires the 'bcc' Python package.\n"
+                "  Debian/Ubuntu: sudo apt install python3-bcc\n"
+                "  RHEL/Fedora:   sudo dnf install python3-bcc\n"
+                "  Source:        https://github.com/iovisor/bcc".format(type(self).__name__)
+            )
+
+        # ── 1. Load the BPF program, or reuse one already loaded ────────────
+        cflags = self._cflags()
+        bpf = _programs.acquire(self.PROGRAM, cflags)
+        traced_pids_map = bpf["traced_pids"]
+        traced_pids_map.clear()
+        for name in self._scratch_maps(cflags):
+            bpf[name].clear()
+        slot_0, slot_1, selector, size = self.COUNTERS
+        counters = DoubleBufferedCounters((bpf[slot_0], bpf[slot_1]), bpf[selector], size)
+
+        try:
+            # ── 2. Launch the benchmark ──────────────────────────────────────
+            start_time = time.monotonic()
+            process = launch.process if launch else await launch_benchmark(self.benchmark)
+            exit_time = watch_exit(process)
+            ticks = PeriodicSampler(self.timescale / 1000)
+
+            # ── 3. Seed the PID set and follow the process tree ─────────────
+            self._trace_pid(traced_pids_map, process.pid)
+            tracker = launch.tracker if launch else ProcessTreeTracker(process.pid, min(0.1, self.timescale / 1000))
+            on_process_event = functools.partial(self._on_process_event, traced_pids_map)
+            tracker.subscribe(on_process_event)
+            if launch:
+                launch.attached()
+                await launch.wait_released()
+                start_time = launch.start_monotonic
+                ticks = PeriodicSampler(self.timescale / 1000, launch.start_monotonic)
+            else:
+                tracker.start()
+            try:
+                shell_proc = psutil.Process(process.pid)
+            except psutil.NoSuchProcess:
+                shell_proc = None
+
+            # ── 4. Monitoring loop (one sample per timescale) ────────────────
+            previous = 0.0
+            while shell_proc is not None and shell_proc.is_running():
+                timestamp = await ticks.tick()
+
+                if self.overhead:
+                    self.overhead.start_tick()
+
+                # Swap interval slots and drain the one the kernel just left
+                self._sample(timestamp, timestamp - previous, counters.drain())
+                previous = timestamp
+                if self.overhead:
+                    self.overhead.end_tick()
+
+            # ── 5. Wait for process exit and record duration ─────────────────
+            # The loop only sees the exit at its next tick; the runtime ends
+            # at the exit itself
+            end_time = await exit_time
+            if launch:
+                tracker.unsubscribe(on_process_event)
+            else:
+                await tracker.stop()
+            self.data["duration"] = end_time - start_time
+            self.data["missed_ticks"] = ticks.missed
+            self._finish()
+            if ticks.missed:
+                print("[BPFCollector] {} of {} samples missed because sampling took "
+                      "longer than the {} ms timescale".format(ticks.missed, ticks.ticks, self.timescale))
+
+            return samples_to_udf(self.data)
+        finally:
+            # Nothing is traced while the program waits in the cache
+            traced_pids_map.clear()
+            _programs.release(bpf)
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # IO latency TestRun
 # ──────────────────────────────────────────────────────────────────────────────
 
-class BPFIOLatencyTestRun:
+class BPFIOLatencyTestRun(BPFTestRun):
     """
-    Runs the benchmark with ``sys_enter/exit_read`` and ``sys_enter/exit_write``
-    tracepoints attached and produces three per-second time-series:
+    Runs the benchmark with the entry and exit tracepoints of the read and
+    write syscall families attached, and the io_uring tracepoints where the
+    kernel has them, and produces, one sample per ``timescale`` window:
 
     ``io_read_latency_ns``
-        Average latency (ns) of ``read(2)`` syscalls that completed during
-        each 1-second window.  ``None`` when no reads occurred that second.
+        Average latency (ns) of reads that completed during each window:
+        ``read``, ``pread64``, ``readv``, ``preadv``, ``preadv2`` and io_uring
+        reads and receives.  ``None`` when no reads occurred in that window.
 
     ``io_write_latency_ns``
-        Average latency (ns) of ``write(2)`` syscalls that completed during
-        each 1-second window.  ``None`` when no writes occurred that second.
+        Average latency (ns) of writes that completed during each window:
+        ``write``, ``pwrite64``, ``writev``, ``pwritev``, ``pwritev2`` and
+        io_uring writes and sends.  ``None`` when no writes occurred in that
+        window.
 
     ``io_combined_latency_ns``
         Average latency (ns) across all IO (reads + writes) that completed
-        during each 1-second window.  ``None`` when no IO occurred.
+        during each window.  ``None`` when no IO occurred.
+
+    ``io_{read,write,combined}_latency_p{50,95,99}_ns``
+        Latency percentiles (ns) of the same syscalls, estimated from the
+        window's log2 histogram (see :func:`log2_percentile`).  ``None``
+        when no IO of that type occurred.
+
+    ``io_read_latency_hist``, ``io_write_latency_hist``
+        The window's log2 histogram itself: ``[time_s, counts]``, where
+        ``counts[i]`` is the number of syscalls with a latency in
+        ``[2**(i-1), 2**i)`` ns (``counts[0]``: 0 ns).
+
+    ``io_read_bytes``, ``io_write_bytes``
+        Bytes transferred by the reads/writes that completed in the window.
+
+    ``io_read_bandwidth_Bps``, ``io_write_bandwidth_Bps``
+        The same, in bytes per second of the window.
+
+    ``io_{read,write}_{bytes,bandwidth_Bps,latency_ns}_<fd type>``
+        The bytes, bandwidth and average latency of reads/writes on each
+        kind of file descriptor (see ``FD_TYPES``): regular files, sockets,
+        pipes, anything else (character devices, ttys, ...), and io_uring
+        requests, whatever they are on.
+
+    The counters are kept in kernel and only read (and reset) once per
+    window, so the cost of a sample does not grow with the syscall rate.
+    The whole run's histograms, and the percentiles of the whole run, are
+    recorded as well.
 
     Latency is measured from the tracepoint at the syscall entry to the
     tracepoint at the syscall exit, so it includes time waiting in the
     kernel (buffer cache misses, disk seeks, network round-trips, etc.)
-    but not userspace overhead.
+    but not userspace overhead.  io_uring requests are timed from their
+    submission to their completion.
 
     The BPF program filters events by TGID so only the benchmark process tree
     (the launched process and all its descendants) is measured.  The watched
-    TGID set is refreshed every second via psutil so newly-forked children are
-    picked up quickly.
+    TGID set follows a ``ProcessTreeTracker``, which polls the tree at least
+    every 0.1 s, so newly-forked children are picked up quickly and exited
+    ones dropped.
 
     The format of stored data (in the returned dictionary):
 
@@ -317,32 +1076,81 @@ class BPFIOLatencyTestRun:
           "benchmark_set":           str,
           "collector_name":          str,
           "iteration":               int,
-          "timescale":               1000,   # ms — always 1-second windows
-          "units":                   "nanoseconds (average per 1-second interval)",
-          "measurements":            ["io_read_latency_ns",
-                                      "io_write_latency_ns",
-                                      "io_combined_latency_ns"],
+          "timescale":               int,    # ms per window
+          "units":                   "nanoseconds, bytes and bytes/s per interval, histograms in syscalls per log2 slot",
+          "measurements":            [*METRIC_KEYS, *PERCENTILE_KEYS,
+                                      *HISTOGRAM_KEYS, *TRANSFER_KEYS,
+                                      *FD_TYPE_KEYS],
           "io_read_latency_ns":      [[time_s, value_or_None], ...],
           "io_write_latency_ns":     [[time_s, value_or_None], ...],
           "io_combined_latency_ns":  [[time_s, value_or_None], ...],
+          "io_read_latency_p99_ns":  [[time_s, value_or_None], ...],
+          ...                                # one per PERCENTILE_KEYS
+          "io_read_latency_hist":    [[time_s, [count, ...]], ...],
+          "io_write_latency_hist":   [[time_s, [count, ...]], ...],
+          "io_read_latency_hist_run":  [count, ...],   # whole run
+          "io_write_latency_hist_run": [count, ...],
+          "io_read_latency_p99_ns_run": float_or_None,
+          ...                                # one per PERCENTILE_KEYS
+          "io_read_bytes":           [[time_s, value], ...],
+          ...                                # one per TRANSFER_KEYS
+          "io_read_bytes_socket":    [[time_s, value], ...],
+          ...                                # one per FD_TYPE_KEYS
           "duration":                float,  # total runtime in seconds
+          "missed_ticks":            int,    # windows merged into the next
+                                             # because sampling overran
         }
 
     :ivar name: Unique name for this TestRun
     :ivar benchmark: Associated Benchmark object
     :ivar benchmark_set: Colon-separated co-running benchmark names
     :ivar iteration: Experimental iteration number
+    :ivar timescale: Window length in ms
     :ivar data: Final UDF-format result dictionary
+    :ivar run_histograms: ``"read"``/``"write"`` → whole-run log2 histogram
+    :ivar overhead: OverheadRecorder timing each sample, or None
     """
 
-    #: The three metric keys emitted into ``data``.
+    PROGRAM = _BPF_IO_LATENCY_PROG
+    COUNTERS = ("io_counts_0", "io_counts_1", "io_slot", IO_COUNTERS)
+
+    #: The three average latency keys emitted into ``data``.
     METRIC_KEYS = (
         "io_read_latency_ns",
         "io_write_latency_ns",
         "io_combined_latency_ns",
     )
 
-    def __init__(self, name, benchmark, iteration, benchmark_set):
+    #: The percentile keys emitted into ``data``, per operation.
+    PERCENTILE_KEYS = tuple(
+        "io_{}_latency_p{}_ns".format(op, percentile)
+        for op in ("read", "write", "combined")
+        for percentile in PERCENTILES
+    )
+
+    #: The per-window histogram keys emitted into ``data``.
+    HISTOGRAM_KEYS = (
+        "io_read_latency_hist",
+        "io_write_latency_hist",
+    )
+
+    #: The byte count and bandwidth keys emitted into ``data``.
+    TRANSFER_KEYS = (
+        "io_read_bytes",
+        "io_write_bytes",
+        "io_read_bandwidth_Bps",
+        "io_write_bandwidth_Bps",
+    )
+
+    #: The per-fd-type keys emitted into ``data``.
+    FD_TYPE_KEYS = tuple(
+        "io_{}_{}_{}".format(op, measure, fd_type)
+        for op in ("read", "write")
+        for measure in ("bytes", "bandwidth_Bps", "latency_ns")
+        for fd_type in FD_TYPES
+    )
+
+    def __init__(self, name, benchmark, iteration, benchmark_set, timescale=1000, overhead=False):
         """
         Init this BPFIOLatencyTestRun.
 
@@ -354,111 +1162,75 @@ class BPFIOLatencyTestRun:
         :type iteration: int
         :param benchmark_set: Colon-separated co-running benchmark names
         :type benchmark_set: str
+        :param timescale: Window length in ms (from Configuration)
+        :type timescale: int
+        :param overhead: Record what each sample costs (see OverheadRecorder)
+        :type overhead: bool
         :return: None
         """
         self.name          = name
         self.benchmark     = benchmark
         self.benchmark_set = benchmark_set
         self.iteration     = iteration
+        self.timescale     = timescale
+        self.overhead      = OverheadRecorder(timescale / 1000) if overhead else None
 
         self.data = {
             "benchmark_name": self.benchmark.name,
             "benchmark_set":  self.benchmark_set,
             "collector_name": self.name,
             "iteration":      self.iteration,
-            "timescale":      1000,   # always 1-second windows
-            "units":          "nanoseconds (average per 1-second interval)",
-            "measurements":   list(self.METRIC_KEYS),
+            "timescale":      self.timescale,
+            "units":          "nanoseconds, bytes and bytes/s per interval, histograms in syscalls per log2 slot",
+            "measurements":   list(self.METRIC_KEYS + self.PERCENTILE_KEYS + self.HISTOGRAM_KEYS \
+                                   + self.TRANSFER_KEYS + self.FD_TYPE_KEYS),
             "duration":       0.0,
+            "missed_ticks":   0,
         }
-        for key in self.METRIC_KEYS:
+        for key in self.METRIC_KEYS + self.PERCENTILE_KEYS + self.TRANSFER_KEYS + self.FD_TYPE_KEYS:
+            self.data[key] = SampleBuffer()
+        for key in self.HISTOGRAM_KEYS:
             self.data[key] = []
+        self.run_histograms = {
+            "read":  [0] * HISTOGRAM_SLOTS,
+            "write": [0] * HISTOGRAM_SLOTS,
+        }
 
     # ── private helpers ──────────────────────────────────────────────────────
 
     @staticmethod
-    def _update_traced_pids(shell_proc, traced_pids_map):
-        """
-        Refresh the ``traced_pids`` BPF map with every live TGID in the
-        benchmark's process tree (the shell and all its descendants).
-
-        New child processes that were spawned since the last call are added;
-        already-present entries are left in place (harmless duplication is
-        fine — the map is bounded at 1 024 entries which is more than enough
-        for any realistic benchmark).
-
-        :param shell_proc: ``psutil.Process`` for the top-level shell started
-            by ``asyncio.create_subprocess_shell``
-        :type shell_proc: psutil.Process
-        :param traced_pids_map: BCC table object for the ``traced_pids`` map
-        :return: None
-        """
-        live_pids = set()
-        try:
-            live_pids.add(shell_proc.pid)
-            for child in shell_proc.children(recursive=True):
-                live_pids.add(child.pid)
-        except psutil.NoSuchProcess:
-            pass   # process just exited — work with whatever we collected
-
-        for pid in live_pids:
-            key = ctypes.c_uint32(pid)
-            try:
-                traced_pids_map[key] = traced_pids_map.Leaf(1)
-            except Exception:
-                try:
-                    # Fallback for BCC versions with different Leaf semantics
-                    traced_pids_map[key] = ctypes.c_uint8(1)
-                except Exception:
-                    pass   # best-effort; missing a PID means we lose that data
-
-    @staticmethod
-    def _snapshot_and_reset(io_stats_map):
+    def _split_counters(counts):
         """
-        Read the four counters from the ``io_stats`` BPF array and
-        immediately reset them to zero for the next interval.
-
-        There is an inherent race between reading and zeroing: events that
-        arrive in that tiny window are attributed to the *next* interval.
-        For 1-second averages this inaccuracy is negligible.
-
-        :param io_stats_map: BCC table object for the ``io_stats`` array
-        :returns: dict with keys ``read_count``, ``read_total_ns``,
-            ``write_count``, ``write_total_ns``
-        :rtype: dict
+        Split one interval of the ``io_counts`` counters (as drained by
+        :class:`DoubleBufferedCounters`) into statistics and histograms.
+
+        :param counts: The interval's total of each counter, over all CPUs
+        :type counts: list
+        :returns: ``(stats, read_counts, write_counts)``: a dict with, for
+            ``op`` in read/write and ``field`` in ``STAT_FIELDS``, the keys
+            ``<op>_<field>`` (all IO) and ``<op>_<field>_<fd type>``, and
+            the two log2 histograms
+        :rtype: tuple
         """
-        result = {"read_count": 0, "read_total_ns": 0,
-                  "write_count": 0, "write_total_ns": 0}
-        names = list(result.keys())   # order matches array indices 0-3
-
-        for idx, field in enumerate(names):
-            try:
-                result[field] = io_stats_map[ctypes.c_int(idx)].value
-            except Exception:
-                result[field] = 0
-
-        # Zero the counters — best-effort with two fallback strategies.
-        try:
-            zero_leaf = io_stats_map.Leaf(0)
-            for idx in range(4):
-                io_stats_map[ctypes.c_int(idx)] = zero_leaf
-        except Exception:
-            for idx in range(4):
-                try:
-                    entry = io_stats_map[ctypes.c_int(idx)]
-                    entry.value = 0
-                    io_stats_map[ctypes.c_int(idx)] = entry
-                except Exception:
-                    pass
-
-        return result
+        stats = {}
+        index = 0
+        for op in ("read", "write"):
+            for fd_type in FD_TYPES:
+                for field in STAT_FIELDS:
+                    total = "{}_{}".format(op, field)
+                    stats[total] = stats.get(total, 0) + counts[index]
+                    stats["{}_{}".format(total, fd_type)] = counts[index]
+                    index += 1
+        read_counts = list(counts[READ_HIST:READ_HIST + HISTOGRAM_SLOTS])
+        write_counts = list(counts[WRITE_HIST:WRITE_HIST + HISTOGRAM_SLOTS])
+        return stats, read_counts, write_counts
 
     @staticmethod
     def _compute_averages(stats):
         """
-        Derive per-second average latencies from a raw stats snapshot.
+        Derive per-window average latencies from a raw stats snapshot.
 
-        :param stats: dict as returned by :meth:`_snapshot_and_reset`
+        :param stats: dict as returned by :meth:`_split_counters`
         :type stats: dict
         :returns: ``(read_avg_ns, write_avg_ns, combined_avg_ns)`` — each
             element is either a ``float`` (ns) or ``None`` if no operations
@@ -477,93 +1249,277 @@ class BPFIOLatencyTestRun:
 
         return read_avg, write_avg, combined_avg
 
-    # ── main entry point ─────────────────────────────────────────────────────
-
-    async def run(self):
+    def _record_histograms(self, timestamp, read_counts, write_counts):
+        """
+        Append one window's histograms and their percentiles to ``data``,
+        and add them to the whole run's.
+
+        :param timestamp: Window end, in seconds since the start
+        :type timestamp: float
+        :param read_counts: The window's read latency histogram
+        :type read_counts: list
+        :param write_counts: The window's write latency histogram
+        :type write_counts: list
+        :return: None
+        """
+        combined_counts = [r + w for r, w in zip(read_counts, write_counts)]
+        for op, counts in (("read", read_counts), ("write", write_counts), ("combined", combined_counts)):
+            for percentile in PERCENTILES:
+                self.data["io_{}_latency_p{}_ns".format(op, percentile)].append(
+                    timestamp, log2_percentile(counts, percentile))
+        self.data["io_read_latency_hist"].append([timestamp, read_counts])
+        self.data["io_write_latency_hist"].append([timestamp, write_counts])
+        for op, counts in (("read", read_counts), ("write", write_counts)):
+            run = self.run_histograms[op]
+            for slot, count in enumerate(counts):
+                run[slot] += count
+
+    def _record_transfers(self, timestamp, elapsed, stats):
+        """
+        Append one window's byte counts, bandwidths and per-fd-type
+        latencies to ``data``.
+
+        :param timestamp: Window end, in seconds since the start
+        :type timestamp: float
+        :param elapsed: Window length, in seconds
+        :type elapsed: float
+        :param stats: The window's statistics, from :meth:`_split_counters`
+        :type stats: dict
+        :return: None
         """
-        Load the BPF program, start the benchmark, collect per-second
-        average IO latency until the benchmark exits, then return the
-        accumulated data dictionary.
+        for op in ("read", "write"):
+            for suffix in [""] + ["_" + fd_type for fd_type in FD_TYPES]:
+                nbytes = stats["{}_bytes{}".format(op, suffix)]
+                self.data["io_{}_bytes{}".format(op, suffix)].append(timestamp, nbytes)
+                self.data["io_{}_bandwidth_Bps{}".format(op, suffix)].append(
+                    timestamp, nbytes / elapsed if elapsed > 0 else None)
+                if suffix:
+                    count = stats["{}_count{}".format(op, suffix)]
+                    self.data["io_{}_latency_ns{}".format(op, suffix)].append(
+                        timestamp, stats["{}_total_ns{}".format(op, suffix)] / count if count else None)
+
+    def _record_run_histograms(self):
+        """
+        Store the whole run's histograms and their percentiles in ``data``.
 
-        Flow:
+        :return: None
+        """
+        read_counts = self.run_histograms["read"]
+        write_counts = self.run_histograms["write"]
+        self.data["io_read_latency_hist_run"] = list(read_counts)
+        self.data["io_write_latency_hist_run"] = list(write_counts)
+        combined_counts = [r + w for r, w in zip(read_counts, write_counts)]
+        for op, counts in (("read", read_counts), ("write", write_counts), ("combined", combined_counts)):
+            for percentile in PERCENTILES:
+                self.data["io_{}_latency_p{}_ns_run".format(op, percentile)] = \
+                    log2_percentile(counts, percentile)
 
-        1. Compile and load the eBPF program (takes ~0.5 s on first run due
-           to LLVM compilation).
-        2. Launch the benchmark via ``asyncio.create_subprocess_shell``.
-        3. Seed ``traced_pids`` with the shell's PID; yield briefly so the
-           shell can ``exec`` the target binary and populate children.
-        4. Monitoring loop — every second:
-           a. Refresh ``traced_pids`` with new child PIDs (psutil).
-           b. Snapshot and zero ``io_stats``.
-           c. Compute averages and append ``[timestamp, value]`` to data.
-        5. Wait for the subprocess to exit, record total duration.
+    @staticmethod
+    def _io_uring_cflags():
+        """
+        The compiler flags which enable the program's io_uring probes, for
+        the tracepoints this kernel has.
 
-        :return: Populated ``self.data`` dictionary
-        :rtype: dict
-        :raises RuntimeError: if the ``bcc`` package is not installed
+        :returns: ``-D`` flags; none if the kernel has no io_uring tracepoints
+        :rtype: list
         """
-        if not _HAS_BCC:
-            raise RuntimeError(
-                "BPFIOLatencyTestRun requires the 'bcc' Python package.\n"
-                "  Debian/Ubuntu: sudo apt install python3-bcc\n"
-                "  RHEL/Fedora:   sudo dnf install python3-bcc\n"
-                "  Source:        https://github.com/iovisor/bcc"
-            )
+        if not _BCC_BPF.tracepoint_exists("io_uring", "io_uring_complete"):
+            return []
+        if _BCC_BPF.tracepoint_exists("io_uring", "io_uring_submit_req"):
+            return ["-DHAVE_IO_URING", "-DHAVE_IO_URING_SUBMIT_REQ"]
+        if _BCC_BPF.tracepoint_exists("io_uring", "io_uring_submit_sqe"):
+            return ["-DHAVE_IO_URING"]
+        return []
 
-        # ── 1. Compile and load BPF program ─────────────────────────────────
-        bpf = _BCC_BPF(text=_BPF_IO_LATENCY_PROG)
-        traced_pids_map = bpf["traced_pids"]
-        io_stats_map    = bpf["io_stats"]
+    def _cflags(self):
+        return self._io_uring_cflags()
 
-        # ── 2. Launch the benchmark ──────────────────────────────────────────
-        start_time = time.time()
-        process = await asyncio.create_subprocess_shell(
-            self.benchmark.get_run_command(),
-            cwd = self.benchmark.cwd,
-            env = self.benchmark.env,
-        )
+    def _scratch_maps(self, cflags):
+        return ["io_start", "uring_start"] if cflags else ["io_start"]
 
-        # ── 3. Seed the PID set and let the shell exec the target ────────────
-        try:
-            shell_proc = psutil.Process(process.pid)
-            self._update_traced_pids(shell_proc, traced_pids_map)
-        except psutil.NoSuchProcess:
-            shell_proc = None
+    def _sample(self, timestamp, elapsed, counts):
+        stats, read_counts, write_counts = self._split_counters(counts)
+        read_avg, write_avg, combined_avg = self._compute_averages(stats)
 
-        await asyncio.sleep(0.1)   # let the shell exec the target binary
+        self.data["io_read_latency_ns"].append(timestamp, read_avg)
+        self.data["io_write_latency_ns"].append(timestamp, write_avg)
+        self.data["io_combined_latency_ns"].append(timestamp, combined_avg)
+        self._record_histograms(timestamp, read_counts, write_counts)
+        self._record_transfers(timestamp, elapsed, stats)
 
-        if shell_proc is not None:
-            try:
-                self._update_traced_pids(shell_proc, traced_pids_map)
-            except psutil.NoSuchProcess:
-                pass
+    def _finish(self):
+        self._record_run_histograms()
 
-        # ── 4. Monitoring loop (1-second intervals) ──────────────────────────
-        while shell_proc is not None and shell_proc.is_running():
-            await asyncio.sleep(1.0)
 
-            timestamp = time.time() - start_time
 
-            # Refresh child PID set before snapshotting, so any children that
-            # spawned during the last second are included.
-            try:
-                self._update_traced_pids(shell_proc, traced_pids_map)
-            except psutil.NoSuchProcess:
-                pass
+# ──────────────────────────────────────────────────────────────────────────────
+# Scheduler TestRun
+# ──────────────────────────────────────────────────────────────────────────────
+
+class BPFSchedTestRun(BPFTestRun):
+    """
+    Runs the benchmark with the ``sched_wakeup``, ``sched_wakeup_new`` and
+    ``sched_switch`` raw tracepoints attached, and measures, for the threads
+    of the benchmark process tree, the time they spend off CPU:
+
+    ``runq_latency``
+        Waiting for a CPU: from being woken (or preempted) until running
+        again.  This is where co-running benchmarks, or anything else on
+        the node, slow the benchmark down without showing in its own perf
+        counters.
+
+    ``offcpu_time``
+        Blocked: from switching out while not runnable (IO, locks, sleeps,
+        MPI waits) until woken.
+
+    For each requested metric ``<m>``, one sample per ``timescale`` window:
+
+    ``<m>_ns``
+        Average length (ns) of the waits that ended in the window.  ``None``
+        when none did.
+
+    ``<m>_total_ns``
+        Total length (ns) of the waits that ended in the window, over all
+        threads; can exceed the window with several threads.
+
+    ``<m>_p{50,95,99}_ns``
+        Percentiles (ns) of the same waits, from the window's log2
+        histogram (see :func:`log2_percentile`).
 
-            # Snapshot and reset BPF counters for this interval
-            stats = self._snapshot_and_reset(io_stats_map)
-            read_avg, write_avg, combined_avg = self._compute_averages(stats)
+    ``<m>_hist``
+        The window's log2 histogram itself: ``[time_s, counts]``, where
+        ``counts[i]`` is the number of waits of ``[2**(i-1), 2**i)`` ns.
+
+    plus the whole run's histogram, percentiles and total, as
+    ``<m>_hist_run``, ``<m>_p99_ns_run``, ``<m>_total_ns_run``, ...
+
+    The waits are aggregated in kernel, into the same double-buffered
+    per-CPU interval counters as the IO latency program; both metrics come
+    from the one program, so requesting both costs a single run.
+
+    :ivar name: Unique name for this TestRun
+    :ivar benchmark: Associated Benchmark object
+    :ivar benchmark_set: Colon-separated co-running benchmark names
+    :ivar iteration: Experimental iteration number
+    :ivar metrics: The metrics recorded, from ``METRICS``
+    :ivar timescale: Window length in ms
+    :ivar data: Final UDF-format result dictionary
+    :ivar run_histograms: metric → whole-run log2 histogram
+    :ivar run_totals: metric → whole-run total, in ns
+    :ivar overhead: OverheadRecorder timing each sample, or None
+    """
 
-            self.data["io_read_latency_ns"].append([timestamp, read_avg])
-            self.data["io_write_latency_ns"].append([timestamp, write_avg])
-            self.data["io_combined_latency_ns"].append([timestamp, combined_avg])
+    PROGRAM = _BPF_SCHED_PROG
+    COUNTERS = ("sched_counts_0", "sched_counts_1", "sched_slot", 4 + 2 * HISTOGRAM_SLOTS)
 
-        # ── 5. Wait for process exit and record duration ─────────────────────
-        await process.wait()
-        self.data["duration"] = time.time() - start_time
+    #: metric → (index of its count, and total, in the counters; index of
+    #: its histogram), as in the BPF program
+    METRICS = {
+        "runq_latency": (0, 4),
+        "offcpu_time":  (2, 4 + HISTOGRAM_SLOTS),
+    }
 
-        return self.data
+    def __init__(self, name, benchmark, iteration, benchmark_set, metrics, timescale=1000, overhead=False):
+        """
+        Init this BPFSchedTestRun.
+
+        :param name: Unique name for this TestRun
+        :type name: str
+        :param benchmark: Associated Benchmark object
+        :type benchmark: Benchmark()
+        :param iteration: Experimental iteration number
+        :type iteration: int
+        :param benchmark_set: Colon-separated co-running benchmark names
+        :type benchmark_set: str
+        :param metrics: Metrics to record, from ``METRICS``
+        :type metrics: list
+        :param timescale: Window length in ms (from Configuration)
+        :type timescale: int
+        :param overhead: Record what each sample costs (see OverheadRecorder)
+        :type overhead: bool
+        :return: None
+        """
+        self.name          = name
+        self.benchmark     = benchmark
+        self.benchmark_set = benchmark_set
+        self.iteration     = iteration
+        self.metrics       = list(metrics)
+        self.timescale     = timescale
+        self.overhead      = OverheadRecorder(timescale / 1000) if overhead else None
+
+        self.data = {
+            "benchmark_name": self.benchmark.name,
+            "benchmark_set":  self.benchmark_set,
+            "collector_name": self.name,
+            "iteration":      self.iteration,
+            "timescale":      self.timescale,
+            "units":          "nanoseconds per interval, histograms in waits per log2 slot",
+            "measurements":   [],
+            "duration":       0.0,
+            "missed_ticks":   0,
+        }
+        for metric in self.metrics:
+            keys = ["{}_ns".format(metric), "{}_total_ns".format(metric)] \
+                + ["{}_p{}_ns".format(metric, percentile) for percentile in PERCENTILES]
+            for key in keys:
+                self.data[key] = SampleBuffer()
+            self.data["{}_hist".format(metric)] = []
+            self.data["measurements"] += keys + ["{}_hist".format(metric)]
+        self.run_histograms = {metric: [0] * HISTOGRAM_SLOTS for metric in self.metrics}
+        self.run_totals = {metric: 0 for metric in self.metrics}
+
+    # ── private helpers ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def _task_state_cflags():
+        """
+        Name the ``task_struct`` field holding a task's state, ``__state``
+        since Linux 5.14 and ``state`` before, for the program.
+
+        The kernel's BTF is asked where bcc can (0.23 and later), and the
+        kernel version otherwise.
+
+        :returns: The ``-DTASK_STATE=`` flag
+        :rtype: list
+        """
+        has_field = -1
+        if hasattr(_BCC_BPF, "kernel_struct_has_field"):
+            has_field = _BCC_BPF.kernel_struct_has_field(b"task_struct", b"__state")
+        if has_field < 0:
+            version = re.match(r"(\d+)\.(\d+)", os.uname().release)
+            has_field = int(version is not None and (int(version.group(1)), int(version.group(2))) >= (5, 14))
+        return ["-DTASK_STATE={}".format("__state" if has_field else "state")]
+
+    def _cflags(self):
+        return self._task_state_cflags()
+
+    def _scratch_maps(self, cflags):
+        return ["runq_start", "offcpu_start"]
+
+    def _sample(self, timestamp, elapsed, counts):
+        for metric in self.metrics:
+            stats, hist = self.METRICS[metric]
+            count, total = counts[stats], counts[stats + 1]
+            histogram = list(counts[hist:hist + HISTOGRAM_SLOTS])
+            self.data["{}_ns".format(metric)].append(timestamp, total / count if count else None)
+            self.data["{}_total_ns".format(metric)].append(timestamp, total)
+            for percentile in PERCENTILES:
+                self.data["{}_p{}_ns".format(metric, percentile)].append(
+                    timestamp, log2_percentile(histogram, percentile))
+            self.data["{}_hist".format(metric)].append([timestamp, histogram])
+
+            run = self.run_histograms[metric]
+            for slot, slot_count in enumerate(histogram):
+                run[slot] += slot_count
+            self.run_totals[metric] += total
+
+    def _finish(self):
+        for metric in self.metrics:
+            self.data["{}_hist_run".format(metric)] = list(self.run_histograms[metric])
+            self.data["{}_total_ns_run".format(metric)] = self.run_totals[metric]
+            for percentile in PERCENTILES:
+                self.data["{}_p{}_ns_run".format(metric, percentile)] = \
+                    log2_percentile(self.run_histograms[metric], percentile)
 
 
 Collector.register_collector("bpf", BPFCollector)
@@ -0,0 +1,179 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains DoubleBufferedCounters, which drains the per-interval
+counters of a BPF program exactly, for the BPF Collector.
+
+The program keeps its counters in two per-CPU arrays, one per interval
+slot, and a one-entry array holding the slot being written::
+
+    BPF_PERCPU_ARRAY(counts_0, u64, N);
+    BPF_PERCPU_ARRAY(counts_1, u64, N);
+    BPF_ARRAY(slot, u32, 1);
+
+Each CPU adds to its own copy of a counter, so there are no atomic
+operations and no cachelines shared between CPUs. Once per interval,
+drain():
+
+    1. Reads the idle slot, which was retired and read one interval ago.
+       Anything it gained since was written by events which looked the
+       slot up just before it was retired; these are counted now.
+    2. Zeroes the idle slot, which nothing has written to for an interval.
+    3. Makes the idle slot the one being written.
+    4. Reads the slot just retired.
+
+Every event is so counted exactly once, and nothing is ever zeroed while
+the kernel writes to it. Whole maps are read and zeroed with the batch map
+operations (Linux 5.6, bcc 0.16) where available, and one entry at a time
+otherwise.
+
+Only the table methods bcc provides are used (items_lookup_batch(),
+items_update_batch(), items(), clear(), Key and Leaf, and item
+assignment), so any object with those can stand in for a map, as in
+tests/test_bpf_maps.py.
+"""
+
+def _value(item):
+    """
+    The number in a map key or non-per-CPU leaf, as a ctypes value or int
+    """
+    return getattr(item, "value", item)
+
+def _total(leaf):
+    """
+    A counter's total over all CPUs
+
+    :param leaf: The counter, one value per CPU, or a single value
+    :return: The total
+    :rtype: int
+    """
+    if hasattr(leaf, "value"):
+        return leaf.value
+    try:
+        return sum(_value(value) for value in leaf)
+    except TypeError:
+        return leaf
+
+class DoubleBufferedCounters():
+    """
+    Exact per-interval totals of counters kept in two per-CPU BPF arrays
+
+    :ivar slots: The two counter tables, written while the selector holds
+    0 and 1 respectively
+    :type slots: tuple
+    :ivar selector: One-entry table holding the slot being written
+    :ivar size: Number of counters in each slot
+    :type size: int
+    :ivar active: The slot being written
+    :type active: int
+    :ivar batch: Whether the batch map operations are used; cleared the
+    first time one fails
+    :type batch: bool
+    """
+
+    def __init__(self, slots, selector, size):
+        """
+        Init the object, and reset() the counters
+
+        :param slots: The two counter tables
+        :type slots: tuple
+        :param selector: One-entry table holding the slot being written
+        :param size: Number of counters in each slot
+        :type size: int
+
+        :return: None
+        """
+        self.slots = tuple(slots)
+        self.selector = selector
+        self.size = size
+        self.batch = True
+        self.reset()
+
+    def reset(self):
+        """
+        Zero both slots and have the kernel write slot 0, ex when the
+        program is reused from an earlier run
+
+        :return: None
+        """
+        for table in self.slots:
+            self.zero(table)
+        self.active = 0
+        self._retired = [0] * self.size
+        self._select(0)
+
+    def _select(self, slot):
+        self.selector[self.selector.Key(0)] = self.selector.Leaf(slot)
+
+    def read(self, table):
+        """
+        Read every counter of one slot
+
+        :param table: The slot's table
+        :return: Total over all CPUs of each counter
+        :rtype: list
+        """
+        items = None
+        if self.batch:
+            try:
+                items = list(table.items_lookup_batch())
+            except Exception:
+                self.batch = False
+        if items is None:
+            items = table.items()
+        totals = [0] * self.size
+        for key, leaf in items:
+            index = _value(key)
+            if index < self.size:
+                totals[index] = _total(leaf)
+        return totals
+
+    def zero(self, table):
+        """
+        Zero every counter of one slot
+
+        :param table: The slot's table
+
+        :return: None
+        """
+        if self.batch:
+            try:
+                keys = (table.Key * self.size)(*range(self.size))
+                table.items_update_batch(keys, (table.Leaf * self.size)())
+                return
+            except Exception:
+                self.batch = False
+        table.clear()
+
+    def drain(self):
+        """
+        Swap slots and return what was counted since the last drain()
+
+        :return: Total of each counter over the interval, over all CPUs
+        :rtype: list
+        """
+        idle = 1 - self.active
+        late = self.read(self.slots[idle])
+        self.zero(self.slots[idle])
+        self._select(idle)
+        retired = self.read(self.slots[self.active])
+        counts = [now - before + total for now, before, total in zip(late, self._retired, retired)]
+        self.active = idle
+        self._retired = retired
+        return counts
+
+__all__ = ['DoubleBufferedCounters']
@@ -0,0 +1,145 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the Cgroup, a throwaway cgroup a benchmark is run in so
+that perf can count it, and only it, with "perf stat -G" ("scope: cgroup"
+in the perf collection mode).
+
+Each Cgroup is created under mantis-monitor.<pid>/ in the hierarchy perf
+uses for -G: the cgroup v1 perf_event controller if it is mounted,
+otherwise cgroup v2. The benchmark's shell writes its own PID into
+cgroup.procs before running the benchmark command, so everything the
+benchmark starts is counted, and nothing else, however it is co-scheduled.
+
+Creating cgroups needs root, or a delegated subtree.
+"""
+
+import itertools
+import os
+import shlex
+
+_ids = itertools.count()
+
+def find_cgroup_root(mounts = "/proc/self/mounts"):
+    """
+    Find where the hierarchy perf -G resolves cgroup names in is mounted
+
+    :param mounts: The mount table to read
+    :type mounts: str
+
+    :return: The mount point, or None if neither hierarchy is mounted
+    :rtype: str
+    """
+    unified = None
+    with open(mounts) as mount_table:
+        for line in mount_table:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            if fields[2] == "cgroup" and "perf_event" in fields[3].split(","):
+                return fields[1]
+            if fields[2] == "cgroup2" and unified is None:
+                unified = fields[1]
+    return unified
+
+class Cgroup():
+    """
+    A cgroup for one run of a benchmark
+
+    :ivar root: Mount point of the cgroup hierarchy
+    :type root: str
+    :ivar path: The cgroup's name, relative to root, as perf -G takes it
+    :type path: str
+    :ivar directory: The cgroup's directory
+    :type directory: str
+    """
+
+    def __init__(self, name, root = None):
+        """
+        Init the object; the cgroup is made by create()
+
+        :param name: Name to tell the cgroup by, ex the TestRun's name
+        :type name: str
+        :param root: Mount point of the cgroup hierarchy; found with
+        find_cgroup_root() if not given
+        :type root: str
+
+        :return: None
+        :raises RuntimeError: if no cgroup hierarchy perf can use is mounted
+        """
+        self.root = root or find_cgroup_root()
+        if not self.root:
+            raise RuntimeError("perf scope cgroup needs the perf_event cgroup controller or cgroup v2 mounted")
+        self.path = "mantis-monitor.{}/{}-{}".format(os.getpid(), name, next(_ids))
+        self.directory = os.path.join(self.root, self.path)
+
+    def create(self):
+        """
+        Make the cgroup
+
+        :return: None
+        :raises RuntimeError: if the cgroup cannot be made, ex without root
+        """
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+        except OSError as error:
+            raise RuntimeError("Cannot create cgroup {}: {}".format(self.directory, error)) from error
+
+    def add(self, pid):
+        """
+        Move a process, and so everything it starts from now on, into the cgroup
+
+        :param pid: The process
+        :type pid: int
+
+        :return: None
+        """
+        with open(os.path.join(self.directory, "cgroup.procs"), "w") as procs:
+            procs.write(str(pid))
+
+    def wrap(self, command):
+        """
+        Wrap a shell command so that it runs in the cgroup
+
+        :param command: The command
+        :type command: str
+
+        :return: A command which joins the cgroup and then runs command, or
+        fails without running it if the cgroup cannot be joined
+        :rtype: str
+        """
+        return "/bin/sh -c {}".format(shlex.quote("echo $$ > {} || exit 1\n{}".format( \
+            shlex.quote(os.path.join(self.directory, "cgroup.procs")), command)))
+
+    def remove(self):
+        """
+        Remove the cgroup, and mantis-monitor's parent cgroup once it is
+        empty; a cgroup which still has processes in it is left behind
+
+        :return: None
+        """
+        for directory in (self.directory, os.path.dirname(self.directory)):
+            try:
+                os.rmdir(directory)
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                if directory == self.directory:
+                    print("Could not remove cgroup {}: {}".format(directory, error))
+                return
+
+__all__ = ['Cgroup', 'find_cgroup_root']
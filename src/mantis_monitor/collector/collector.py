@@ -44,13 +44,360 @@ for an example implementation.
 import logging
 import math
 import subprocess
+import asyncio
+import contextvars
 import os
+import array
+import functools
+import itertools
+import time
+
+import numpy
 
 import pprint
 
 #logging.basicConfig(filename='testing.log', encoding='utf-8', \
 #    format='%(levelname)s:%(message)s', level=logging.DEBUG)
 
+#: The CPUs benchmarks launched from the current task are pinned to, or None
+#: for no pinning. Set per cell by the scheduler; tasks inherit it when created.
+current_cpuset = contextvars.ContextVar("current_cpuset", default = None)
+
+async def launch_benchmark(benchmark, command = None, fds = None, **kwargs):
+    """
+    Start a Benchmark (or a command wrapping it) as a shell subprocess
+
+    The Benchmark's working directory and environment are used, and the
+    process is pinned to current_cpuset if one is set. Any other keyword
+    arguments are passed on to asyncio.create_subprocess_shell().
+
+    :param benchmark: Benchmark to launch
+    :type benchmark: Benchmark()
+    :param command: Command to run instead of benchmark.get_run_command(),
+    for tools such as perf which wrap the benchmark
+    :type command: str
+    :param fds: File descriptors to hand the process, as {fd in the process:
+    fd here}. /bin/sh may only accept single-digit fds in redirections, so
+    the command should refer to them by their number in the process, 3 to 9
+    :type fds: dict
+
+    :return: The started process
+    :rtype: asyncio.subprocess.Process
+    """
+    if command is None:
+        command = benchmark.get_run_command()
+    cpus = current_cpuset.get()
+    fds = dict(fds or {})
+
+    def setup_child():
+        for target, source in fds.items():
+            if target == source:
+                os.set_inheritable(target, True)
+            else:
+                os.dup2(source, target)
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+
+    if cpus or fds:
+        kwargs["preexec_fn"] = setup_child
+    if fds:
+        kwargs["pass_fds"] = tuple(kwargs.get("pass_fds", ())) + tuple(fds)
+    return await asyncio.create_subprocess_shell(command, cwd=benchmark.cwd, env=benchmark.env, **kwargs)
+
+class SampleBuffer():
+    """
+    Array-backed store for one time series
+
+    TestRuns append samples here instead of building a [time, value] list per
+    sample. Times and values are kept in two array columns, which grow in
+    amortized constant time and hold 16 bytes per sample. Times are
+    array('d'). Values start as array('q'), so a series of integers (byte
+    counts, RSS, event counts) stays integral, and are converted to
+    array('d') the first time a sample is a float, missing (None, stored as
+    NaN) or too large for 64 bits.
+
+    The UDF's [[time, value], ...] form is only built when asked for, with
+    to_udf(); samples_to_udf() converts every buffer in a TestRun's record.
+
+    :ivar times: Sample times, in seconds since the TestRun started
+    :type times: array.array
+    :ivar values: Sample values; integers, or floats with NaN where missing
+    :type values: array.array
+    """
+
+    __slots__ = ("times", "values")
+
+    def __init__(self):
+        """
+        Init an empty buffer
+
+        :return: None
+        """
+        self.times = array.array("d")
+        self.values = array.array("q")
+
+    def append(self, time, value):
+        """
+        Add one sample
+
+        :param time: Sample time
+        :type time: float
+        :param value: Sample value, or None if missing
+        :type value: float
+
+        :return: None
+        """
+        if self.values.typecode == "q":
+            if isinstance(value, (int, numpy.integer)):
+                try:
+                    self.values.append(value)
+                    self.times.append(time)
+                    return
+                except OverflowError:
+                    pass
+            self.values = array.array("d", self.values)
+        self.values.append(math.nan if value is None else value)
+        self.times.append(time)
+
+    def __len__(self):
+        return len(self.times)
+
+    def to_numpy(self):
+        """
+        View the samples as NumPy arrays, without copying
+
+        :return: (times, values) arrays; times are float64, values int64 or
+        float64
+        :rtype: tuple
+        """
+        return numpy.frombuffer(self.times, dtype = numpy.float64), \
+            numpy.frombuffer(self.values, dtype = numpy.int64 if self.values.typecode == "q" else numpy.float64)
+
+    def to_udf(self):
+        """
+        Build the UDF form of the samples, with None for missing values
+
+        :return: [[time, value], ...]
+        :rtype: list
+        """
+        if self.values.typecode == "q":
+            return [[time, value] for time, value in zip(self.times, self.values)]
+        return [[time, None if value != value else value] for time, value in zip(self.times, self.values)]
+
+def samples_to_udf(record):
+    """
+    Copy a UDF record, converting every SampleBuffer in it with to_udf()
+
+    :param record: A TestRun's data dictionary
+    :type record: dict
+
+    :return: The record in the UDF
+    :rtype: dict
+    """
+    return {key: value.to_udf() if isinstance(value, SampleBuffer) else value for key, value in record.items()}
+
+class OverheadRecorder():
+    """
+    Measures what each sampling iteration of a TestRun costs mantis-monitor
+    itself
+
+    Call start_tick() and end_tick() around the work of each tick of a
+    sampling loop. Per tick, this
+    records the wall time and the CPU time mantis-monitor spent, its RSS
+    afterwards, and the jitter: how much later than one interval after the
+    previous tick this one began. to_record() turns these into an extra UDF
+    record, with collector_name "<name>_overhead".
+
+    Enabled with "overhead: true" in the config.yaml.
+
+    :cvar measurements: Names of the recorded time series
+    :type measurements: tuple
+    :ivar interval: Intended seconds between ticks
+    :type interval: float
+    :ivar samples: One SampleBuffer() per measurement
+    :type samples: dict
+    """
+
+    measurements = ("overhead_wall_s", "overhead_cpu_s", "overhead_rss_bytes", "tick_jitter_s")
+
+    def __init__(self, interval):
+        """
+        Init the object; tick times are counted from now
+
+        :param interval: Intended seconds between ticks
+        :type interval: float
+
+        :return: None
+        """
+        self.interval = interval
+        self.samples = {name: SampleBuffer() for name in self.measurements}
+        self._start = time.monotonic()
+        self._last_tick = None
+        self._tick_started = None
+        self._tick_cpu = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def _rss(self):
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * self._page_size
+
+    def start_tick(self):
+        """
+        Mark the start of a tick's work
+
+        :return: None
+        """
+        self._tick_started = time.monotonic()
+        self._tick_cpu = time.process_time()
+
+    def end_tick(self):
+        """
+        Mark the end of a tick's work and record what it cost
+
+        :return: None
+        """
+        started = self._tick_started
+        timestamp = started - self._start
+        jitter = None if self._last_tick is None else started - self._last_tick - self.interval
+        self._last_tick = started
+        self.samples["overhead_wall_s"].append(timestamp, time.monotonic() - started)
+        self.samples["overhead_cpu_s"].append(timestamp, time.process_time() - self._tick_cpu)
+        self.samples["overhead_rss_bytes"].append(timestamp, self._rss())
+        self.samples["tick_jitter_s"].append(timestamp, jitter)
+
+    def to_record(self, record):
+        """
+        Build the overhead UDF record for a TestRun's record
+
+        :param record: The TestRun's data dictionary
+        :type record: dict
+
+        :return: The overhead record
+        :rtype: dict
+        """
+        overhead = {key: record.get(key) for key in ("benchmark_name", "benchmark_set", "iteration", "timescale", "duration")}
+        overhead["collector_name"] = "{}_overhead".format(record.get("collector_name"))
+        overhead["units"] = "seconds, bytes"
+        overhead["measurements"] = list(self.measurements)
+        overhead.update(samples_to_udf(self.samples))
+        return overhead
+
+class PeriodicSampler():
+    """
+    Schedules the ticks of a sampling loop at absolute deadlines
+
+    Tick n is due n intervals after the sampler was created, on the
+    monotonic clock. Sleeping until the next deadline, rather than for one
+    interval after the work of a tick, keeps the time the work takes from
+    piling up as drift. If a tick's work overruns one or more later
+    deadlines, those ticks are skipped and counted in missed, rather than
+    run back to back. Deadlines which pass before the first tick (while the
+    TestRun is still starting up) are skipped without being counted.
+
+    A sampling loop looks like::
+
+        ticks = PeriodicSampler(self.timescale / 1000)
+        while process_is_running():
+            timestamp = await ticks.tick()
+            ... take one sample at timestamp ...
+
+    The timestamps handed out are the scheduled tick times, so every
+    Collector sampling at the same timescale reports samples on the same
+    grid of seconds since its launch.
+
+    :ivar interval: Seconds between ticks
+    :type interval: float
+    :ivar start: Monotonic time tick 0 was due
+    :type start: float
+    :ivar ticks: Index of the last tick handed out
+    :type ticks: int
+    :ivar missed: Number of ticks skipped because their deadline had passed
+    :type missed: int
+    """
+
+    def __init__(self, interval, start = None):
+        """
+        Init the object
+
+        :param interval: Seconds between ticks; must be positive
+        :type interval: float
+        :param start: Monotonic time to count ticks from; defaults to now
+        :type start: float
+
+        :return: None
+        """
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive, got {}".format(interval))
+        self.interval = interval
+        self.start = time.monotonic() if start is None else start
+        self.ticks = 0
+        self.missed = 0
+
+    async def tick(self):
+        """
+        Wait for the next tick's deadline
+
+        :return: The tick's scheduled time, in seconds since start
+        :rtype: float
+        """
+        self.ticks += 1
+        late = time.monotonic() - (self.start + self.ticks * self.interval)
+        if late > 0:
+            # Skip every deadline which has already passed
+            skipped = int(late // self.interval)
+            if self.ticks > 1:
+                self.missed += skipped
+            self.ticks += skipped
+            if skipped:
+                late = time.monotonic() - (self.start + self.ticks * self.interval)
+        if late < 0:
+            await asyncio.sleep(-late)
+        return round(self.ticks * self.interval, 9)
+
+def watch_exit(process):
+    """
+    Note when a process exits, for a sampling loop which only sees the exit
+    at its next tick
+
+    :param process: The process to watch
+    :type process: asyncio.subprocess.Process
+
+    :return: Task whose result is the monotonic time the process exited
+    :rtype: asyncio.Task
+    """
+    async def exited():
+        await process.wait()
+        return time.monotonic()
+    return asyncio.ensure_future(exited())
+
+#: Records of the TestRuns running right now, by run id, as
+#: (start time, record) tuples. Filled in by @published; read by the live
+#: endpoint (see mantis_monitor.live). Only touched from the event loop, so
+#: no locking is needed.
+live_records = {}
+_live_ids = itertools.count()
+
+def published(run):
+    """
+    Decorate a TestRun's async run() so its data dictionary, with any
+    SampleBuffers in it, is listed in live_records while it runs
+
+    :param run: The TestRun's run() coroutine function
+    :type run: function
+
+    :return: The wrapped function
+    :rtype: function
+    """
+    @functools.wraps(run)
+    async def wrapper(self, *args, **kwargs):
+        run_id = next(_live_ids)
+        live_records[run_id] = (time.time(), self.data)
+        try:
+            return await run(self, *args, **kwargs)
+        finally:
+            del live_records[run_id]
+    return wrapper
+
 class Collector():
     """
     This is the generic form for a collector; use as an interface
@@ -73,8 +420,23 @@ class Collector():
     :ivar testruns: List of TestRun() instances to run against this Collector
     :type testruns: TestRun()
     :ivar data: Data from this Collector instance stored in the UDF
+
+    :cvar exclusive: Whether this Collector needs the node to itself, for
+    example because it measures system-wide. Only non-exclusive Collectors
+    are run in parallel with other work by the scheduler.
+    :type exclusive: bool
+    :cvar multiplexable: Whether this Collector's TestRuns can observe a
+    benchmark launched for several Collectors at once (see LaunchHandle),
+    rather than launching it themselves
+    :type multiplexable: bool
+    :ivar launch: The LaunchHandle() the next run_all() step observes, or
+    None to launch the benchmark as usual
+    :type launch: LaunchHandle()
     """
     implementations = {}
+    exclusive = True
+    multiplexable = False
+    launch = None
 
     @staticmethod
     def register_collector(name, collector_class):
@@ -111,6 +473,49 @@ class Collector():
             return None
         return Collector.implementations[name](configuration, iteration, benchmark, benchmark_set)
 
+    @staticmethod
+    def is_exclusive(name):
+        """
+        Using the string name of a Collector implementation, check whether it
+        must run alone
+
+        :param name: Name of the Collector to check
+        :type name: str
+
+        :return: Collector.implementations[name].exclusive, True if unknown
+        :rtype: bool
+        """
+        if name not in Collector.implementations:
+            return True
+        return Collector.implementations[name].exclusive
+
+    @staticmethod
+    def is_multiplexable(name):
+        """
+        Using the string name of a Collector implementation, check whether it
+        can share a launch with other Collectors
+
+        :param name: Name of the Collector to check
+        :type name: str
+
+        :return: Collector.implementations[name].multiplexable, False if unknown
+        :rtype: bool
+        """
+        if name not in Collector.implementations:
+            return False
+        return Collector.implementations[name].multiplexable
+
+    def can_attach(self):
+        """
+        Check whether this instance can run on a shared launch: it must be
+        multiplexable and run exactly one TestRun, so one launch covers it
+
+        Collectors which build their TestRuns in run_all() override this.
+
+        :return: True if run_all() can be stepped once with self.launch set
+        :rtype: bool
+        """
+        return self.multiplexable and len(self.testruns) == 1
 
 
     def __init__(self, configuration, iteration, benchmark, benchmark_set = "solo"):
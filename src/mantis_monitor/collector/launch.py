@@ -0,0 +1,192 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the LaunchHandle, one execution of a Benchmark shared by
+several Collectors.
+
+Normally every TestRun launches its own copy of the benchmark. With
+"multiplex: true" in the config.yaml, the Collectors of a cell which can
+attach to a running benchmark (see Collector.multiplexable) instead all
+observe one launch:
+
+    1. The scheduler creates a LaunchHandle and calls launch(). The
+       benchmark's shell is started, but held at a gate before it runs the
+       benchmark command, so its PID is known before anything happens.
+    2. Each TestRun, given the handle, sets up its monitoring against
+       handle.pid (starting perf, loading BPF programs, subscribing to
+       handle.tracker, ...) and then calls attached().
+    3. Once every TestRun has attached, the scheduler calls release(): the
+       gate opens and the benchmark runs, observed by all of them at once.
+    4. TestRuns wait on the handle's process as they would on their own.
+"""
+
+import asyncio
+import os
+import time
+
+from mantis_monitor.collector.collector import launch_benchmark
+from mantis_monitor.collector.procfs import ProcessTreeTracker
+
+# The fd the benchmark's shell reads the gate from
+GATE_FD = 3
+
+class LaunchHandle():
+    """
+    One gated execution of a Benchmark, observed by several TestRuns
+
+    :ivar benchmark: The Benchmark launched
+    :type benchmark: Benchmark()
+    :ivar process: The benchmark's shell, once launched
+    :type process: asyncio.subprocess.Process
+    :ivar pid: PID of the benchmark's shell, once launched
+    :type pid: int
+    :ivar cwd: Working directory the benchmark runs in
+    :type cwd: str
+    :ivar env: Environment the benchmark runs with
+    :type env: dict
+    :ivar tracker: ProcessTreeTracker() following the benchmark's processes,
+    shared by every TestRun attached; started on release(). None if the
+    handle was made without one
+    :type tracker: ProcessTreeTracker()
+    :ivar start_time: Wall-clock time the gate opened
+    :type start_time: float
+    :ivar start_monotonic: Monotonic time the gate opened, for a
+    PeriodicSampler() shared grid
+    :type start_monotonic: float
+    """
+
+    def __init__(self, benchmark, tracker_interval = 0.1):
+        """
+        Init the object; nothing is started until launch()
+
+        :param benchmark: The Benchmark to launch
+        :type benchmark: Benchmark()
+        :param tracker_interval: Seconds between polls of the process tree;
+        None for no tracker, when only the gate is wanted
+        :type tracker_interval: float
+
+        :return: None
+        """
+        self.benchmark = benchmark
+        self.cwd = benchmark.cwd
+        self.env = benchmark.env
+        self.tracker_interval = tracker_interval
+        self.process = None
+        self.pid = None
+        self.tracker = None
+        self.start_time = None
+        self.start_monotonic = None
+        self.released = asyncio.Event()
+        self._attached = 0
+        self._attached_changed = asyncio.Event()
+        self._gate = None
+
+    async def launch(self):
+        """
+        Start the benchmark's shell, held at the gate
+
+        :return: None
+        """
+        gate_read, self._gate = os.pipe()
+        # The shell blocks reading the gate; if the gate is closed without
+        # being opened, it exits without running the benchmark
+        command = "read -r _ <&{fd} || exit 1\nexec {fd}<&-\n{command}".format(fd = GATE_FD, \
+            command = self.benchmark.get_run_command())
+        try:
+            self.process = await launch_benchmark(self.benchmark, command, fds = {GATE_FD: gate_read})
+        except BaseException:
+            os.close(self._gate)
+            self._gate = None
+            raise
+        finally:
+            os.close(gate_read)
+        self.pid = self.process.pid
+        if self.tracker_interval:
+            self.tracker = ProcessTreeTracker(self.pid, self.tracker_interval)
+
+    def attached(self):
+        """
+        Tell the handle a TestRun is ready for the benchmark to start
+
+        :return: None
+        """
+        self._attached += 1
+        self._attached_changed.set()
+
+    async def wait_attached(self, count, tasks):
+        """
+        Wait until count TestRuns have attached, or any of tasks (the
+        TestRuns' coroutines) has finished, since a failed TestRun never
+        attaches
+
+        :param count: How many TestRuns are expected to attach
+        :type count: int
+        :param tasks: The running TestRuns
+        :type tasks: list
+
+        :return: None
+        """
+        tasks = list(tasks)
+        while self._attached < count and not any(task.done() for task in tasks):
+            self._attached_changed.clear()
+            changed = asyncio.ensure_future(self._attached_changed.wait())
+            await asyncio.wait([changed] + tasks, return_when = asyncio.FIRST_COMPLETED)
+            changed.cancel()
+
+    def release(self):
+        """
+        Open the gate, starting the benchmark
+
+        :return: None
+        """
+        if self._gate is None:
+            return
+        self.start_time = time.time()
+        self.start_monotonic = time.monotonic()
+        try:
+            os.write(self._gate, b"\n")
+        finally:
+            os.close(self._gate)
+            self._gate = None
+        if self.tracker:
+            self.tracker.start()
+        self.released.set()
+
+    async def wait_released(self):
+        """
+        Wait for the gate to open
+
+        :return: None
+        """
+        await self.released.wait()
+
+    async def close(self):
+        """
+        Wait for the benchmark to exit and stop tracking it; if the gate was
+        never opened, the benchmark exits without running
+
+        :return: None
+        """
+        if self._gate is not None:
+            os.close(self._gate)
+            self._gate = None
+        if self.process is not None:
+            await self.process.wait()
+        if self.tracker is not None:
+            await self.tracker.stop()
+
+__all__ = ['LaunchHandle']
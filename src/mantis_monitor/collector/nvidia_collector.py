@@ -39,7 +39,7 @@ import datetime
 import pprint
 import pandas
 
-from mantis_monitor.collector.collector import Collector
+from mantis_monitor.collector.collector import Collector, SampleBuffer, launch_benchmark, published, samples_to_udf
 
 #logging.basicConfig(filename='testing.log', encoding='utf-8', \
 #    format='%(levelname)s:%(message)s', level=logging.DEBUG)
@@ -64,7 +64,17 @@ class NvidiaCollector(Collector):
     :ivar global_id: An int used to uniquely identify each TestRun()
     :ivar timescale: The time between collections in MS, comes from Configuration()
     :ivar filename: A unique filename to use for intermediate data storage
+
+    :cvar multiplexable: True; smi samples the GPUs alongside a shared launch,
+    when a single over-time mode is configured (gpu_trace wraps the benchmark
+    in nsys, so needs its own launch)
     """
+
+    multiplexable = True
+
+    def can_attach(self):
+        return len(self.testruns) == 1 and isinstance(self.testruns[0], SMIOverTimeTestRun)
+
     def __init__(self, configuration, iteration, benchmark, benchmark_set):
         """
         Init the object
@@ -154,9 +164,11 @@ class NvidiaCollector(Collector):
         with this Collector instance
         """
         for this_testrun in self.testruns:
-            this_testrun.benchmark.before_each()
-            data = await this_testrun.run()
-            this_testrun.benchmark.after_each()
+            if not self.launch:
+                this_testrun.benchmark.before_each()
+            data = await this_testrun.run(self.launch) if self.launch else await this_testrun.run()
+            if not self.launch:
+                this_testrun.benchmark.after_each()
             if isinstance(data, list):
                 self.data.extend(data)
             else:
@@ -214,8 +226,9 @@ class SMIOverTimeTestRun():
         self.duration = 0
 
         measurements_string = ",".join(self.measurements)
-        self.smi_runstring = "nvidia-smi --query-gpu=timestamp,index,{measure} --loop-ms=1000 --format=csv,noheader,nounits"
-        self.smi_runcommand = self.smi_runstring.format(filename = self.filename, measure = measurements_string)
+        self.smi_runstring = "nvidia-smi --query-gpu=timestamp,index,{measure} --loop-ms={timescale} --format=csv,noheader,nounits"
+        self.smi_runcommand = self.smi_runstring.format(filename = self.filename, measure = measurements_string, \
+            timescale = int(self.timescale))
         self.bench_runcommand = self.benchmark.get_run_command()
         self.data = {   "benchmark_name":   self.benchmark.name, \
                         "benchmark_set":    self.benchmark_set, \
@@ -228,9 +241,14 @@ class SMIOverTimeTestRun():
                         }
 
     # TODO (zcornelius): Fix SMI to use as a process wrapper here, instead of system-wide
-    async def run(self):
+    @published
+    async def run(self, launch = None):
         """
         Call this to run this instance of NVIDIA SMI
+
+        :param launch: Shared launch to observe instead of launching the
+        benchmark, if any
+        :type launch: LaunchHandle()
         """
 
         # Run it
@@ -243,7 +261,13 @@ class SMIOverTimeTestRun():
         # Run benchmark
         print('Running command ' + self.bench_runcommand)
         starttime = datetime.datetime.now()
-        process = await asyncio.create_subprocess_shell(self.bench_runcommand, cwd=self.benchmark.cwd, env=self.benchmark.env)
+        if launch:
+            launch.attached()
+            await launch.wait_released()
+            starttime = datetime.datetime.fromtimestamp(launch.start_time)
+            process = launch.process
+        else:
+            process = await launch_benchmark(self.benchmark, self.bench_runcommand)
         await process.wait()
         # Old subprocess mechanism
         # process = subprocess.run(self.bench_runcommand, shell=True, executable="/bin/bash", cwd=self.benchmark.cwd, env=self.benchmark.env)
@@ -254,17 +278,30 @@ class SMIOverTimeTestRun():
         smi_data.close()
 
         # Collect data
+        # SMI timestamps are wall-clock strings; store seconds since the
+        # benchmark started, as the other Collectors do, dropping samples
+        # nvidia-smi took before then
         gpu_indices = set()
         with open(smi_filename, 'r') as csvfile:
             for line in csvfile:
                 line = line.strip().split(",")
                 if len(line) > 1:
-                    time = line[0]
+                    try:
+                        timestamp = datetime.datetime.strptime(line[0].strip(), "%Y/%m/%d %H:%M:%S.%f")
+                    except ValueError:
+                        continue
+                    time = (timestamp - starttime).total_seconds()
+                    if time < 0:
+                        continue
                     gpu_index = line[1].strip()
                     gpu_indices.add(gpu_index)
                     for i, measurement in enumerate(self.measurements):
                         key = "gpu_{index}_{measurement}".format(index = gpu_index, measurement = measurement)
-                        self.data.setdefault(key, []).append([time, float(line[i+2].strip())])
+                        try:
+                            value = float(line[i+2].strip())
+                        except ValueError:
+                            value = None
+                        self.data.setdefault(key, SampleBuffer()).append(time, value)
 
         # Clean up files
         os.remove(smi_filename)
@@ -272,7 +309,7 @@ class SMIOverTimeTestRun():
         self.duration = (endtime - starttime).total_seconds()
         self.data["duration"] = self.duration
 
-        return self.data
+        return samples_to_udf(self.data)
 
 
 class NsysTestRun():
@@ -397,7 +434,7 @@ class NsysTestRun():
                                }
         # Run it
         starttime = datetime.datetime.now()
-        process = await asyncio.create_subprocess_shell(self.runcommand, cwd=self.benchmark.cwd, env=self.benchmark.env)
+        process = await launch_benchmark(self.benchmark, self.runcommand)
         await process.wait()
         # process = subprocess.run(self.runcommand, shell=True, executable="/bin/bash", cwd=self.benchmark.cwd, env=self.benchmark.env)
         endtime = datetime.datetime.now()
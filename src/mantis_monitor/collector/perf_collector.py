@@ -30,19 +30,58 @@ Collectors could be based.
 
 
 #import logging
-import math
 import subprocess
 import asyncio
 import os
 import datetime
+import re
+import shlex
+import signal
 
 import pprint
 
-from mantis_monitor.collector.collector import Collector
+from mantis_monitor.collector.cgroup import Cgroup
+from mantis_monitor.collector.collector import Collector, SampleBuffer, launch_benchmark, published, samples_to_udf
+from mantis_monitor.collector.pmu import plan_counters
+from mantis_monitor.collector.profile import ProfileAggregator
 
 #logging.basicConfig(filename='testing.log', encoding='utf-8', \
 #    format='%(levelname)s:%(message)s', level=logging.DEBUG)
 
+async def wait_for_perf_events(pid, timeout = 5):
+    """
+    Wait until a perf process has opened its counters, seen as its
+    anon_inode:[perf_event] file descriptors, and stopped opening more
+
+    :param pid: PID of the perf process
+    :type pid: int
+    :param timeout: Seconds to wait at most
+    :type timeout: float
+
+    :return: True if the counters are open, False if perf exited or the
+    timeout passed first
+    :rtype: bool
+    """
+    fd_dir = "/proc/{}/fd".format(pid)
+    deadline = asyncio.get_running_loop().time() + timeout
+    last_count = 0
+    while asyncio.get_running_loop().time() < deadline:
+        count = 0
+        try:
+            for fd in os.listdir(fd_dir):
+                try:
+                    if os.readlink(os.path.join(fd_dir, fd)) == "anon_inode:[perf_event]":
+                        count += 1
+                except OSError:
+                    continue
+        except OSError:
+            return False   # perf has exited
+        if count and count == last_count:
+            return True
+        last_count = count
+        await asyncio.sleep(0.01)
+    return False
+
 class PerfCollector(Collector):
     """
     This is the implementation of the perf data collector.
@@ -60,14 +99,33 @@ class PerfCollector(Collector):
     :ivar data: Data from this Collector instance stored in the UDF
 
     :ivar counters: A list of perf counters to run, comes from Configuration()
-    :ivar pmu_count: The maximum number of perf counters to collect at once,
-    comes from Configuration()
+    :ivar pmu_count: The number of general-purpose PMU counters per core,
+    comes from Configuration(); fixed-counter, software and non-core events
+    do not count against it (see pmu.plan_counters())
+    :ivar streaming: Whether perf's output is read from a pipe while the
+    benchmark runs (the default), rather than from a file once it exits.
+    Set "streaming: false" under the perf collection mode to use a file.
+    :ivar single_run: Whether every counter is counted in one run of the
+    benchmark, with perf multiplexing the counters that do not fit the PMUs
+    at once, rather than one run per group of counters that do. Set
+    "single_run: true" under the perf collection mode to use it.
+    :ivar scope: What perf counts: "system" (the default, every CPU),
+    "process" (the benchmark's process tree) or "cgroup" (a cgroup the
+    benchmark is run in); see PerfTestRun()
+    :ivar record: Settings for one extra run of the benchmark under perf
+    record (see PerfRecordTestRun()), from "record:" under the perf
+    collection mode; None to only count
     :ivar timescale: The time between collections in MS, comes from Configuration()
     :ivar filename: A unique filename to use for intermediate data storage
     :ivar global_id: An int used to uniquely identify each PerfTestRun()
 
+    :cvar multiplexable: True; perf can be started before the benchmark in
+    any scope, so when all counters fit in one PerfTestRun it can count
+    alongside other Collectors on a shared launch
     """
 
+    multiplexable = True
+
     def __init__(self, configuration, iteration, benchmark, benchmark_set):
         """
         Init the object
@@ -92,6 +150,12 @@ class PerfCollector(Collector):
         self.iteration = iteration
         self.counters = configuration.perf_counters
         self.pmu_count = configuration.collector_modes["perf"]["pmu_count"]
+        self.streaming = configuration.collector_modes["perf"].get("streaming", True)
+        self.single_run = configuration.collector_modes["perf"].get("single_run", False)
+        self.record = configuration.collector_modes["perf"].get("record")
+        self.scope = configuration.collector_modes["perf"].get("scope", "system")
+        if self.scope not in PerfTestRun.scopes:
+            raise ValueError("Unknown perf scope {!r}, expected one of {}".format(self.scope, ", ".join(PerfTestRun.scopes)))
         self.timescale = configuration.timescale # note this needs to be ms, same as configuration file
         self.testruns = []
         self.filename = "{testname}-iteration_{iter_count}-benchmark_{benchstring}-set_{benchsetstring}-perfrun_{{perfrun_count}}".format(testname = configuration.test_name, \
@@ -109,34 +173,57 @@ class PerfCollector(Collector):
         :return: None
         """
 
-        num_perf_counters = len(self.counters)
-        num_perf_testruns = math.ceil(num_perf_counters / self.pmu_count)
-
-        for i in range(0, num_perf_testruns):
+        # Counters which share no PMU counters with the others are packed
+        # together, so the benchmark is run as few times as possible; in a
+        # single run, perf time-slices them all on the counters instead
+        if not self.counters:
+            plan = []
+        elif self.single_run:
+            plan = [self.counters]
+        else:
+            plan = plan_counters(tuple(self.counters), self.pmu_count)
+        for i, counters in enumerate(plan):
             # NOTE - name is currently just the perf iteration count, make this meaningful later if needed
-            start = i * self.pmu_count
-            stop = min(num_perf_counters, ((i+1) * self.pmu_count))
-            counters_list = self.counters[start:stop]
+            counters_list = list(counters)
             current_filename = self.filename.format(perfrun_count = i)
             name = "_".join([self.name, str(self.global_ID)])
             current_testrun = PerfTestRun(name, counters_list, self.timescale,\
-                self.benchmark, current_filename, self.iteration, self.benchmark_set)
+                self.benchmark, current_filename, self.iteration, self.benchmark_set, self.streaming, self.scope)
             self.testruns.append(current_testrun)
 
             self.global_ID = self.global_ID + 1
 
+        if self.record is not None:
+            name = "_".join([self.name, "record", str(self.global_ID)])
+            current_filename = self.filename.format(perfrun_count = "record") + ".data"
+            self.testruns.append(PerfRecordTestRun(name, self.record or {}, self.timescale, \
+                self.benchmark, current_filename, self.iteration, self.benchmark_set, self.streaming))
+            self.global_ID = self.global_ID + 1
+
+    def can_attach(self):
+        """
+        Check whether this instance can run on a shared launch: perf record
+        launches the benchmark itself, so only a single PerfTestRun() can
+
+        :return: True if run_all() can be stepped once with self.launch set
+        :rtype: bool
+        """
+        return Collector.can_attach(self) and isinstance(self.testruns[0], PerfTestRun)
+
     async def run_all(self):
         """
-        Runs all PerfTestRun() instances for this Benchmark()
+        Runs all PerfTestRun() and PerfRecordTestRun() instances for this Benchmark()
 
         :return: None, yielded for each invocation of the Benchmark associated
         with this Collector instance
 
         """
         for this_testrun in self.testruns:
-            this_testrun.benchmark.before_each()
-            data = await this_testrun.run()
-            this_testrun.benchmark.after_each()
+            if not self.launch:
+                this_testrun.benchmark.before_each()
+            data = await this_testrun.run(self.launch)
+            if not self.launch:
+                this_testrun.benchmark.after_each()
             self.data.append(data)
             yield
 
@@ -149,22 +236,44 @@ class PerfTestRun():
     Since many counters and metrics can be requested by the user, it's likely
     useful to call Perf many times to avoid thrashing against stored measurements.
 
-    Perf is thus called (num requested measurements) / (pmu_count) times.
+    Perf is thus called once per group of counters that fits the PMUs at
+    once, with at most pmu_count general-purpose counters (see pmu.py).
 
     :ivar name: This PerfTestRun()'s unique name (using global_id)
-    :ivar counters: A list of perf counters to run, length is <= pmu_count
+    :ivar counters: A list of perf counters to run, fitting the PMUs at once
     :ivar timescale: The time between collections in MS, comes from Configuration()
     :ivar filename: A unique filename to use for intermediate data storage
     :ivar benchmark: Benchmark class this Collector is initiated against
     :ivar benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
     :ivar iteration: The statistical or experimental iteration
+    :ivar streaming: Whether to read Perf's output from a pipe as it is written
+    :ivar scope: What Perf counts, one of scopes
+    :ivar cgroup: The Cgroup() the benchmark runs in, with the "cgroup" scope
     :ivar runstring: The command string for running Perf
     :ivar counters_string: A string-ified version of the counters to use
     in this instance of Perf
     :ivar runcommand: The actual command to run (including Benchmark() entanglement)
+    when writing to a file; streaming runs fill in the pipe with --log-fd
+    :ivar time_offset: Seconds subtracted from Perf's interval times, so that
+    on a shared launch they count from the benchmark's start, not Perf's
     :ivar data: The data collected during this instance of Perf
     :ivar duration: The duration which this instance of Perf ran for
 
+    In the "system" scope Perf counts every CPU (-a), so co-running
+    benchmarks all see the same counts. In the "process" scope it counts the
+    benchmark's process tree only, with counters inherited by every child;
+    on a shared launch it attaches to the benchmark's shell (-p) before the
+    benchmark starts. In the "cgroup" scope the benchmark runs in its own
+    Cgroup(), which Perf counts on every CPU (-a -G), including processes
+    which leave the benchmark's tree, ex daemons.
+
+    Perf's counts are estimates when it has to multiplex: a counter which
+    was only scheduled for part of an interval is scaled up by perf to the
+    whole interval (count * time enabled / time running). Alongside each
+    counter, "<counter>_multiplex_ratio" holds the fraction of the interval
+    it was actually counted (time running / time enabled); 1.0 means the
+    count is exact, and count * ratio recovers the raw count.
+
     The format of stored data is as follows (in a dictionary):
     - "benchmark_name": self.benchmark.name,
     - "benchmark_set":  self.benchmark_set,
@@ -175,31 +284,48 @@ class PerfTestRun():
     - "measurements":   self.counters,
     - "duration":       0,
     """
-    def __init__(self, name, counters, timescale, benchmark, filename, iteration, benchmark_set):
+    scopes = ("system", "process", "cgroup")
+
+    def __init__(self, name, counters, timescale, benchmark, filename, iteration, benchmark_set, streaming = False, \
+            scope = "system"):
         """
         Init this PerfTestRun()
 
         :param name: This PerfTestRun()'s unique name (using global_id)
-        :param counters: A list of perf counters to run, length is <= pmu_count
+        :param counters: A list of perf counters to run, fitting the PMUs at once
         :param timescale: The time between collections in MS, comes from Configuration()
         :param filename: A unique filename to use for intermediate data storage
         :param benchmark: Benchmark class this Collector is initiated against
         :param benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
         :param iteration: The statistical or experimental iteration
+        :param streaming: Read Perf's output from a pipe as it is written,
+        instead of from filename once Perf exits
+        :param scope: What Perf counts, one of scopes
 
         :return: None
         """
         self.name = name
         self.counters = counters
+        self.streaming = streaming
+        self.scope = scope
+        self.cgroup = Cgroup(name) if scope == "cgroup" else None
         self.timescale = timescale
         self.benchmark = benchmark
         self.benchmark_set = benchmark_set
         self.filename = filename
         self.iteration = iteration
-        self.runstring = "perf stat -x , -a -e {} -I {} -o {} {}"
+        # -G applies to the events before it
+        target, events = {"system": ("-a ", "{}"), "process": ("", "{}"), \
+            "cgroup": ("-a ", "{} -G " + (self.cgroup.path if self.cgroup else ""))}[scope]
+        self.runstring = "perf stat -x , " + target + "-e " + events + " -I {} -o {} {}"
+        self.streamstring = "perf stat -x , " + target + "-e " + events + " -I {} --log-fd {{fd}} {}"
         self.counters_string = ",".join(self.counters)
-        self.runcommand = self.runstring.format(self.counters_string, self.timescale, self.filename, \
-            self.benchmark.get_run_command())
+        workload = self.benchmark.get_run_command()
+        if self.cgroup:
+            workload = self.cgroup.wrap(workload)
+        self.runcommand = self.runstring.format(self.counters_string, self.timescale, self.filename, workload)
+        self.streamcommand = self.streamstring.format(self.counters_string, self.timescale, workload)
+        self.time_offset = 0
         self.data = {
             "benchmark_name": self.benchmark.name,
             "benchmark_set":  self.benchmark_set,
@@ -212,26 +338,135 @@ class PerfTestRun():
         }
         self.duration = None
         for counter in self.counters:
-            self.data[counter] = []
+            self.data[counter] = SampleBuffer()
+            self.data[counter + "_multiplex_ratio"] = SampleBuffer()
+
+    def parse_line(self, line):
+        """
+        Parse one line of "perf stat -x ," interval output into the sample buffers
+
+        Comment lines and blank lines are skipped; a counter perf could not
+        read (ex, "<not counted>") is stored as a missing value. Perf may
+        print an event with a modifier the config did not give (ex, "cycles:u"
+        when it falls back to counting user space only); the modifier is
+        dropped, and lines for events not counted at all are skipped. The line's
+        running-time percentage is stored as the counter's multiplex ratio;
+        when counting a cgroup (-G), perf prints the cgroup's name after the
+        event's, so the percentage is one column later.
+
+        :param line: One line of Perf output
+        :type line: str
+
+        :return: None
+        """
+        line = line.strip().split(",")
+        if len(line) > 1 and "#" not in line[0]:
+            time = float(line[0]) - self.time_offset
+            measurement_name = line[3]
+            if measurement_name not in self.data:
+                name, _, modifiers = measurement_name.rpartition(":")
+                if name not in self.counters or not re.match(r"^[ukhGHpP]+$", modifiers):
+                    return
+                measurement_name = name
+            try:
+                measurement_value = float(line[1])
+            except ValueError:
+                measurement_value = None
+            try:
+                ratio = float(line[6 if self.cgroup else 5]) / 100
+            except (ValueError, IndexError):
+                ratio = None
+            self.data[measurement_name].append(time, measurement_value)
+            self.data[measurement_name + "_multiplex_ratio"].append(time, ratio)
+
+    async def observe(self, perf, launch):
+        """
+        Count a shared launch with a Perf started without a workload: once
+        its counters are open, attach to the launch, wait for the benchmark
+        to exit, then stop Perf, which counts until interrupted
+
+        :param perf: The running Perf process
+        :type perf: asyncio.subprocess.Process
+        :param launch: The shared launch
+        :type launch: LaunchHandle()
+
+        :return: The benchmark's process
+        :rtype: asyncio.subprocess.Process
+        """
+        perf_started = datetime.datetime.now()
+        try:
+            if not await wait_for_perf_events(perf.pid):
+                print("{}: perf has not opened its counters, starting the benchmark anyway".format(self.name))
+            if self.cgroup:
+                self.cgroup.add(launch.pid)
+            launch.attached()
+            await launch.wait_released()
+            self.time_offset = launch.start_time - perf_started.timestamp()
+            await launch.process.wait()
+        finally:
+            if perf.returncode is None:
+                perf.send_signal(signal.SIGINT)
+        await perf.wait()
+        return launch.process
+
+    def attach_target(self, launch):
+        """
+        Say what Perf counts on a shared launch, in place of a workload
+
+        :param launch: The shared launch
+        :type launch: LaunchHandle()
+
+        :return: Perf options, ex "-p <pid>"
+        :rtype: str
+        """
+        if self.scope == "process":
+            return "-p {}".format(launch.pid)
+        return ""
 
-    async def run(self):
+    @published
+    async def run(self, launch = None):
+        """
+        Call this to run this instance of Perf, in its cgroup if it has one
+
+        :param launch: Shared launch to count instead of launching the
+        benchmark, if any
+        :type launch: LaunchHandle()
+        """
+        if self.cgroup:
+            self.cgroup.create()
+        try:
+            if self.streaming:
+                return await self.run_streaming(launch)
+            return await self.run_file(launch)
+        finally:
+            if self.cgroup:
+                self.cgroup.remove()
+
+    async def run_file(self, launch = None):
         """
-        Call this to run this instance of Perf
+        Run Perf with its output written to filename, read once it exits
 
         This involves:
         - Creating a subprocess shell with the runcommand
         - Passing in any environment or working directory for the associated Benchmark()
-        - Waiting for this subprocess to complete
+        - Waiting for the subprocess to complete and reading its output file
         - Storing the runtime (duration)
-        - Postprocessing the resulting data
-        - Removing lingering files from collecting data
+
+        Given a LaunchHandle(), Perf is instead started without a workload
+        and counts the shared launch (see observe()).
         """
         # Run it
         #logging.info("running following command:")
         #logging.info(self.runcommand)
 
         starttime = datetime.datetime.now()
-        process = await asyncio.create_subprocess_shell(self.runcommand, cwd=self.benchmark.cwd, env=self.benchmark.env)
+        if launch:
+            process = await self.observe(await launch_benchmark(self.benchmark, \
+                "exec " + self.runstring.format(self.counters_string, self.timescale, self.filename, \
+                self.attach_target(launch))), launch)
+            starttime = datetime.datetime.fromtimestamp(launch.start_time)
+        else:
+            process = await launch_benchmark(self.benchmark, self.runcommand)
         await process.wait()
         # process = subprocess.run(self.runcommand, shell=True, cwd=self.benchmark.cwd, env=self.benchmark.env)
         endtime = datetime.datetime.now()
@@ -245,21 +480,13 @@ class PerfTestRun():
             print('Oops, bad data...')
             #print(process.stderr)
             # is it really a good idea to just drop this?
-            return self.data
+            return samples_to_udf(self.data)
 
         # Collect data
         with open(os.path.join((self.benchmark.cwd or ''), self.filename), 'r') as csvfile:
         #with open(self.filename, 'r') as csvfile:
             for line in csvfile:
-                line = line.strip().split(",")
-                if len(line) > 1 and "#" not in line[0]:
-                    time = float(line[0])
-                    measurement_name = line[3]
-                    try:
-                        measurement_value = float(line[1])
-                    except ValueError:
-                        measurement_value = None
-                    self.data[measurement_name].append([time, measurement_value])
+                self.parse_line(line)
 
         # Clean up files
         #os.remove(self.filename)
@@ -267,8 +494,242 @@ class PerfTestRun():
 
         self.data["duration"] = (endtime - starttime).total_seconds()
 
-        return self.data
+        return samples_to_udf(self.data)
+
+    async def run_streaming(self, launch = None):
+        """
+        Run Perf with its output sent down a pipe (--log-fd), parsing each
+        interval into the sample buffers as it arrives
+
+        Nothing is written to disk, and samples are available while the
+        benchmark is still running.
+
+        :param launch: Shared launch to count instead of launching the
+        benchmark, if any
+        :type launch: LaunchHandle()
+        """
+        read_fd, write_fd = os.pipe()
+        starttime = datetime.datetime.now()
+        try:
+            if launch:
+                # exec, so that the PID is Perf's own, for observe()
+                command = "exec " + self.streamstring.format(self.counters_string, self.timescale, \
+                    self.attach_target(launch)).format(fd = write_fd)
+            else:
+                command = self.streamcommand.format(fd = write_fd)
+            process = await launch_benchmark(self.benchmark, command, pass_fds = (write_fd,))
+        except BaseException:
+            os.close(read_fd)
+            raise
+        finally:
+            # Only Perf (and the benchmark it starts) holds the write end now
+            os.close(write_fd)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), \
+            os.fdopen(read_fd, "rb", 0))
+
+        async def read_samples():
+            async for line in reader:
+                self.parse_line(line.decode(errors = "replace"))
+
+        reading = asyncio.create_task(read_samples())
+        try:
+            if launch:
+                process = await self.observe(process, launch)
+                starttime = datetime.datetime.fromtimestamp(launch.start_time)
+            await process.wait()
+            endtime = datetime.datetime.now()
+            # Perf has written its last interval; anything the benchmark left
+            # running in the background may keep the pipe open, so don't wait
+            # for end-of-file forever
+            try:
+                await asyncio.wait_for(asyncio.shield(reading), 1)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            reading.cancel()
+            transport.close()
+
+        if process.returncode != 0:
+            print('Oops, bad data...')
+            return samples_to_udf(self.data)
+
+        self.data["duration"] = (endtime - starttime).total_seconds()
+
+        return samples_to_udf(self.data)
 # --- End test run for perf
 
+# --- Begin test run for perf record
+class PerfRecordTestRun():
+    """
+    Runs the benchmark once under perf record, and folds the samples into
+    per-symbol, per-DSO and folded-stack histograms (see ProfileAggregator())
+    as perf script reads them back
+
+    Only the histograms' largest entries are stored, never the samples. By
+    default perf record writes down a pipe straight into perf script, so
+    no perf.data is written; with "streaming: false" it writes a perf.data
+    file, which perf script reads once the benchmark exits and which is
+    then removed. Either way the output is parsed a line at a time.
+
+    Settings, under "record:" in the perf collection mode:
+    - frequency: Samples per second (perf record -F), default 99
+    - call_graph: fp, dwarf or lbr (perf record --call-graph), default fp;
+      false for leaf frames only
+    - top: How many entries of each histogram to store, default 100
+    - max_keys: Most distinct entries counted per histogram, default 10000
+
+    :ivar name: This PerfRecordTestRun()'s unique name
+    :ivar frequency: Samples per second
+    :ivar call_graph: perf record's call graph mode, or None
+    :ivar top: How many entries of each histogram are stored
+    :ivar timescale: The time between collections in MS, comes from Configuration()
+    :ivar benchmark: Benchmark class this Collector is initiated against
+    :ivar filename: perf.data file to use when not streaming
+    :ivar iteration: The statistical or experimental iteration
+    :ivar benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+    :ivar streaming: Whether perf record writes down a pipe, rather than to filename
+    :ivar aggregator: The ProfileAggregator() counting the samples
+    :ivar data: The data collected during this run
+
+    The format of stored data is as follows (in a dictionary):
+    - "units":          "samples",
+    - "measurements":   ["symbols", "dsos", "stacks"],
+    - "samples":        total samples counted,
+    - "symbols":        [[symbol, samples], ...], largest first,
+    - "dsos":           [[dso, samples], ...], largest first,
+    - "stacks":         [["comm;root;...;leaf", samples], ...], largest first,
+    - "duration":       runtime of the benchmark,
+    plus the usual benchmark_name, benchmark_set, collector_name, iteration
+    and timescale.
+    """
+
+    scriptstring = "perf script -F comm,ip,sym,dso"
+
+    def __init__(self, name, settings, timescale, benchmark, filename, iteration, benchmark_set, streaming = True):
+        """
+        Init this PerfRecordTestRun()
+
+        :param name: This PerfRecordTestRun()'s unique name
+        :param settings: The "record:" settings, see above
+        :param timescale: The time between collections in MS, comes from Configuration()
+        :param benchmark: Benchmark class this Collector is initiated against
+        :param filename: perf.data file to use when not streaming
+        :param iteration: The statistical or experimental iteration
+        :param benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+        :param streaming: Send perf record's output down a pipe instead of to filename
+
+        :return: None
+        """
+        self.name = name
+        self.frequency = int(settings.get("frequency", 99))
+        self.call_graph = settings.get("call_graph", "fp") or None
+        self.top = int(settings.get("top", 100))
+        self.timescale = timescale
+        self.benchmark = benchmark
+        self.filename = filename
+        self.iteration = iteration
+        self.benchmark_set = benchmark_set
+        self.streaming = streaming
+        self.aggregator = ProfileAggregator(int(settings.get("max_keys", 10000)))
+        self.data = {
+            "benchmark_name": self.benchmark.name,
+            "benchmark_set":  self.benchmark_set,
+            "collector_name": self.name,
+            "iteration":      self.iteration,
+            "timescale":      self.timescale,
+            "units":          "samples",
+            "measurements":   ["symbols", "dsos", "stacks"],
+            "duration":       0,
+        }
+
+    def record_command(self, output):
+        """
+        Build the perf record command line
+
+        :param output: Where perf record writes, a file name or "-" for stdout
+        :type output: str
+
+        :return: The command, still to be followed by the workload
+        :rtype: str
+        """
+        command = "perf record -q -F {} -o {}".format(self.frequency, shlex.quote(output))
+        if self.call_graph:
+            command += " --call-graph {}".format(self.call_graph)
+        return command
+
+    async def read_script(self, stream):
+        """
+        Feed perf script output to the aggregator until end-of-file
+
+        :param stream: perf script's output
+        :type stream: asyncio.StreamReader
+
+        :return: None
+        """
+        async for line in stream:
+            self.aggregator.feed(line.decode(errors = "replace"))
+        self.aggregator.flush()
+
+    @published
+    async def run(self, launch = None):
+        """
+        Call this to run the benchmark under perf record and aggregate its
+        samples
+
+        :param launch: Unused; perf record always launches the benchmark
+        :type launch: LaunchHandle()
+        """
+        starttime = datetime.datetime.now()
+        if self.streaming:
+            read_fd, write_fd = os.pipe()
+            # The workload's stdout would corrupt perf record's, so it is sent
+            # to stderr; perf record's output goes down the pipe to perf script
+            workload = "/bin/sh -c {}".format(shlex.quote("{{ {}\n}} 1>&2".format(self.benchmark.get_run_command())))
+            try:
+                process = await launch_benchmark(self.benchmark, "{} -- {}".format(self.record_command("-"), \
+                    workload), stdout = write_fd)
+                try:
+                    script = await asyncio.create_subprocess_exec(*shlex.split(self.scriptstring), "-i", "-", \
+                        stdin = read_fd, stdout = asyncio.subprocess.PIPE, limit = 2**20)
+                except BaseException:
+                    process.kill()
+                    await process.wait()
+                    raise
+            finally:
+                # Only perf record and perf script hold the pipe now
+                os.close(read_fd)
+                os.close(write_fd)
+            await asyncio.gather(self.read_script(script.stdout), process.wait(), script.wait())
+            endtime = datetime.datetime.now()
+            if script.returncode != 0:
+                print("Oops, perf script exited with {}".format(script.returncode))
+        else:
+            path = os.path.join((self.benchmark.cwd or ''), self.filename)
+            process = await launch_benchmark(self.benchmark, "{} -- {}".format( \
+                self.record_command(self.filename), self.benchmark.get_run_command()))
+            await process.wait()
+            endtime = datetime.datetime.now()
+            if process.returncode == 0:
+                script = await asyncio.create_subprocess_exec(*shlex.split(self.scriptstring), "-i", path, \
+                    stdout = asyncio.subprocess.PIPE, limit = 2**20)
+                await self.read_script(script.stdout)
+                await script.wait()
+            if os.path.exists(path):
+                os.remove(path)
+
+        if process.returncode != 0:
+            print('Oops, bad data...')
+
+        self.data["duration"] = (endtime - starttime).total_seconds()
+        self.data["samples"] = self.aggregator.samples
+        self.data["symbols"] = self.aggregator.top(self.aggregator.symbols, self.top)
+        self.data["dsos"] = self.aggregator.top(self.aggregator.dsos, self.top)
+        self.data["stacks"] = self.aggregator.top(self.aggregator.stacks, self.top)
+        return self.data
+# --- End test run for perf record
+
 
 Collector.register_collector("perf", PerfCollector)
@@ -0,0 +1,292 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains a ctypes binding of perf_event_open(2), used by the
+PerfEventCollector to count events without the perf binary.
+
+resolve_event() turns a perf event name into a perf_event_attr type and
+config; it knows perf's generic hardware, software and cache event names,
+raw rNNNN events and pmu/term=value,.../ events (from the PMU's sysfs
+format files). CounterGroup opens a list of them as one group on a
+process, inherited by every child it starts, and reads the whole group
+with one read() of the leader (PERF_FORMAT_GROUP), into a preallocated
+buffer.
+
+rdpmc and the mmap'd perf_event_mmap_page read a counter from user space
+without a syscall, but only for the task doing the reading: the counter
+must be live on the CPU the reader runs on. mantis-monitor counts another
+process tree, whose counters are only live while the benchmark runs, so
+they are read with read(), at one syscall per group per sample.
+
+Software events (task-clock, page-faults, context-switches, ...) need no
+PMU and, with kernel counting excluded, no privileges beyond
+perf_event_paranoid <= 2, the usual default.
+"""
+
+import ctypes
+import errno
+import fcntl
+import os
+import platform
+import re
+import struct
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+PERF_TYPE_HW_CACHE = 3
+PERF_TYPE_RAW = 4
+
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1
+PERF_FORMAT_TOTAL_TIME_RUNNING = 2
+PERF_FORMAT_ID = 4
+PERF_FORMAT_GROUP = 8
+
+PERF_EVENT_IOC_ENABLE = 0x2400
+PERF_EVENT_IOC_DISABLE = 0x2401
+PERF_IOC_FLAG_GROUP = 1
+
+PERF_FLAG_FD_CLOEXEC = 8
+
+# perf_event_attr flag bits
+DISABLED = 1 << 0
+INHERIT = 1 << 1
+EXCLUDE_USER = 1 << 4
+EXCLUDE_KERNEL = 1 << 5
+EXCLUDE_HV = 1 << 6
+
+SYSCALL_NUMBERS = {"x86_64": 298, "i386": 336, "i686": 336, "aarch64": 241, "armv7l": 364, \
+    "ppc64le": 319, "ppc64": 319, "s390x": 331, "riscv64": 241}
+
+HARDWARE_EVENTS = {"cpu-cycles": 0, "cycles": 0, "instructions": 1, "cache-references": 2, "cache-misses": 3, \
+    "branch-instructions": 4, "branches": 4, "branch-misses": 5, "bus-cycles": 6, \
+    "stalled-cycles-frontend": 7, "idle-cycles-frontend": 7, "stalled-cycles-backend": 8, \
+    "idle-cycles-backend": 8, "ref-cycles": 9}
+
+SOFTWARE_EVENTS = {"cpu-clock": 0, "task-clock": 1, "page-faults": 2, "faults": 2, "context-switches": 3, \
+    "cs": 3, "cpu-migrations": 4, "migrations": 4, "minor-faults": 5, "major-faults": 6, \
+    "alignment-faults": 7, "emulation-faults": 8, "dummy": 9, "cgroup-switches": 11}
+
+CACHES = {"L1-dcache": 0, "L1-icache": 1, "LLC": 2, "dTLB": 3, "iTLB": 4, "branch": 5, "node": 6}
+CACHE_OPS = {"load": 0, "store": 1, "prefetch": 2}
+
+_CACHE_EVENT = re.compile(r"^({})-(load|store|prefetch)(s|-misses)$".format("|".join(re.escape(cache) for cache in CACHES)))
+
+class PerfEventAttr(ctypes.Structure):
+    """
+    struct perf_event_attr, as of PERF_ATTR_SIZE_VER5; the kernel accepts
+    any size it knows, and newer fields default to zero
+    """
+    _fields_ = [("type", ctypes.c_uint32), ("size", ctypes.c_uint32), ("config", ctypes.c_uint64), \
+        ("sample_period", ctypes.c_uint64), ("sample_type", ctypes.c_uint64), ("read_format", ctypes.c_uint64), \
+        ("flags", ctypes.c_uint64), ("wakeup_events", ctypes.c_uint32), ("bp_type", ctypes.c_uint32), \
+        ("config1", ctypes.c_uint64), ("config2", ctypes.c_uint64), ("branch_sample_type", ctypes.c_uint64), \
+        ("sample_regs_user", ctypes.c_uint64), ("sample_stack_user", ctypes.c_uint32), ("clockid", ctypes.c_int32), \
+        ("sample_regs_intr", ctypes.c_uint64), ("aux_watermark", ctypes.c_uint32), \
+        ("sample_max_stack", ctypes.c_uint16), ("reserved_2", ctypes.c_uint16)]
+
+_libc = ctypes.CDLL(None, use_errno = True)
+
+def perf_event_open(attr, pid, cpu = -1, group_fd = -1, flags = PERF_FLAG_FD_CLOEXEC):
+    """
+    Call perf_event_open(2)
+
+    :param attr: The event
+    :type attr: PerfEventAttr()
+    :param pid: Process to count, 0 for this one
+    :type pid: int
+    :param cpu: CPU to count on, -1 for any
+    :type cpu: int
+    :param group_fd: The group leader's file descriptor, -1 for a new group
+    :type group_fd: int
+    :param flags: PERF_FLAG_* flags
+    :type flags: int
+
+    :return: The event's file descriptor
+    :rtype: int
+    :raises OSError: if the event cannot be opened
+    """
+    number = SYSCALL_NUMBERS.get(platform.machine())
+    if number is None:
+        raise OSError(errno.ENOSYS, "perf_event_open syscall number unknown on " + platform.machine())
+    fd = _libc.syscall(number, ctypes.byref(attr), pid, cpu, group_fd, flags)
+    if fd < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return fd
+
+def _pmu_config(pmu, terms, sysfs):
+    """
+    Encode pmu/term=value,.../ with the PMU's sysfs format files
+    """
+    directory = os.path.join(sysfs, pmu)
+    with open(os.path.join(directory, "type")) as type_file:
+        event_type = int(type_file.read())
+    configs = {"config": 0, "config1": 0, "config2": 0}
+    for term in terms.split(","):
+        if not term:
+            continue
+        name, _, value = term.partition("=")
+        if not value:
+            # An alias, ex cpu/cycles/, is itself a list of terms
+            with open(os.path.join(directory, "events", name)) as alias:
+                sub_type, sub_configs = _pmu_config(pmu, alias.read().strip(), sysfs)
+            for key in configs:
+                configs[key] |= sub_configs[key]
+            continue
+        with open(os.path.join(directory, "format", name)) as format_file:
+            field, _, bits = format_file.read().strip().partition(":")
+        value = int(value, 0)
+        for bit_range in bits.split(","):
+            low, _, high = bit_range.partition("-")
+            low = int(low)
+            width = int(high or low) - low + 1
+            configs[field] |= (value & ((1 << width) - 1)) << low
+            value >>= width
+    return event_type, configs
+
+def resolve_event(event, sysfs = "/sys/bus/event_source/devices"):
+    """
+    Turn a perf event name into perf_event_attr settings
+
+    :param event: The event, as given to perf stat -e, with optional :u, :k
+    or :h modifiers
+    :type event: str
+    :param sysfs: Where to find the PMUs' type and format files
+    :type sysfs: str
+
+    :return: dict of PerfEventAttr() fields: type, config, config1, config2
+    and flags
+    :rtype: dict
+    :raises ValueError: if the event is not one this binding can encode
+    """
+    name, _, modifiers = event.rpartition(":")
+    if not name or not re.match(r"^[ukh]+$", modifiers):
+        name, modifiers = event, ""
+    flags = 0
+    if modifiers:
+        flags |= (0 if "u" in modifiers else EXCLUDE_USER) | (0 if "k" in modifiers else EXCLUDE_KERNEL) \
+            | (0 if "h" in modifiers else EXCLUDE_HV)
+
+    attr = {"config1": 0, "config2": 0, "flags": flags}
+    cache = _CACHE_EVENT.match(name)
+    if name in HARDWARE_EVENTS:
+        attr.update(type = PERF_TYPE_HARDWARE, config = HARDWARE_EVENTS[name])
+    elif name in SOFTWARE_EVENTS:
+        attr.update(type = PERF_TYPE_SOFTWARE, config = SOFTWARE_EVENTS[name])
+    elif cache:
+        attr.update(type = PERF_TYPE_HW_CACHE, config = CACHES[cache.group(1)] | (CACHE_OPS[cache.group(2)] << 8) \
+            | ((1 if cache.group(3) == "-misses" else 0) << 16))
+    elif re.match(r"^r[0-9a-fA-F]+$", name):
+        attr.update(type = PERF_TYPE_RAW, config = int(name[1:], 16))
+    elif re.match(r"^[\w.-]+/[^/]*/$", name):
+        pmu, _, terms = name.rstrip("/").partition("/")
+        try:
+            event_type, configs = _pmu_config(pmu, terms, sysfs)
+        except (OSError, ValueError) as error:
+            raise ValueError("Cannot encode perf event {}: {}".format(event, error)) from error
+        attr.update(configs, type = event_type)
+    else:
+        raise ValueError("perf event {} is not supported by the perf_event collector; " \
+            "use the perf collector for it".format(event))
+    return attr
+
+class CounterGroup():
+    """
+    One group of counters on one process tree, read together
+
+    :ivar events: The events' names, in read order
+    :type events: list
+    :ivar fds: The events' file descriptors, the leader first
+    :type fds: list
+    :ivar buffer: Preallocated buffer each read() fills
+    :type buffer: bytearray
+    :ivar layout: struct layout of the read: nr, time enabled, time running,
+    then value and id per event
+    :type layout: struct.Struct
+    """
+
+    def __init__(self, events, pid, exclude_kernel = False, sysfs = "/sys/bus/event_source/devices"):
+        """
+        Open the group, disabled; nothing is counted until enable()
+
+        :param events: perf event names
+        :type events: list
+        :param pid: Process whose tree is counted; its future children
+        inherit the counters
+        :type pid: int
+        :param exclude_kernel: Count user space only, for every event
+        without explicit modifiers
+        :type exclude_kernel: bool
+        :param sysfs: Where to find the PMUs' type and format files
+        :type sysfs: str
+
+        :return: None
+        :raises OSError: if an event cannot be opened
+        :raises ValueError: if an event cannot be encoded
+        """
+        self.events = list(events)
+        self.fds = []
+        read_format = PERF_FORMAT_GROUP | PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING \
+            | PERF_FORMAT_ID
+        try:
+            for event in self.events:
+                settings = resolve_event(event, sysfs)
+                flags = settings.pop("flags") | INHERIT
+                if exclude_kernel and not flags & (EXCLUDE_USER | EXCLUDE_KERNEL | EXCLUDE_HV):
+                    flags |= EXCLUDE_KERNEL | EXCLUDE_HV
+                if not self.fds:
+                    flags |= DISABLED
+                attr = PerfEventAttr(size = ctypes.sizeof(PerfEventAttr), read_format = read_format, \
+                    flags = flags, **settings)
+                self.fds.append(perf_event_open(attr, pid, -1, self.fds[0] if self.fds else -1))
+        except BaseException:
+            self.close()
+            raise
+        self.layout = struct.Struct("=3Q" + "2Q" * len(self.events))
+        self.buffer = bytearray(self.layout.size)
+
+    def enable(self):
+        """
+        Start counting every event of the group
+
+        :return: None
+        """
+        fcntl.ioctl(self.fds[0], PERF_EVENT_IOC_ENABLE, PERF_IOC_FLAG_GROUP)
+
+    def read(self):
+        """
+        Read every event of the group with one syscall
+
+        :return: (time enabled ns, time running ns, [count, ...]) with the
+        counts in the order of events
+        :rtype: tuple
+        """
+        os.readv(self.fds[0], (self.buffer,))
+        values = self.layout.unpack_from(self.buffer)
+        return values[1], values[2], values[3::2]
+
+    def close(self):
+        """
+        Close every event of the group
+
+        :return: None
+        """
+        for fd in reversed(self.fds):
+            os.close(fd)
+        self.fds = []
+
+__all__ = ['CounterGroup', 'PerfEventAttr', 'perf_event_open', 'resolve_event']
@@ -0,0 +1,298 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the implementation of the PerfEvent Collector, which
+counts perf events on the benchmark's process tree with perf_event_open(2)
+directly (see perf_event.py), instead of through the perf binary.
+
+No process is started besides the benchmark, nothing depends on the perf
+version installed, and counts go from the kernel into SampleBuffers without
+any text in between. The benchmark is held at a gate (see LaunchHandle)
+while the counters are opened on its shell, so its children all inherit
+them from the first instruction.
+
+Counters are grouped as they fit the PMUs (see pmu.py), and every group is
+counted in the same run; groups the PMUs cannot hold at once are
+time-sliced by the kernel, which shows in each counter's multiplex ratio.
+"""
+
+import errno
+
+from mantis_monitor.collector.collector import Collector, OverheadRecorder, PeriodicSampler, SampleBuffer, published, samples_to_udf, watch_exit
+from mantis_monitor.collector.launch import LaunchHandle
+from mantis_monitor.collector.perf_event import CounterGroup, resolve_event
+from mantis_monitor.collector.pmu import PMUTopology
+
+class PerfEventCollector(Collector):
+    """
+    This is the implementation of the perf_event data collector
+
+    Configured under "perf_event" in collection_modes, either as a list
+    (informational, as for utilization) or with any of:
+    - counters: perf events to count, default the top-level perf_counters
+    - pmu_count: General-purpose counters per core, default 4
+
+    :ivar name: PerfEventCollector
+    :ivar description: Describes this collector
+    :ivar benchmark: Benchmark class this Collector is initiated against
+    :ivar benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+    :ivar iteration: The statistical or experimental iteration
+    :ivar data: Data from this Collector instance stored in the UDF
+    :ivar counters: perf events to count
+    :ivar groups: counters, packed into groups which fit the PMUs at once
+    :ivar timescale: The time between collections in MS, comes from Configuration()
+    :ivar overhead: Whether to record the cost of each sample, comes from Configuration()
+
+    :cvar exclusive: False, only the benchmark's own process tree is counted
+    :cvar multiplexable: True, the counters only need the benchmark's PID
+    """
+
+    exclusive = False
+    multiplexable = True
+
+    def __init__(self, configuration, iteration, benchmark, benchmark_set):
+        """
+        Init the object
+
+        :param configuration: Configuration object from this mantis-monitor instance
+        :type configuration: Configuration()
+        :param iteration: The current experimental iteration
+        :type iteration: int
+        :param benchmark: Benchmark class this Collector is initiated against
+        :type benchmark: Benchmark()
+        :param benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+        :type benchmark_set: str
+
+        :return: None
+        """
+        self.name = "PerfEventCollector"
+        self.description = "Collector for counting perf events with perf_event_open"
+        self.benchmark = benchmark
+        self.benchmark_set = benchmark_set
+        self.iteration = iteration
+        self.timescale = configuration.timescale # note this needs to be ms, same as configuration file
+        self.overhead = configuration.overhead
+
+        mode_config = configuration.collector_modes["perf_event"]
+        if not isinstance(mode_config, dict):
+            mode_config = {}
+        self.counters = list(mode_config.get("counters", configuration.perf_counters))
+        if not self.counters:
+            raise ValueError("The perf_event collector needs counters, or perf_counters in the configuration")
+        for counter in self.counters:
+            # Raises ValueError for events this binding cannot encode, before
+            # anything is launched
+            resolve_event(counter)
+        self.groups = PMUTopology().pack(self.counters, mode_config.get("pmu_count", 4))
+        self.data = []
+
+    def can_attach(self):
+        # The single TestRun is built in run_all()
+        return self.multiplexable
+
+    async def run_all(self):
+        """
+        Runs the PerfEventTestRun() for this Benchmark()
+
+        :return: None, yielded for each invocation of the Benchmark associated
+        with this Collector instance
+        """
+        if not self.launch:
+            self.benchmark.before_each()
+
+        testrun = PerfEventTestRun(self.name, self.groups, self.benchmark, self.iteration, self.timescale, \
+            self.benchmark_set, self.overhead)
+        data = await testrun.run(self.launch)
+
+        self.data.append(data)
+        if testrun.overhead:
+            self.data.append(testrun.overhead.to_record(data))
+
+        if not self.launch:
+            self.benchmark.after_each()
+        yield
+
+class PerfEventTestRun():
+    """
+    One run of the benchmark, with its counters read every timescale
+
+    Each sample holds the count of each event over the interval, scaled by
+    the kernel's time enabled / time running as perf stat does, and
+    "<event>_multiplex_ratio", the fraction of the interval it was actually
+    counted. A last, shorter, interval ends when the benchmark exits.
+
+    If a group cannot be opened, its events are tried one at a time and any
+    which still fail (ex hardware events in a VM) are left out with a
+    message. If counting the kernel is not permitted (perf_event_paranoid),
+    every counter is opened for user space only.
+
+    :ivar name: Name of this TestRun, used as collector_name
+    :ivar groups: Lists of perf events, each opened as one group
+    :ivar benchmark: Benchmark class this Collector is initiated against
+    :ivar iteration: The statistical or experimental iteration
+    :ivar timescale: The time between collections in MS, comes from Configuration()
+    :ivar benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+    :ivar exclude_kernel: Whether counters are opened for user space only
+    :ivar overhead: OverheadRecorder() timing each sample, or None
+    :ivar data: The data collected during this run
+
+    The format of stored data is as follows (in a dictionary):
+    - "benchmark_name": self.benchmark.name,
+    - "benchmark_set":  self.benchmark_set,
+    - "collector_name": self.name,
+    - "iteration":      self.iteration,
+    - "timescale":      self.timescale,
+    - "units":          "count per timescale milliseconds",
+    - "measurements":   the events counted,
+    - "duration":       runtime of the benchmark,
+    - "missed_ticks":   samples skipped because sampling fell behind,
+    - one SampleBuffer() per event and per event's multiplex ratio
+    """
+
+    def __init__(self, name, groups, benchmark, iteration, timescale, benchmark_set, overhead = False):
+        """
+        Init this PerfEventTestRun()
+
+        :param name: Name of this TestRun
+        :param groups: Lists of perf events, each opened as one group
+        :param benchmark: Benchmark class this Collector is initiated against
+        :param iteration: The statistical or experimental iteration
+        :param timescale: The time between collections in MS, comes from Configuration()
+        :param benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
+        :param overhead: Record what each sample costs, see OverheadRecorder()
+
+        :return: None
+        """
+        self.name = name
+        self.groups = groups
+        self.benchmark = benchmark
+        self.iteration = iteration
+        self.timescale = timescale
+        self.benchmark_set = benchmark_set
+        self.exclude_kernel = False
+        self.overhead = OverheadRecorder(self.timescale / 1000) if overhead else None
+        self.data = {
+            "benchmark_name": self.benchmark.name,
+            "benchmark_set":  self.benchmark_set,
+            "collector_name": self.name,
+            "iteration":      self.iteration,
+            "timescale":      self.timescale,
+            "units":          "count per timescale milliseconds",
+            "measurements":   [],
+            "duration":       0,
+        }
+
+    def open_group(self, events, pid):
+        """
+        Open one group of counters on pid, falling back to user space only,
+        then to one event at a time
+
+        :param events: perf events to open together
+        :type events: list
+        :param pid: Process whose tree is counted
+        :type pid: int
+
+        :return: The CounterGroup()s opened, maybe none
+        :rtype: list
+        """
+        try:
+            return [CounterGroup(events, pid, self.exclude_kernel)]
+        except OSError as error:
+            if error.errno in (errno.EACCES, errno.EPERM) and not self.exclude_kernel:
+                print("{}: not permitted to count the kernel, counting user space only".format(self.name))
+                self.exclude_kernel = True
+                return self.open_group(events, pid)
+            if len(events) == 1:
+                print("{}: cannot count {}: {}".format(self.name, events[0], error.strerror))
+                return []
+        opened = []
+        for event in events:
+            opened.extend(self.open_group([event], pid))
+        return opened
+
+    @published
+    async def run(self, launch = None):
+        """
+        Call this to count the benchmark
+
+        :param launch: Shared launch to count instead of launching the
+        benchmark, if any
+        :type launch: LaunchHandle()
+        """
+        handle = launch
+        if not launch:
+            handle = LaunchHandle(self.benchmark, None)
+            await handle.launch()
+        counters = []
+        try:
+            for events in self.groups:
+                counters.extend(self.open_group(events, handle.pid))
+            for group in counters:
+                for event in group.events:
+                    self.data[event] = SampleBuffer()
+                    self.data[event + "_multiplex_ratio"] = SampleBuffer()
+                    self.data["measurements"].append(event)
+                group.enable()
+            previous = [(0, 0, [0] * len(group.events)) for group in counters]
+
+            if launch:
+                launch.attached()
+                await launch.wait_released()
+            else:
+                handle.release()
+            ticks = PeriodicSampler(self.timescale / 1000, handle.start_monotonic)
+            exit_time = watch_exit(handle.process)
+
+            def sample(timestamp):
+                for index, group in enumerate(counters):
+                    enabled, running, counts = group.read()
+                    last_enabled, last_running, last_counts = previous[index]
+                    ratio = (running - last_running) / (enabled - last_enabled) if enabled > last_enabled else None
+                    for event, count, last_count in zip(group.events, counts, last_counts):
+                        self.data[event].append(timestamp, (count - last_count) / ratio if ratio else None)
+                        self.data[event + "_multiplex_ratio"].append(timestamp, ratio)
+                    previous[index] = (enabled, running, counts)
+
+            while True:
+                timestamp = await ticks.tick()
+                if handle.process.returncode is not None:
+                    break
+                if self.overhead:
+                    self.overhead.start_tick()
+                sample(timestamp)
+                if self.overhead:
+                    self.overhead.end_tick()
+            # The loop only sees the exit at its next tick; the runtime ends
+            # at the exit itself
+            duration = await exit_time - handle.start_monotonic
+            # The counts are final once the benchmark has exited
+            sample(timestamp)
+        finally:
+            for group in counters:
+                group.close()
+            if not launch:
+                await handle.close()
+
+        self.data["duration"] = duration
+        self.data["missed_ticks"] = ticks.missed
+        if ticks.missed:
+            print("{}: {} of {} samples missed because sampling took longer than the {} ms timescale".format( \
+                self.name, ticks.missed, ticks.ticks, self.timescale))
+
+        return samples_to_udf(self.data)
+
+Collector.register_collector("perf_event", PerfEventCollector)
@@ -40,7 +40,8 @@ import pprint
 import pandas
 import numbers
 
-from mantis_monitor.collector.collector import Collector
+from mantis_monitor.collector.collector import Collector, OverheadRecorder, PeriodicSampler, SampleBuffer, launch_benchmark, published, samples_to_udf, watch_exit
+from mantis_monitor.collector.procfs import ProcessTreeTracker, ProcSampler
 
 #logging.basicConfig(filename='testing.log', encoding='utf-8', \
 #    format='%(levelname)s:%(message)s', level=logging.DEBUG)
@@ -61,8 +62,22 @@ class PFSCollector(Collector):
     :ivar data: Data from this Collector instance stored in the UDF
     :ivar filename: A unique filename to use for intermediate data storage
     :ivar timescale: The time between collections in MS, comes from Configuration()
+    :ivar overhead: Whether to record the cost of each sample, comes from Configuration()
+    :ivar reader: How per-process readings are taken, "psutil" (default) or
+    "procfs" (see ProcSampler())
+
+    :cvar exclusive: False, readings follow the benchmark's process tree (apart
+    from the system-wide network counters) so other work may share the node
+    :cvar multiplexable: True, its one TestRun only needs the benchmark's PID
     """
 
+    exclusive = False
+    multiplexable = True
+
+    def can_attach(self):
+        # The single TestRun is built in run_all()
+        return self.multiplexable
+
     def __init__(self, configuration, iteration, benchmark, benchmark_set):
         """
         Init the object
@@ -92,6 +107,12 @@ class PFSCollector(Collector):
                 }
 
         self.timescale = configuration.timescale # note this needs to be ms, same as configuration file
+        self.overhead = configuration.overhead
+        # utilization may be a list (informational) or a dict of options
+        mode_config = configuration.collector_modes["utilization"]
+        self.reader = mode_config.get("reader", "psutil") if isinstance(mode_config, dict) else "psutil"
+        if self.reader not in ("psutil", "procfs"):
+            raise ValueError("Unknown utilization reader {}, expected psutil or procfs".format(self.reader))
         self.filename = "{testname}-iteration_{iter_count}-benchmark_{benchstring}-set_{benchsetstring}-utilization".format(testname = configuration.test_name, \
             iter_count = iteration, benchstring = benchmark.name, benchsetstring = self.benchmark_set)
         self.data = []
@@ -122,14 +143,19 @@ class PFSCollector(Collector):
 
         """
 
-        self.benchmark.before_each()
+        if not self.launch:
+            self.benchmark.before_each()
 
-        data = await (PFSTimeTestRun("Utilization", self.benchmark, self.filename, self.iteration, self.timescale, \
-            "unknown", self.benchmark_set).run())
+        testrun = PFSTimeTestRun("Utilization", self.benchmark, self.filename, self.iteration, self.timescale, \
+            "unknown", self.benchmark_set, self.overhead, self.reader)
+        data = await testrun.run(self.launch)
 
         self.data.append(data)
+        if testrun.overhead:
+            self.data.append(testrun.overhead.to_record(data))
 
-        self.benchmark.after_each()
+        if not self.launch:
+            self.benchmark.after_each()
         yield
 
 class PFSTimeTestRun():
@@ -145,8 +171,12 @@ class PFSTimeTestRun():
     :ivar iteration: The statistical or experimental iteration
     :ivar data: The data collected during this instance of Perf
     :ivar duration: The duration which this instance of Perf ran for
-    :ivar measurements: The collected values through psutil
+    :ivar measurements: The collected values through psutil, one SampleBuffer() per key
     :ivar units: The units of measurements
+    :ivar overhead: OverheadRecorder() timing each sample, or None
+    :ivar reader: "psutil" or "procfs", how per-process readings are taken
+    :ivar children: psutil.Process() of each live descendant of the benchmark,
+    by PID, kept up to date from a ProcessTreeTracker() (psutil reader only)
 
 
     The format of stored data is as follows (in a dictionary):
@@ -158,9 +188,10 @@ class PFSTimeTestRun():
     - "units":          "count per timescale milliseconds",
     - "measurements":   list of strings,
     - "duration":       0,
+    - "missed_ticks":   samples skipped because the previous one overran the timescale
 
     """
-    def __init__(self, name, benchmark, filename, iteration, timescale, units, benchmark_set):
+    def __init__(self, name, benchmark, filename, iteration, timescale, units, benchmark_set, overhead = False, reader = "psutil"):
         """
         Init this PFSTimeTestRun()
 
@@ -171,6 +202,8 @@ class PFSTimeTestRun():
         :param benchmark: Benchmark class this Collector is initiated against
         :param benchmark_set: Colon-seprated list of benchmarks co-running with the benchmark
         :param iteration: The statistical or experimental iteration
+        :param overhead: Record what each sample costs, see OverheadRecorder()
+        :param reader: "psutil", or "procfs" to read /proc through a ProcSampler()
 
         :return: None
         """
@@ -182,7 +215,10 @@ class PFSTimeTestRun():
         self.iteration = iteration
         self.timescale = timescale
         self.units = units
-        self.measurements = []
+        self.measurements = {}
+        self.overhead = OverheadRecorder(self.timescale / 1000) if overhead else None
+        self.reader = reader
+        self.children = {}
 
         self.data = {   "benchmark_name":   self.benchmark.name, \
                         "benchmark_set":    self.benchmark_set, \
@@ -192,38 +228,69 @@ class PFSTimeTestRun():
                         "measurements":     [], \
                         "units":            self.units, \
                         "duration":         0,
+                        "missed_ticks":     0,
                         }
 
-    async def run(self):
+    def on_process_event(self, event, pid, parent):
+        """
+        Keep self.children in step with the benchmark's process tree; called
+        by the ProcessTreeTracker()
+        """
+        if event == "fork":
+            try:
+                child = psutil.Process(pid)
+                child.cpu_percent() # Returns dummy 0.0 value for the first call
+            except psutil.NoSuchProcess:
+                return
+            self.children[pid] = child
+        else:
+            self.children.pop(pid, None)
+
+    @published
+    async def run(self, launch = None):
         """
         Call this to run this PFS monitoring instance using psutil
+
+        :param launch: Shared launch to observe instead of launching the
+        benchmark, if any; its tracker is used and its start is the time 0
+        :type launch: LaunchHandle()
         """
 
         cpu_count = psutil.cpu_count()
 
         # Run benchmark
-        starttime = time.time()
+        starttime = time.monotonic()
 
         print(self.benchmark.env)
 
-        process = await asyncio.create_subprocess_shell(self.benchmark.get_run_command(), cwd=self.benchmark.cwd, env=self.benchmark.env)
+        process = launch.process if launch else await launch_benchmark(self.benchmark)
+        exit_time = watch_exit(process)
+        ticks = PeriodicSampler(self.timescale / 1000)
         # process = subprocess.Popen(self.benchmark.get_run_command(), shell=True, executable="/bin/bash", cwd=self.benchmark.cwd, env=self.benchmark.env)
 
-        await asyncio.sleep(0.1) # Let the shell start up
-
         shell_proc = psutil.Process(process.pid)
-        children = shell_proc.children()
-        
-        for child in shell_proc.children(True):
-            child.cpu_percent() # Returns dummy 0.0 value for the first call
+        tracker = launch.tracker if launch else ProcessTreeTracker(process.pid)
+        sampler = None
+        if self.reader == "procfs":
+            sampler = ProcSampler(tracker)
+        else:
+            tracker.subscribe(self.on_process_event)
+        if launch:
+            launch.attached()
+            await launch.wait_released()
+            starttime = launch.start_monotonic
+            ticks = PeriodicSampler(self.timescale / 1000, launch.start_monotonic)
+        else:
+            tracker.start()
         old_net_counters = psutil.net_io_counters(nowrap=True)._asdict()
 
-        await asyncio.sleep(1)
+        timestamp = await ticks.tick()
         while (shell_proc.is_running()):
-            timestamp = time.time() - starttime
-            measurement = {}
+            if self.overhead:
+                self.overhead.start_tick()
+            measurement = sampler.sample() if sampler else {}
             measurement_sets = ['memory_info', 'cpu_percent', 'io_counters']
-            for child in shell_proc.children(True):
+            for child in (list(self.children.values()) if not sampler else ()):
                 try:
                     child_measurements = child.as_dict(measurement_sets)
                 except psutil.NoSuchProcess as e:
@@ -246,22 +313,28 @@ class PFSTimeTestRun():
                 measurement[key] = value - old_net_counters[key]
             old_net_counters = net_counters
 
-            measurement["time"] = timestamp
-            self.measurements.append(measurement)
-            await asyncio.sleep(1)
-
-        self.data["duration"] = time.time() - starttime
-
-        # pivot measurement format
-        for row in self.measurements:
-            for key in row.keys():
-                if key == "time":
-                    continue
-                if key not in self.data:
-                    self.data[key] = []
+            for key, value in measurement.items():
+                if key not in self.measurements:
+                    self.measurements[key] = self.data[key] = SampleBuffer()
                     self.data["measurements"].append(key)
-                self.data[key].append([row["time"], row[key]])
-
-        return self.data
+                self.measurements[key].append(timestamp, value)
+            if self.overhead:
+                self.overhead.end_tick()
+            timestamp = await ticks.tick()
+
+        if sampler:
+            sampler.close()
+        if launch:
+            tracker.unsubscribe(self.on_process_event)
+        else:
+            await tracker.stop()
+        # The loop only sees the exit at its next tick; the runtime ends at the exit itself
+        self.data["duration"] = await exit_time - starttime
+        self.data["missed_ticks"] = ticks.missed
+        if ticks.missed:
+            print("{}: {} of {} samples missed because sampling took longer than the {} ms timescale".format( \
+                self.name, ticks.missed, ticks.ticks, self.timescale))
+
+        return samples_to_udf(self.data)
 
 Collector.register_collector("utilization", PFSCollector)
@@ -0,0 +1,289 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the PMUTopology, which packs perf counters into as few
+Perf runs (and so benchmark runs) as the hardware allows.
+
+Not every perf event takes one of the pmu_count general-purpose counters:
+
+    - Software events (task-clock, page-faults, context-switches, ...) and
+      tracepoints are counted by the kernel, without any PMU.
+    - Events of PMUs other than the cores' (msr/tsc/, power/energy-pkg/,
+      uncore PMUs, ...) have their own counters.
+    - Intel cores have fixed counters for instructions, cycles, ref-cycles
+      and (Ice Lake on) slots. One of each can be counted alongside the
+      general-purpose counters; a second copy needs a general-purpose one.
+
+The PMUs are read from /sys/bus/event_source/devices/. A core PMU is named
+cpu, or cpu_core and cpu_atom on hybrid parts, where an unprefixed hardware
+event is counted on both; an Intel one publishes caps/pmu_name. Each event
+alias in <pmu>/events/ holds the event's encoding, ex "event=0x3c", which
+says whether it fits a fixed counter. When the NMI watchdog is on
+(/proc/sys/kernel/nmi_watchdog), it holds the cycles fixed counter.
+
+Counters are then packed first-fit, fixed-counter events first, into Perf
+runs of at most pmu_count general-purpose counters per core PMU; events
+which take no core counter join the first run. How many general-purpose
+counters a core has is not published in sysfs, so pmu_count still sets it.
+Events which cannot be classified are assumed to take a general-purpose
+counter, as before.
+
+For testing, the tree may be rooted elsewhere, ex PMUTopology("/tmp/fake")
+reads /tmp/fake/sys/bus/event_source/devices/cpu/{type,caps/pmu_name,
+events/cpu-cycles,...} and /tmp/fake/proc/sys/kernel/nmi_watchdog, as
+tests/test_pmu.py does.
+"""
+
+import functools
+import math
+import os
+import re
+
+SOFTWARE_EVENTS = {"cpu-clock", "task-clock", "page-faults", "faults", "context-switches", "cs", \
+    "cpu-migrations", "migrations", "minor-faults", "major-faults", "alignment-faults", \
+    "emulation-faults", "dummy", "bpf-output", "cgroup-switches", "duration_time", "user_time", \
+    "system_time"}
+
+# perf's generic hardware event names, and the sysfs alias each is read from
+HARDWARE_EVENTS = {"cycles": "cpu-cycles", "cpu-cycles": "cpu-cycles", "instructions": "instructions", \
+    "cache-references": "cache-references", "cache-misses": "cache-misses", \
+    "branches": "branch-instructions", "branch-instructions": "branch-instructions", \
+    "branch-misses": "branch-misses", "bus-cycles": "bus-cycles", "ref-cycles": "ref-cycles", \
+    "stalled-cycles-frontend": "stalled-cycles-frontend", "idle-cycles-frontend": "stalled-cycles-frontend", \
+    "stalled-cycles-backend": "stalled-cycles-backend", "idle-cycles-backend": "stalled-cycles-backend"}
+
+# (event, umask) encodings the kernel schedules on Intel's fixed counters
+FIXED_ENCODINGS = {(0xc0, 0x00): "instructions", (0x3c, 0x00): "cycles", (0x00, 0x03): "ref-cycles", \
+    (0x00, 0x04): "slots"}
+
+CORE_PMUS = ("cpu", "cpu_core", "cpu_atom")
+
+_MODIFIERS = re.compile(r"^[ukhGHpPSDIWeb]+$")
+
+def parse_encoding(encoding):
+    """
+    Parse a sysfs event encoding, or a raw rNNNN event, into (event, umask)
+
+    :param encoding: ex "event=0x00,umask=0x03", or "r013c"
+    :type encoding: str
+
+    :return: (event, umask), or None if it cannot be parsed
+    :rtype: tuple
+    """
+    encoding = encoding.strip()
+    try:
+        if re.match(r"^r[0-9a-fA-F]+$", encoding):
+            config = int(encoding[1:], 16)
+            return config & 0xff, (config >> 8) & 0xff
+        terms = {}
+        for term in encoding.split(","):
+            key, _, value = term.partition("=")
+            terms[key.strip()] = int(value, 0) if value else 1
+    except ValueError:
+        return None
+    if "event" not in terms or set(terms) - {"event", "umask"}:
+        return None
+    return terms["event"], terms.get("umask", 0)
+
+class PMUTopology():
+    """
+    The PMUs of this machine, as far as counter scheduling is concerned
+
+    :ivar root: Directory the sysfs and procfs paths are read under
+    :type root: str
+    :ivar devices: Names of every PMU in /sys/bus/event_source/devices
+    :type devices: set
+    :ivar core_pmus: Names of the core PMUs; "cpu" if none were found
+    :type core_pmus: list
+    :ivar fixed: Core PMU name -> names of its free fixed counters (see
+    FIXED_ENCODINGS)
+    :type fixed: dict
+    :ivar aliases: PMU name -> {event alias: encoding string}
+    :type aliases: dict
+    """
+
+    def __init__(self, root = "/"):
+        """
+        Init the object, reading the PMUs under root
+
+        :param root: Directory to read sys/ and proc/ under
+        :type root: str
+
+        :return: None
+        """
+        self.root = root
+        self.devices = set()
+        self.core_pmus = []
+        self.fixed = {}
+        self.aliases = {}
+
+        devices_dir = os.path.join(root, "sys/bus/event_source/devices")
+        try:
+            self.devices = set(os.listdir(devices_dir))
+        except OSError:
+            pass
+
+        for name in sorted(self.devices):
+            aliases = {}
+            events_dir = os.path.join(devices_dir, name, "events")
+            try:
+                for alias in os.listdir(events_dir):
+                    try:
+                        with open(os.path.join(events_dir, alias)) as alias_file:
+                            aliases[alias] = alias_file.read().strip()
+                    except OSError:
+                        continue
+            except OSError:
+                pass
+            self.aliases[name] = aliases
+            if name not in CORE_PMUS:
+                continue
+            self.core_pmus.append(name)
+            self.fixed[name] = set()
+            if os.path.exists(os.path.join(devices_dir, name, "caps/pmu_name")):
+                for encoding in aliases.values():
+                    if parse_encoding(encoding) in FIXED_ENCODINGS:
+                        self.fixed[name].add(FIXED_ENCODINGS[parse_encoding(encoding)])
+
+        if not self.core_pmus:
+            # No core PMU published (ex in a VM); perf still needs a counter
+            # for every hardware event it can open
+            self.core_pmus = ["cpu"]
+            self.fixed = {"cpu": set()}
+
+        try:
+            with open(os.path.join(root, "proc/sys/kernel/nmi_watchdog")) as watchdog:
+                if watchdog.read().strip() not in ("", "0"):
+                    for fixed in self.fixed.values():
+                        fixed.discard("cycles")
+        except OSError:
+            pass
+
+    def classify(self, event):
+        """
+        Find which counters an event needs
+
+        :param event: A perf event, as given to perf stat -e
+        :type event: str
+
+        :return: (core PMU, fixed counter name or None) pairs; empty if the
+        event takes no core counter
+        :rtype: list
+        """
+        name, _, modifiers = event.rpartition(":")
+        if not name or not _MODIFIERS.match(modifiers):
+            name = event
+
+        if "/" in name:
+            pmu, _, terms = name.partition("/")
+            terms = terms.rstrip("/")
+            if pmu in self.core_pmus:
+                encoding = parse_encoding(self.aliases.get(pmu, {}).get(HARDWARE_EVENTS.get(terms, terms), terms))
+                return [(pmu, FIXED_ENCODINGS.get(encoding))]
+            if pmu in self.devices:
+                return []
+            return [(core, None) for core in self.core_pmus]
+
+        if ":" in name or name in SOFTWARE_EVENTS:
+            return []   # a tracepoint, or counted by the kernel
+
+        if name in HARDWARE_EVENTS or re.match(r"^r[0-9a-fA-F]+$", name):
+            pairs = []
+            for core in self.core_pmus:
+                encoding = self.aliases.get(core, {}).get(HARDWARE_EVENTS.get(name), name)
+                pairs.append((core, FIXED_ENCODINGS.get(parse_encoding(encoding))))
+            return pairs
+
+        for pmu, aliases in self.aliases.items():
+            if name in aliases and pmu not in self.core_pmus:
+                return []
+        return [(core, None) for core in self.core_pmus]
+
+    def pack(self, events, general_counters):
+        """
+        Pack events into as few Perf runs as the counters allow
+
+        :param events: perf events to count
+        :type events: list
+        :param general_counters: General-purpose counters per core PMU
+        (pmu_count)
+        :type general_counters: int
+
+        :return: One list of events per Perf run, each in the order given
+        :rtype: list
+        """
+        general_counters = max(1, general_counters)
+        needs = {event: self.classify(event) for event in events}
+        order = {event: index for index, event in enumerate(events)}
+        runs = []
+
+        def place(event, run):
+            used_fixed = set()
+            used_general = {}
+            for core, fixed in needs[event]:
+                if fixed and fixed in self.fixed.get(core, ()) and (core, fixed) not in run["fixed"]:
+                    used_fixed.add((core, fixed))
+                elif run["general"].get(core, 0) + 1 <= general_counters:
+                    used_general[core] = 1
+                else:
+                    return False
+            run["fixed"].update(used_fixed)
+            for core in used_general:
+                run["general"][core] = run["general"].get(core, 0) + 1
+            run["events"].append(event)
+            return True
+
+        # Fixed-counter events first, so they claim the fixed counters
+        hardware = [event for event in events if needs[event]]
+        hardware.sort(key = lambda event: not any(fixed for _, fixed in needs[event]))
+        for event in hardware:
+            if not any(place(event, run) for run in runs):
+                runs.append({"events": [], "fixed": set(), "general": {}})
+                place(event, runs[-1])
+
+        free = [event for event in events if not needs[event]]
+        if free:
+            if not runs:
+                runs.append({"events": [], "fixed": set(), "general": {}})
+            runs[0]["events"].extend(free)
+        return [sorted(run["events"], key = order.get) for run in runs]
+
+@functools.lru_cache(maxsize = None)
+def plan_counters(counters, general_counters, root = "/"):
+    """
+    Pack a configuration's perf counters into Perf runs, reporting the plan
+    the first time it is made
+
+    :param counters: perf events to count
+    :type counters: tuple
+    :param general_counters: General-purpose counters per core PMU (pmu_count)
+    :type general_counters: int
+    :param root: Directory to read sys/ and proc/ under
+    :type root: str
+
+    :return: One tuple of events per Perf run
+    :rtype: tuple
+    """
+    runs = PMUTopology(root).pack(list(counters), general_counters)
+    chunked = math.ceil(len(counters) / max(1, general_counters))
+    print("Perf: {} counters packed into {} run(s) of each benchmark ({} in chunks of pmu_count):".format( \
+        len(counters), len(runs), chunked))
+    for index, run in enumerate(runs):
+        print("    run {}: {}".format(index, ",".join(run)))
+    return tuple(tuple(run) for run in runs)
+
+__all__ = ['PMUTopology', 'parse_encoding', 'plan_counters']
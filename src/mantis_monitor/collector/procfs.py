@@ -0,0 +1,421 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the ProcessTreeTracker, which follows the process tree of
+a launched benchmark, and the ProcSampler, a low-overhead reader of the
+/proc filesystem used by the PFS Collector ("reader: procfs").
+
+The ProcessTreeTracker is the one place PIDs are discovered. Each TestRun
+starts one against the process launch_benchmark() returned; it polls the
+tree every interval (0.1 s by default, well below the usual sampling
+timescale, so short-lived children are seen) and tells its subscribers as
+descendants appear ("fork") and go ("exit"). Subscribers keep their own
+per-process state up to date from these events instead of rescanning.
+
+The tracker keeps a parent -> children index and, for every descendant,
+holds /proc/<pid>/task open and the main thread's children file open. A
+poll then costs an fstat() (whose link count gives the number of threads)
+and a pread() per process, with no path lookups; only multi-threaded
+processes need their other threads' children files read. Kernels built
+without CONFIG_PROC_CHILDREN fall back to a scan of /proc. Holding the files
+also makes the tracker immune to PID reuse.
+
+The netlink proc connector would report every fork and exit as it happens,
+but needs CAP_NET_ADMIN, which mantis-monitor does not otherwise ask for,
+so /proc polling is used.
+
+psutil reads several files and builds several objects per process per
+call. For a benchmark with hundreds of processes that can take much of
+each sampling second. The ProcSampler instead keeps /proc/<pid>/stat,
+statm and io open for every process the tracker reports, and re-reads them
+with os.pread(), so a sample costs three syscalls per process.
+
+It reports the same measurements, under the same names, as the psutil path
+of PFSTimeTestRun: memory_info, cpu_percent and io_counters summed over the
+root's descendants.
+
+benchmarks/procfs.py compares the cost of one poll and sample against the
+psutil path.
+"""
+
+import asyncio
+import os
+import time
+
+from mantis_monitor.collector.collector import PeriodicSampler
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+#: /proc/<pid>/io fields, in order, by the names psutil gives them
+#: (cancelled_write_bytes, the seventh, is not reported)
+_IO_FIELDS = ("read_chars", "write_chars", "read_count", "write_count", "read_bytes", "write_bytes")
+
+#: /proc/<pid>/statm fields, in order, by the names psutil gives them
+_STATM_FIELDS = ("vms", "rss", "shared", "text", "lib", "data", "dirty")
+
+class _TrackedProcess():
+    """
+    The held task directory and children file of one process
+    """
+
+    __slots__ = ("pid", "parent", "tasks", "children")
+
+    def __init__(self, pid, parent):
+        self.pid = pid
+        self.parent = parent
+        self.tasks = os.open("/proc/{}/task".format(pid), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            self.children = os.open("/proc/{}/task/{}/children".format(pid, pid), os.O_RDONLY)
+        except OSError:
+            self.children = None
+
+    def close(self):
+        os.close(self.tasks)
+        if self.children is not None:
+            os.close(self.children)
+
+class ProcessTreeTracker():
+    """
+    Follows the descendants of one process and publishes fork and exit
+    events to subscribers
+
+    :ivar root_pid: PID whose descendants are tracked
+    :type root_pid: int
+    :ivar interval: Seconds between polls once started
+    :type interval: float
+    :ivar children: Parent -> children index, by PID, of the root and every
+    live descendant
+    :type children: dict
+    :ivar subscribers: Functions called as callback(event, pid, parent), with
+    event "fork" or "exit"
+    :type subscribers: list
+    """
+
+    def __init__(self, root_pid, interval = 0.1):
+        """
+        Init the object
+
+        :param root_pid: PID whose descendants are tracked (ex, the shell
+        launch_benchmark() started)
+        :type root_pid: int
+        :param interval: Seconds between polls once started
+        :type interval: float
+
+        :return: None
+        """
+        self.root_pid = root_pid
+        self.interval = interval
+        self.children = {root_pid: []}
+        self.subscribers = []
+        self._processes = {}
+        self._task = None
+        try:
+            self._root = _TrackedProcess(root_pid, None)
+            self._has_children_files = self._root.children is not None
+        except OSError:
+            self._root = None   # already gone
+            self._has_children_files = False
+
+    @property
+    def pids(self):
+        """
+        The live descendants of the root, as of the last poll
+
+        :rtype: list
+        """
+        return list(self._processes)
+
+    def subscribe(self, callback):
+        """
+        Call callback(event, pid, parent) on every fork and exit from now on
+
+        The new subscriber is first sent a "fork" for every descendant
+        already known, parents before children.
+
+        :param callback: The function to call
+        :type callback: function
+
+        :return: None
+        """
+        self.subscribers.append(callback)
+        for pid, process in list(self._processes.items()):
+            callback("fork", pid, process.parent)
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling callback
+
+        :return: None
+        """
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _publish(self, event, pid, parent):
+        for callback in list(self.subscribers):
+            callback(event, pid, parent)
+
+    def _read_children(self, process):
+        """
+        List the children of a process from its tasks' children files
+        """
+        try:
+            threads = os.fstat(process.tasks).st_nlink - 2
+            if threads <= 1 and process.children is not None:
+                return [int(child) for child in os.pread(process.children, 65536, 0).split()]
+            tids = os.listdir(process.tasks)
+        except OSError:
+            return []
+        children = []
+        for tid in tids:
+            try:
+                with open("/proc/{}/task/{}/children".format(process.pid, tid), "rb") as children_file:
+                    children.extend(int(child) for child in children_file.read().split())
+            except OSError:
+                continue
+        return children
+
+    def _scan_children(self):
+        """
+        Build the parent -> children index of the root's subtree with a full
+        scan of /proc, for kernels without children files
+        """
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open("/proc/{}/stat".format(entry), "rb") as stat:
+                    data = stat.read()
+            except OSError:
+                continue
+            parents.setdefault(int(data[data.rindex(b")") + 2:].split(None, 2)[1]), []).append(int(entry))
+        index = {}
+        pending = [self.root_pid]
+        while pending:
+            pid = pending.pop()
+            index[pid] = parents.get(pid, [])
+            pending.extend(index[pid])
+        return index
+
+    def refresh(self):
+        """
+        Poll the tree once, publishing a "fork" for every new descendant and
+        an "exit" for every one which has gone
+
+        A descendant whose parent exits is reparented outside the tree, so
+        is reported as exited too, as with psutil.Process.children().
+
+        :return: None
+        """
+        if self._root is None:
+            index = {}
+        elif self._has_children_files:
+            index = {}
+            pending = [self._root]
+            while pending:
+                process = pending.pop()
+                children = self._read_children(process)
+                index[process.pid] = children
+                for child in children:
+                    tracked = self._processes.get(child)
+                    if tracked is None:
+                        try:
+                            tracked = self._processes[child] = _TrackedProcess(child, process.pid)
+                        except OSError:
+                            continue   # exited before it could be opened
+                        self._publish("fork", child, process.pid)
+                    pending.append(tracked)
+        else:
+            index = self._scan_children()
+            for parent, children in index.items():
+                for child in children:
+                    if child not in self._processes:
+                        try:
+                            self._processes[child] = _TrackedProcess(child, parent)
+                        except OSError:
+                            continue
+                        self._publish("fork", child, parent)
+
+        for pid in [pid for pid in self._processes if pid not in index]:
+            process = self._processes.pop(pid)
+            process.close()
+            self._publish("exit", pid, process.parent)
+        self.children = index or {self.root_pid: []}
+
+    async def _poll(self):
+        ticks = PeriodicSampler(self.interval)
+        while True:
+            await ticks.tick()
+            self.refresh()
+
+    def start(self):
+        """
+        Poll once now, then every interval in a background task until
+        stop()
+
+        :return: None
+        """
+        self.refresh()
+        self._task = asyncio.ensure_future(self._poll())
+
+    async def stop(self):
+        """
+        Stop polling, publish an "exit" for every descendant still known
+        and close every held file
+
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for pid in list(self._processes):
+            process = self._processes.pop(pid)
+            process.close()
+            self._publish("exit", pid, process.parent)
+        if self._root is not None:
+            self._root.close()
+            self._root = None
+
+class _ProcTask():
+    """
+    The held files and last CPU reading of one process
+    """
+
+    __slots__ = ("pid", "stat", "statm", "io", "cpu_time", "cpu_stamp")
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.stat = os.open("/proc/{}/stat".format(pid), os.O_RDONLY)
+        try:
+            self.statm = os.open("/proc/{}/statm".format(pid), os.O_RDONLY)
+        except OSError:
+            os.close(self.stat)
+            raise
+        try:
+            self.io = os.open("/proc/{}/io".format(pid), os.O_RDONLY)
+        except OSError:
+            self.io = None   # not readable for this process; counted as zero
+        self.cpu_time = None
+        self.cpu_stamp = None
+
+    def close(self):
+        for fd in (self.stat, self.statm, self.io):
+            if fd is not None:
+                os.close(fd)
+
+class ProcSampler():
+    """
+    Samples resource usage of every descendant a ProcessTreeTracker reports
+
+    :ivar tracker: The tracker of the benchmark's process tree
+    :type tracker: ProcessTreeTracker()
+    :ivar tasks: The sampled descendants, by PID
+    :type tasks: dict
+    """
+
+    def __init__(self, tracker):
+        """
+        Init the object and subscribe to the tracker
+
+        :param tracker: The tracker of the benchmark's process tree
+        :type tracker: ProcessTreeTracker()
+
+        :return: None
+        """
+        self.tracker = tracker
+        self.tasks = {}
+        tracker.subscribe(self.on_event)
+
+    def on_event(self, event, pid, parent):
+        """
+        Open a new descendant's files, taking the first CPU reading so its
+        first sample already has a cpu_percent, or close an exited one's
+
+        :return: None
+        """
+        if event == "fork" and pid not in self.tasks:
+            try:
+                task = self.tasks[pid] = _ProcTask(pid)
+                stat = os.pread(task.stat, 1024, 0)
+            except OSError:
+                return   # exited before it could be opened
+            fields = stat[stat.rindex(b")") + 2:].split()
+            task.cpu_time = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+            task.cpu_stamp = time.monotonic()
+        elif event == "exit":
+            task = self.tasks.pop(pid, None)
+            if task is not None:
+                task.close()
+
+    def sample(self):
+        """
+        Take one sample of every live descendant
+
+        Descendants which exited since the tracker's last poll are skipped.
+
+        :return: Summed measurements, with the keys of psutil's
+        memory_info(), cpu_percent() and io_counters() (as read_count, ...)
+        :rtype: dict
+        """
+        memory = [0] * len(_STATM_FIELDS)
+        io_counts = [0] * len(_IO_FIELDS)
+        cpu_percent = 0.0
+
+        pread = os.pread
+        for task in list(self.tasks.values()):
+            try:
+                stat = pread(task.stat, 1024, 0)
+                statm = pread(task.statm, 256, 0).split()
+                io = pread(task.io, 1024, 0).split()[1::2] if task.io is not None else ()
+            except OSError:
+                continue   # exited; the tracker will report it
+            fields = stat[stat.rindex(b")") + 2:].split()
+            if fields[0] in (b"Z", b"X"):
+                continue
+
+            for field in range(len(memory)):
+                memory[field] += int(statm[field])
+            for field, value in zip(range(len(io_counts)), io):
+                io_counts[field] += int(value)
+
+            now = time.monotonic()
+            cpu_time = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+            if task.cpu_time is not None and now > task.cpu_stamp:
+                cpu_percent += (cpu_time - task.cpu_time) / (now - task.cpu_stamp) * 100
+            task.cpu_time = cpu_time
+            task.cpu_stamp = now
+
+        measurement = {name: pages * _PAGE_SIZE for name, pages in zip(_STATM_FIELDS, memory)}
+        measurement["cpu_percent"] = cpu_percent
+        measurement.update(zip(_IO_FIELDS, io_counts))
+        return measurement
+
+    def close(self):
+        """
+        Unsubscribe from the tracker and close every held file
+
+        :return: None
+        """
+        self.tracker.unsubscribe(self.on_event)
+        for task in self.tasks.values():
+            task.close()
+        self.tasks = {}
@@ -0,0 +1,155 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the ProfileAggregator, which folds the samples of a
+"perf script -F comm,ip,sym,dso" stream into compact histograms as they
+are read, for PerfRecordTestRun.
+
+A sample is a line starting with the command name, followed, with call
+graphs, by one indented line per frame, leaf first, and a blank line::
+
+    python3
+            7f2a1c4e51d0 PyEval_EvalFrameDefault (/usr/bin/python3.11)
+            7f2a1c4e3a20 _PyEval_Vector (/usr/bin/python3.11)
+
+Without call graphs, the leaf frame is on the command line itself. Each
+sample is counted:
+
+    - under its leaf symbol ("symbols") and the leaf's DSO ("dsos"), i.e.
+      self time
+    - as a folded stack, "comm;root;...;leaf", as read by flamegraph.pl
+      and speedscope ("stacks")
+
+Only one sample is held at a time. Each histogram keeps at most max_keys
+distinct entries; once full, samples of new entries are counted under
+"[other]", so memory stays bounded however long perf.data is.
+"""
+
+import re
+
+_FRAME = re.compile(r"^\s*([0-9a-fA-F]+)\s+(.*?)\s+\((.*)\)\s*$")
+_HEADER_FRAME = re.compile(r"^(.*?)\s+([0-9a-fA-F]+)\s+(.*?)\s+\((.*)\)\s*$")
+
+OTHER = "[other]"
+
+class ProfileAggregator():
+    """
+    Per-symbol, per-DSO and folded-stack sample counts of a perf script stream
+
+    :ivar max_keys: Most distinct entries kept in each histogram
+    :type max_keys: int
+    :ivar max_depth: Most frames, from the leaf, kept in a folded stack
+    :type max_depth: int
+    :ivar samples: Samples counted
+    :type samples: int
+    :ivar symbols: Leaf symbol -> samples
+    :type symbols: dict
+    :ivar dsos: Leaf DSO -> samples
+    :type dsos: dict
+    :ivar stacks: Folded stack -> samples
+    :type stacks: dict
+    """
+
+    def __init__(self, max_keys = 10000, max_depth = 127):
+        """
+        Init the object
+
+        :param max_keys: Most distinct entries kept in each histogram
+        :type max_keys: int
+        :param max_depth: Most frames, from the leaf, kept in a folded stack
+        :type max_depth: int
+
+        :return: None
+        """
+        self.max_keys = max_keys
+        self.max_depth = max_depth
+        self.samples = 0
+        self.symbols = {}
+        self.dsos = {}
+        self.stacks = {}
+        self._comm = None
+        self._frames = []
+
+    def _count(self, histogram, key):
+        if key in histogram:
+            histogram[key] += 1
+        elif len(histogram) < self.max_keys:
+            histogram[key] = 1
+        else:
+            histogram[OTHER] = histogram.get(OTHER, 0) + 1
+
+    def _frame(self, symbol, dso):
+        if len(self._frames) < self.max_depth:
+            # ; separates frames in a folded stack
+            self._frames.append((symbol.replace(";", ":") or "[unknown]", dso or "[unknown]"))
+
+    def flush(self):
+        """
+        Count the sample being read, if any
+
+        :return: None
+        """
+        if self._comm is None:
+            return
+        leaf_symbol, leaf_dso = self._frames[0] if self._frames else ("[unknown]", "[unknown]")
+        self.samples += 1
+        self._count(self.symbols, leaf_symbol)
+        self._count(self.dsos, leaf_dso)
+        self._count(self.stacks, ";".join([self._comm] + [symbol for symbol, _ in reversed(self._frames)]))
+        self._comm = None
+        self._frames = []
+
+    def feed(self, line):
+        """
+        Read one line of perf script output
+
+        :param line: The line, without or with its newline
+        :type line: str
+
+        :return: None
+        """
+        if not line.strip():
+            self.flush()
+        elif line[0].isspace():
+            frame = _FRAME.match(line)
+            if frame and self._comm is not None:
+                self._frame(frame.group(2), frame.group(3))
+        else:
+            self.flush()
+            header = _HEADER_FRAME.match(line.rstrip())
+            if header:
+                self._comm = header.group(1).strip().replace(";", ":")
+                self._frame(header.group(3), header.group(4))
+            else:
+                self._comm = line.strip().replace(";", ":")
+
+    def top(self, histogram, count):
+        """
+        The largest entries of one of the histograms
+
+        :param histogram: self.symbols, self.dsos or self.stacks
+        :type histogram: dict
+        :param count: How many entries to return; all if None
+        :type count: int
+
+        :return: [[key, samples], ...], largest first
+        :rtype: list
+        """
+        entries = sorted(histogram.items(), key = lambda entry: entry[1], reverse = True)
+        return [[key, samples] for key, samples in entries[:count]]
+
+__all__ = ['ProfileAggregator']
@@ -42,7 +42,7 @@ import datetime
 
 import pprint
 
-from mantis_monitor.collector.collector import Collector
+from mantis_monitor.collector.collector import Collector, launch_benchmark
 
 class TTCCollector(Collector):
     """
@@ -59,8 +59,13 @@ class TTCCollector(Collector):
     :ivar configuration: Configuration object from this mantis-monitor instance
     :ivar testruns: List of TestRun() instances to run against this Collector
 
+    :cvar exclusive: False, only the benchmark's own runtime is measured so
+    other work may share the node
+
     """
 
+    exclusive = False
+
     def __init__(self, configuration, iteration, benchmark, benchmark_set):
         """
         Init the object
@@ -160,7 +165,7 @@ class TTCTestRun():
         """
 
         starttime = datetime.datetime.now()
-        process = await asyncio.create_subprocess_shell(self.runcommand, cwd=self.benchmark.cwd, env=self.benchmark.env)
+        process = await launch_benchmark(self.benchmark, self.runcommand)
         await process.wait()
         # process = subprocess.run(self.runcommand, shell=True, cwd=self.benchmark.cwd, env=self.benchmark.env)
         endtime = datetime.datetime.now()
@@ -52,18 +52,30 @@ class Configuration:
     and Collectors, used to get statistically relevant experimental data
     :ivar timescale: The ms used between each time step during measurements over time
     :ivar perf_counters: A list of string Linux perf tool counters to measure
+    :ivar scheduler: Optional settings for running cells in parallel (max_parallel,
+    cpusets), empty if not given
+    :ivar overhead: Whether sampling Collectors also record what each sample cost
+    mantis-monitor (see OverheadRecorder), defaults to False
+    :ivar live: Optional settings for the live metrics endpoint (address, window),
+    empty if not given
+    :ivar multiplex: Whether collection modes which can share a benchmark launch
+    are run on one launch (see LaunchHandle), defaults to False
 
     .. todo ::
         Logging is broken system-wide. The Logging module in Python broke, need to fix this.
     """
-    def __init__(self, location=None):
+    def __init__(self, location=None, contents=None):
         """
         Init the object.
 
         :param location: A string of the path to the config.yaml file to use
+        :param contents: Already-loaded config.yaml contents, used instead of
+        reading a file (ex, a configuration sent to a distributed worker)
         """
         self.location = location
-        if location and os.path.exists(location):
+        if contents is not None:
+            self.contents = contents
+        elif location and os.path.exists(location):
             self.contents = yaml.safe_load(open(location))
             #logging.info("Read config yaml at %s", location)
         elif location:
@@ -100,6 +112,22 @@ class Configuration:
         #        self.check_key = self.contents[check_key]
         if "perf_counters" in self.contents.keys():
             self.perf_counters = self.contents["perf_counters"]
+        else:
+            self.perf_counters = []
+
+        if "scheduler" in self.contents.keys():
+            self.scheduler = self.contents["scheduler"] or {}
+        else:
+            self.scheduler = {}
+
+        self.overhead = bool(self.contents.get("overhead", False))
+
+        self.multiplex = bool(self.contents.get("multiplex", False))
+
+        if "live" in self.contents.keys():
+            self.live = self.contents["live"] or {}
+        else:
+            self.live = {}
 
     def print_all(self):
         """
@@ -0,0 +1,329 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the implementation of distributed campaigns, run by one
+Coordinator and any number of workers.
+
+The coordinator owns the configuration, the checkpoint log and the
+consolidated output. Workers connect to it over TCP, receive the
+configuration, and are then handed cells (one collection mode run against
+one benchmark set for one iteration) one at a time. Each worker streams the
+UDF records of every finished TestRun back as it goes, and the coordinator
+merges them into a single result, exactly as if the cells had run locally.
+
+Start the coordinator with the usual config.yaml, then one worker per node::
+
+    mantis-monitor config.yaml --coordinator 0.0.0.0:7777
+    mantis-monitor --worker coordinator-host:7777
+
+A worker runs one cell at a time, so exclusive Collectors (see
+Collector.exclusive) still have their node to themselves as long as each
+node runs a single worker. Several workers on one machine are fine for
+shareable Collectors, or for testing.
+
+The protocol is newline-delimited JSON, one message per line, each with a
+"type":
+
+    - worker -> coordinator: hello, then per cell any number of records
+      {cell, records} and done {cell}, and finally finished or failed {error}
+    - coordinator -> worker: config {contents}, cell {group, iteration,
+      mode}, shutdown
+
+Records are buffered per cell on the coordinator and only committed once
+the worker reports the cell finished, so a cell whose worker disconnects is
+handed to another worker without leaving duplicate records behind.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import socket
+
+from mantis_monitor.benchmark.benchmark import Benchmark
+from mantis_monitor.configuration import Configuration
+from mantis_monitor.live import LiveServer
+from mantis_monitor.scheduler import run_cell
+
+def parse_address(address):
+    """
+    Split a HOST:PORT string
+
+    :param address: The address, ex "node01:7777"; the host may be left out
+    :type address: str
+
+    :return: (host, port) tuple
+    :rtype: tuple
+    """
+    host, _, port = address.rpartition(":")
+    return host or None, int(port)
+
+async def send_message(writer, message):
+    """
+    Write one protocol message and wait for it to be sent
+
+    :param writer: The connection to write to
+    :type writer: asyncio.StreamWriter()
+    :param message: The message, with its "type" key
+    :type message: dict
+
+    :return: None
+    """
+    writer.write((json.dumps(message, default = str) + "\n").encode())
+    await writer.drain()
+
+async def receive_message(reader):
+    """
+    Read one protocol message
+
+    :param reader: The connection to read from
+    :type reader: asyncio.StreamReader()
+
+    :return: The message, or None if the connection closed
+    :rtype: dict
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+class Coordinator():
+    """
+    Hands cells out to workers and merges the records they send back
+
+    :ivar config: Configuration object sent to every worker
+    :type config: Configuration()
+    :ivar cells: (group, iteration, mode) tuples still to hand out, where
+    group indexes Benchmark.get_benchmark_sets()
+    :type cells: collections.deque
+    :ivar checkpoint_log: CheckpointLog() committed records are appended to
+    :type checkpoint_log: CheckpointLog()
+    :ivar data_accumulator: ResultAccumulator() committed records are added to
+    :type data_accumulator: ResultAccumulator()
+    :ivar host: Address to listen on
+    :type host: str
+    :ivar port: Port to listen on
+    :type port: int
+    """
+
+    def __init__(self, config, cells, checkpoint_log, data_accumulator, address):
+        """
+        Init the object
+
+        :param config: Configuration object from this mantis-monitor instance
+        :type config: Configuration()
+        :param cells: (group, iteration, mode) tuples, in run order
+        :type cells: list
+        :param checkpoint_log: CheckpointLog() to append records to
+        :type checkpoint_log: CheckpointLog()
+        :param data_accumulator: ResultAccumulator() holding the UDF
+        :type data_accumulator: ResultAccumulator()
+        :param address: HOST:PORT to listen on
+        :type address: str
+
+        :return: None
+        """
+        self.config = config
+        self.cells = collections.deque(cells)
+        self.checkpoint_log = checkpoint_log
+        self.data_accumulator = data_accumulator
+        self.host, self.port = parse_address(address)
+
+        self.condition = asyncio.Condition()
+        self.in_flight = 0
+        self.failures = []
+        self.workers = set()
+
+    def _finished(self):
+        return self.in_flight == 0 and (not self.cells or bool(self.failures))
+
+    async def run(self):
+        """
+        Serve cells until every one has been run, then shut the workers down
+
+        :return: None
+        :raises RuntimeError: if a worker reported a failed cell, after the
+        cells already handed out have finished
+        """
+        server = await asyncio.start_server(self.handle_worker, self.host, self.port)
+        print("Coordinator listening on {}:{}, {} cells to run".format(self.host or "*", self.port, len(self.cells)))
+
+        async with self.condition:
+            await self.condition.wait_for(self._finished)
+
+        server.close()
+        await server.wait_closed()
+        if self.workers:
+            await asyncio.gather(*self.workers, return_exceptions = True)
+
+        if self.failures:
+            raise RuntimeError("Cell failed on a worker: " + self.failures[0])
+
+    async def handle_worker(self, reader, writer):
+        """
+        Talk to one connected worker until the campaign is over or the
+        worker goes away
+
+        :param reader: The worker's connection
+        :type reader: asyncio.StreamReader()
+        :param writer: The worker's connection
+        :type writer: asyncio.StreamWriter()
+
+        :return: None
+        """
+        self.workers.add(asyncio.current_task())
+        cell = None
+        try:
+            hello = await receive_message(reader)
+            if not hello or hello.get("type") != "hello":
+                return
+            worker_name = "{}:{}".format(hello.get("host"), hello.get("pid"))
+            print("Worker connected:", worker_name)
+            await send_message(writer, {"type": "config", "contents": self.config.contents})
+
+            while True:
+                async with self.condition:
+                    await self.condition.wait_for(lambda: self.cells or self._finished() or self.failures)
+                    if self.failures or not self.cells:
+                        break
+                    cell = self.cells.popleft()
+                    self.in_flight += 1
+
+                print("Sending cell {} to worker {}".format(cell, worker_name))
+                await send_message(writer, {"type": "cell", "group": cell[0], "iteration": cell[1], "mode": cell[2]})
+                messages = []
+                while True:
+                    message = await receive_message(reader)
+                    if message is None:
+                        raise ConnectionError("worker {} disconnected".format(worker_name))
+                    if message["type"] in ("finished", "failed"):
+                        break
+                    messages.append(message)
+
+                # Commit the cell only now, so a lost worker leaves nothing half-written
+                async with self.condition:
+                    for each in messages:
+                        key = tuple(each["cell"])
+                        if each["type"] == "records":
+                            self.checkpoint_log.write(each["records"], key)
+                            self.data_accumulator.extend(each["records"])
+                        elif each["type"] == "done":
+                            self.checkpoint_log.mark_done(key)
+                    if message["type"] == "failed":
+                        self.failures.append(message.get("error", ""))
+                    self.in_flight -= 1
+                    cell = None
+                    self.condition.notify_all()
+
+            await send_message(writer, {"type": "shutdown"})
+        except (ConnectionError, ValueError) as error:
+            print("Lost worker:", error)
+        finally:
+            if cell is not None:
+                # Give the interrupted cell to the next free worker
+                async with self.condition:
+                    self.cells.appendleft(cell)
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+            writer.close()
+            self.workers.discard(asyncio.current_task())
+
+class _CellChannel():
+    """
+    Stands in for the CheckpointLog while a worker runs a cell, sending each
+    batch of records to the coordinator instead
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def _send(self, message):
+        self.writer.write((json.dumps(message, default = str) + "\n").encode())
+
+    def write(self, records, cell = None):
+        self._send({"type": "records", "cell": cell, "records": records})
+
+    def mark_done(self, cell):
+        self._send({"type": "done", "cell": cell})
+
+async def run_worker(address, retries = 30):
+    """
+    Connect to a coordinator and run the cells it hands out until it says
+    to stop
+
+    :param address: HOST:PORT of the coordinator
+    :type address: str
+    :param retries: How many times to retry, a second apart, if the
+    coordinator is not up yet
+    :type retries: int
+
+    :return: None
+    """
+    host, port = parse_address(address)
+    for attempt in range(retries + 1):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            break
+        except OSError:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(1)
+
+    await send_message(writer, {"type": "hello", "host": socket.gethostname(), "pid": os.getpid()})
+    message = await receive_message(reader)
+    if not message or message.get("type") != "config":
+        raise ConnectionError("Coordinator at {} did not send a configuration".format(address))
+    config = Configuration(contents = message["contents"])
+    run_benchmarks = Benchmark.get_benchmark_sets(config)
+    channel = _CellChannel(writer)
+
+    live_server = LiveServer.from_configuration(config)
+    if live_server:
+        try:
+            await live_server.start()
+        except OSError as error:
+            # Likely another worker on this node is already serving
+            print("Not serving live metrics:", error)
+            live_server = None
+
+    started = set()
+    try:
+        while True:
+            message = await receive_message(reader)
+            if message is None or message["type"] == "shutdown":
+                break
+            group = message["group"]
+            benchmarks = run_benchmarks[group]
+            try:
+                if group not in started:
+                    started.add(group)
+                    for bench in benchmarks[1]:
+                        bench.before_all()
+                await run_cell(config, benchmarks, message["iteration"], message["mode"], channel)
+            except Exception as error:
+                await send_message(writer, {"type": "failed", "error": repr(error)})
+            else:
+                await send_message(writer, {"type": "finished"})
+    finally:
+        for group in started:
+            for bench in run_benchmarks[group][1]:
+                bench.after_all()
+        if live_server:
+            await live_server.close()
+        writer.close()
+
+__all__ = ['Coordinator', 'parse_address', 'run_worker']
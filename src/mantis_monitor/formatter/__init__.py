@@ -22,3 +22,5 @@ from . import formatter
 from . import pandas_pickle_formatter
 from . import csv_formatter
 from . import json_formatter
+from . import parquet_formatter
+from . import tidy_formatter
@@ -22,6 +22,8 @@ Natively-supported formats currently include:
     - CSV
     - JSON
     - Pandas DataFrame (pickled)
+    - Parquet (needs the optional pyarrow package)
+    - Tidy, a metadata table plus a long (run_id, metric, t, value) table
 
 To implement a new Formatter, inherit from the Formatter() class, and
 overwrite functions as needed.
@@ -29,6 +31,40 @@ overwrite functions as needed.
 TODO - support extra pathing via config
 """
 
+import math
+
+def is_missing(value):
+    """
+    Check whether a UDF cell is empty, that is None or NaN
+
+    :param value: The cell
+    :return: True if the cell holds no data
+    :rtype: bool
+    """
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def is_time_series(values):
+    """
+    Check whether the non-empty cells of a UDF column look like
+    [[time, value], ...] lists
+
+    :param values: The cells of one column
+    :type values: list
+
+    :return: True if the column holds time-series measurements
+    :rtype: bool
+    """
+    found = False
+    for value in values:
+        if is_missing(value):
+            continue
+        if not isinstance(value, (list, tuple)):
+            return False
+        if value and (not isinstance(value[0], (list, tuple)) or len(value[0]) != 2):
+            return False
+        found = True
+    return found
+
 class Formatter():
     """
     This is the generic form for a formatter; use as an interface
@@ -91,6 +127,21 @@ class Formatter():
         """
         pass
 
+    def consolidate(self, filename, checkpoint_log):
+        """
+        Save every record held in a CheckpointLog, such as one left behind
+        by an interrupted run
+
+        :param filename: Path to the location of the new file
+        :type filename: str
+
+        :param checkpoint_log: The log to read records from
+        :type checkpoint_log: CheckpointLog()
+
+        :return: None
+        """
+        self.save(filename, checkpoint_log.to_dataframe().reset_index())
+
     def open(self, filename):
         """
         Take the Formatter file format or type and transform it to the UDF
@@ -102,4 +153,4 @@ class Formatter():
         """
         pass
 
-__all__ = ['Formatter']
+__all__ = ['Formatter', 'is_missing', 'is_time_series']
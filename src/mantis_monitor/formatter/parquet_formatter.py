@@ -0,0 +1,159 @@
+"""
+This file is part of the Mantis data collection suite. Mantis, including the data collection suite (mantis-monitor)
+
+Mantis is free software: you can redistribute it and/or modify it under the terms of the GNU Lesser General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+Mantis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import itertools
+import math
+
+import numpy
+import pandas
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    _HAS_PYARROW = True
+except ImportError:          # pragma: no cover
+    pyarrow = None
+    _HAS_PYARROW = False
+
+from mantis_monitor.formatter.formatter import Formatter, is_missing, is_time_series
+
+def _time_series_array(values):
+    """
+    Build a list<struct<t, v>> column, with float64 times and values, from
+    [[time, value], ...] cells
+
+    :raises ValueError: if a time or value is not numeric
+    """
+    offsets = numpy.zeros(len(values) + 1, dtype = numpy.int32)
+    missing = numpy.zeros(len(values), dtype = bool)
+    cells = []
+    for row, value in enumerate(values):
+        if is_missing(value):
+            missing[row] = True
+        else:
+            cells.append(value)
+        offsets[row + 1] = offsets[row] + (0 if missing[row] else len(value))
+
+    # None samples become NaN
+    pairs = numpy.array(list(itertools.chain.from_iterable(cells)), dtype = numpy.float64).reshape(-1, 2)
+    pairs = pyarrow.StructArray.from_arrays(
+        [pyarrow.array(pairs[:, 0]), pyarrow.array(pairs[:, 1])], names = ["t", "v"])
+    return pyarrow.ListArray.from_arrays(pyarrow.array(offsets), pairs, mask = pyarrow.array(missing))
+
+def _column_array(values):
+    """
+    Build a typed Arrow column, falling back to strings for columns mixing
+    incompatible types
+    """
+    try:
+        if is_time_series(values):
+            return _time_series_array(values)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return pyarrow.array(values, from_pandas = True)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.array([None if is_missing(value) else str(value) for value in values], type = pyarrow.string())
+
+def _is_time_series_type(arrow_type):
+    return pyarrow.types.is_list(arrow_type) and pyarrow.types.is_struct(arrow_type.value_type) \
+        and [field.name for field in arrow_type.value_type] == ["t", "v"]
+
+def _time_series_cells(column):
+    """
+    Turn a list<struct<t, v>> column back into UDF [[time, value], ...] cells
+    """
+    column = column.combine_chunks() if isinstance(column, pyarrow.ChunkedArray) else column
+    offsets = column.offsets.to_numpy()
+    pairs = column.values
+    times = pairs.field("t").to_numpy(zero_copy_only = False)
+    samples = pairs.field("v").to_numpy(zero_copy_only = False)
+    series = numpy.column_stack((times, samples)).tolist()
+    valid = column.is_valid().to_numpy(zero_copy_only = False)
+    return [series[offsets[row]:offsets[row + 1]] if valid[row] else math.nan for row in range(len(column))]
+
+class ParquetFormatter(Formatter):
+    """
+    Saves the UDF as an Apache Parquet file
+
+    Time-series columns are stored as typed list<struct<t: double, v:
+    double>> columns, rather than as Python objects, and every column is
+    compressed. Needs the optional pyarrow package (pip install
+    mantis-monitor[parquet]).
+
+    :cvar compression: Parquet compression codec for every column
+    :type compression: str
+    """
+
+    compression = "zstd"
+
+    def __init__(self):
+        if not _HAS_PYARROW:
+            raise RuntimeError(
+                "The Parquet formatter requires the 'pyarrow' Python package.\n"
+                "  pip install mantis-monitor[parquet]")
+        self.name = "Parquet"
+
+    def to_table(self, data):
+        """
+        Convert the UDF to an Arrow table with typed columns
+
+        :param data: UDF Pandas DataFrame
+        :type data: pandas.DataFrame()
+
+        :return: The table
+        :rtype: pyarrow.Table()
+        """
+        arrays = [_column_array(data[column].tolist()) for column in data.columns]
+        return pyarrow.Table.from_arrays(arrays, names = [str(column) for column in data.columns])
+
+    def save(self, filename, data):
+        filename = filename + ".parquet"
+        pyarrow.parquet.write_table(self.to_table(data), filename, compression = self.compression)
+
+    def read_table(self, filename, columns = None):
+        """
+        Read the Parquet file as an Arrow table, without converting
+        time-series columns back to Python lists
+
+        :param filename: Path to the location of the file to read
+        :type filename: str
+        :param columns: Names of the columns to read; all if not given
+        :type columns: list
+
+        :return: The table
+        :rtype: pyarrow.Table()
+        """
+        return pyarrow.parquet.read_table(filename, columns = columns)
+
+    def open(self, filename, columns = None):
+        """
+        Read the Parquet file back into the UDF
+
+        :param filename: Path to the location of the file to read
+        :type filename: str
+        :param columns: Names of the columns to read; all if not given. Only
+        these columns are read from disk.
+        :type columns: list
+
+        :return: UDF Pandas DataFrame
+        :rtype: pandas.DataFrame()
+        """
+        table = self.read_table(filename, columns)
+        data = {}
+        for name, column in zip(table.column_names, table.columns):
+            if _is_time_series_type(column.type):
+                data[name] = pandas.Series(_time_series_cells(column), dtype = object)
+            else:
+                data[name] = column.to_pandas()
+        return pandas.DataFrame(data)
+
+Formatter.register_formatter("Parquet", ParquetFormatter)
@@ -0,0 +1,176 @@
+"""
+This file is part of the Mantis data collection suite. Mantis, including the data collection suite (mantis-monitor)
+
+Mantis is free software: you can redistribute it and/or modify it under the terms of the GNU Lesser General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+
+Mantis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import itertools
+
+import numpy
+import pandas
+
+from mantis_monitor.formatter.formatter import Formatter, is_missing, is_time_series
+
+def split_udf(data):
+    """
+    Normalize the wide UDF into a metadata table and a long time-series table
+
+    The metadata table keeps one row per UDF row, with every column which is
+    not a time series, plus a run_id. The time-series table has one row per
+    sample, with the columns run_id (int64), metric (categorical), t and
+    value (float64). A time-series column holding a non-numeric sample is
+    left in the metadata table.
+
+    :param data: UDF Pandas DataFrame
+    :type data: pandas.DataFrame()
+
+    :return: (runs, samples) tuple of DataFrames
+    :rtype: tuple
+    """
+    run_ids = numpy.arange(len(data), dtype = numpy.int64)
+    runs = {"run_id": run_ids}
+    metrics = []
+    for column in data.columns:
+        values = data[column].tolist()
+        pairs = None
+        if is_time_series(values):
+            lengths = numpy.array([0 if is_missing(value) else len(value) for value in values], dtype = numpy.int64)
+            cells = [value for value in values if not is_missing(value)]
+            try:
+                pairs = numpy.array(list(itertools.chain.from_iterable(cells)), dtype = numpy.float64).reshape(-1, 2)
+            except (TypeError, ValueError):
+                pairs = None
+        if pairs is None:
+            runs[column] = data[column].to_numpy()
+        else:
+            metrics.append((str(column), numpy.repeat(run_ids, lengths), pairs))
+
+    names = [metric[0] for metric in metrics]
+    samples = pandas.DataFrame({
+        "run_id":   numpy.concatenate([metric[1] for metric in metrics] or [numpy.zeros(0, dtype = numpy.int64)]),
+        "metric":   pandas.Categorical.from_codes(
+                        numpy.repeat(numpy.arange(len(metrics)), [len(metric[1]) for metric in metrics]).astype(numpy.int64),
+                        categories = names),
+        "t":        numpy.concatenate([metric[2][:, 0] for metric in metrics] or [numpy.zeros(0)]),
+        "value":    numpy.concatenate([metric[2][:, 1] for metric in metrics] or [numpy.zeros(0)]),
+        })
+    return pandas.DataFrame(runs), samples
+
+def join_udf(runs, samples):
+    """
+    Rebuild the wide UDF from the tables made by split_udf()
+
+    Rows with no samples for a metric get NaN, as in the UDF.
+
+    :param runs: Metadata table, one row per run_id
+    :type runs: pandas.DataFrame()
+    :param samples: Long time-series table
+    :type samples: pandas.DataFrame()
+
+    :return: UDF Pandas DataFrame
+    :rtype: pandas.DataFrame()
+    """
+    data = runs.set_index("run_id", drop = False)
+    samples = samples.sort_values(["metric", "run_id"], kind = "stable")
+    for metric, group in samples.groupby("metric", sort = False, observed = True):
+        run_ids = group["run_id"].to_numpy()
+        pairs = numpy.column_stack((group["t"].to_numpy(), group["value"].to_numpy())).tolist()
+        starts = numpy.flatnonzero(numpy.r_[True, run_ids[1:] != run_ids[:-1]])
+        ends = numpy.r_[starts[1:], len(run_ids)]
+        cells = pandas.Series([pairs[start:end] for start, end in zip(starts, ends)], \
+            index = run_ids[starts], dtype = object)
+        data[str(metric)] = cells.reindex(data.index)
+    return data.drop(columns = "run_id").reset_index(drop = True)
+
+class TidyFormatter(Formatter):
+    """
+    Saves the UDF as two CSV files: <name>_runs.csv, holding the metadata of
+    each UDF row, and <name>_samples.csv, holding every time-series sample
+    as a (run_id, metric, t, value) row
+
+    Subclasses can change the file format by overriding write_table() and
+    read_table().
+
+    :cvar extension: File extension for both tables
+    :type extension: str
+    """
+
+    extension = ".csv"
+
+    def __init__(self):
+        self.name = "Tidy"
+
+    def write_table(self, filename, table):
+        table.to_csv(filename, index = False)
+
+    def read_table(self, filename):
+        return pandas.read_csv(filename, float_precision = "round_trip")
+
+    def save(self, filename, data):
+        runs, samples = split_udf(data)
+        self.write_table(filename + "_runs" + self.extension, runs)
+        self.write_table(filename + "_samples" + self.extension, samples)
+
+    def open_tables(self, filename):
+        """
+        Read back the metadata and time-series tables
+
+        :param filename: Path the tables were saved under, without the
+        _runs/_samples suffix and extension
+        :type filename: str
+
+        :return: (runs, samples) tuple of DataFrames
+        :rtype: tuple
+        """
+        runs = self.read_table(filename + "_runs" + self.extension)
+        samples = self.read_table(filename + "_samples" + self.extension)
+        samples["metric"] = samples["metric"].astype("category")
+        return runs, samples
+
+    def open(self, filename):
+        """
+        Read back the tables and rebuild the wide UDF from them
+
+        :param filename: Path the tables were saved under, without the
+        _runs/_samples suffix and extension
+        :type filename: str
+
+        :return: UDF Pandas DataFrame
+        :rtype: pandas.DataFrame()
+        """
+        return join_udf(*self.open_tables(filename))
+
+class TidyParquetFormatter(TidyFormatter):
+    """
+    Saves the same two tables as TidyFormatter, as Parquet files
+
+    Needs the optional pyarrow package (pip install mantis-monitor[parquet]).
+    """
+
+    extension = ".parquet"
+
+    def __init__(self):
+        self.name = "TidyParquet"
+
+    def write_table(self, filename, table):
+        # Metadata columns may mix types (ex, measurements is a list for
+        # some Collectors and a string for others), so store those as text,
+        # in a copy; the caller's table goes on to any other formatters
+        mixed = [column for column in table.columns \
+            if table[column].dtype == object and table[column].map(type).nunique() > 1]
+        if mixed:
+            table = table.copy()
+        for column in mixed:
+            table[column] = table[column].map(lambda value: None if is_missing(value) else str(value))
+        table.to_parquet(filename, index = False, compression = "zstd")
+
+    def read_table(self, filename):
+        return pandas.read_parquet(filename)
+
+Formatter.register_formatter("Tidy", TidyFormatter)
+Formatter.register_formatter("TidyParquet", TidyParquetFormatter)
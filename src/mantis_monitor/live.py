@@ -0,0 +1,226 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the implementation of the LiveServer.
+
+While TestRuns are running, their SampleBuffers are listed in
+collector.live_records. The LiveServer is a small HTTP/1.0 server, on
+localhost or a Unix socket, which reads those buffers and answers with JSON,
+so a long campaign can be watched (and a bad run stopped) before any output
+is written.
+
+Configured via the optional ``live`` key in the config.yaml::
+
+    live:
+      address: 127.0.0.1:8765         # or unix:/tmp/mantis-live.sock
+      window: 10                      # seconds of samples to aggregate
+
+Endpoints:
+
+    - ``/`` lists every running TestRun: its UDF metadata, how long it has
+      run, and per metric the sample count, latest sample, and the mean, min
+      and max over the last ``window`` seconds (``?window=`` overrides it)
+    - ``/samples?run=<id>&metric=<name>&last=<n>`` returns the latest n
+      samples (default 100) of one metric as [[time, value], ...]
+
+For example: ``curl --unix-socket /tmp/mantis-live.sock http://localhost/``
+
+Only TestRuns which fill their buffers as they go (perf streaming, PFS, BPF)
+have samples before they finish. Missing values are sent as null.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+import urllib.parse
+
+import numpy
+
+from mantis_monitor.collector.collector import SampleBuffer, live_records
+
+def _number(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+class LiveServer():
+    """
+    Serves the samples of the running TestRuns as JSON over HTTP
+
+    :ivar address: HOST:PORT, or unix:PATH, to listen on
+    :type address: str
+    :ivar window: Default number of seconds of samples to aggregate
+    :type window: float
+    :ivar server: The listening server, once started
+    :type server: asyncio.Server
+    """
+
+    def __init__(self, address, window = 10):
+        """
+        Init the object
+
+        :param address: HOST:PORT, or unix:PATH, to listen on; the host
+        defaults to 127.0.0.1
+        :type address: str
+        :param window: Default number of seconds of samples to aggregate
+        :type window: float
+
+        :return: None
+        """
+        self.address = str(address)
+        self.window = float(window)
+        self.server = None
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """
+        Build the LiveServer described by a Configuration(), if any
+
+        :param configuration: Configuration object from this mantis-monitor instance
+        :type configuration: Configuration()
+
+        :return: A LiveServer, or None if the config has no live section
+        :rtype: LiveServer()
+        """
+        if not configuration.live:
+            return None
+        return cls(configuration.live["address"], configuration.live.get("window", 10))
+
+    async def start(self):
+        """
+        Start listening
+
+        :return: None
+        """
+        if self.address.startswith("unix:"):
+            path = self.address[len("unix:"):]
+            if os.path.exists(path):
+                os.remove(path)   # left behind by an earlier run
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            host, _, port = self.address.rpartition(":")
+            self.server = await asyncio.start_server(self.handle, host or "127.0.0.1", int(port))
+        print("Serving live metrics on", self.address)
+
+    async def close(self):
+        """
+        Stop listening
+
+        :return: None
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            if self.address.startswith("unix:") and os.path.exists(self.address[len("unix:"):]):
+                os.remove(self.address[len("unix:"):])
+
+    def summary(self, window = None):
+        """
+        Describe every running TestRun and aggregate its recent samples
+
+        :param window: Seconds of samples to aggregate; defaults to self.window
+        :type window: float
+
+        :return: One entry per running TestRun
+        :rtype: list
+        """
+        window = self.window if window is None else window
+        now = time.time()
+        runs = []
+        for run_id, (started, record) in list(live_records.items()):
+            run = {"run": run_id, "elapsed": now - started, "metrics": {}}
+            for key, value in list(record.items()):
+                if not isinstance(value, SampleBuffer):
+                    if isinstance(value, (str, int, float, list)) or value is None:
+                        run[key] = value
+                    continue
+                metric = {"samples": len(value)}
+                if len(value):
+                    times, values = value.to_numpy()
+                    recent = values[numpy.searchsorted(times, times[-1] - window):]
+                    recent = recent[~numpy.isnan(recent)]
+                    metric["latest"] = [_number(times[-1]), _number(values[-1])]
+                    if len(recent):
+                        metric["mean"] = _number(recent.mean())
+                        metric["min"] = _number(recent.min())
+                        metric["max"] = _number(recent.max())
+                run["metrics"][key] = metric
+            runs.append(run)
+        return runs
+
+    def samples(self, run_id, metric, last = 100):
+        """
+        Fetch the latest samples of one metric of a running TestRun
+
+        :param run_id: The run's id, as listed by summary()
+        :type run_id: int
+        :param metric: Name of the metric
+        :type metric: str
+        :param last: How many samples to return
+        :type last: int
+
+        :return: [[time, value], ...], or None if there is no such metric
+        :rtype: list
+        """
+        started, record = live_records.get(run_id, (None, {}))
+        buffer = record.get(metric)
+        if not isinstance(buffer, SampleBuffer):
+            return None
+        times, values = buffer.to_numpy()
+        start = max(0, len(times) - last)
+        return [[_number(t), _number(v)] for t, v in zip(times[start:], values[start:])]
+
+    async def handle(self, reader, writer):
+        """
+        Answer one HTTP request
+
+        :param reader: The client connection
+        :type reader: asyncio.StreamReader()
+        :param writer: The client connection
+        :type writer: asyncio.StreamWriter()
+
+        :return: None
+        """
+        try:
+            request = (await reader.readline()).decode(errors = "replace").split()
+            while (await reader.readline()).strip():
+                pass   # headers are not needed
+            status, body = "404 Not Found", {"error": "not found"}
+            if len(request) >= 2 and request[0] == "GET":
+                url = urllib.parse.urlsplit(request[1])
+                query = dict(urllib.parse.parse_qsl(url.query))
+                try:
+                    if url.path == "/":
+                        status, body = "200 OK", self.summary(float(query["window"]) if "window" in query else None)
+                    elif url.path == "/samples":
+                        samples = self.samples(int(query.get("run", -1)), query.get("metric"), int(query.get("last", 100)))
+                        if samples is not None:
+                            status, body = "200 OK", samples
+                except ValueError as error:
+                    status, body = "400 Bad Request", {"error": str(error)}
+            payload = json.dumps(body, default = str).encode()
+            writer.write("HTTP/1.0 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format( \
+                status, len(payload)).encode() + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+__all__ = ['LiveServer']
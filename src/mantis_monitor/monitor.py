@@ -22,19 +22,23 @@ Here, all objects are used and coordinated with as little entanglement
 as possible.
 """
 
+from mantis_monitor import accumulator
+from mantis_monitor import checkpoint
 from mantis_monitor import benchmark
 from mantis_monitor import configuration
 from mantis_monitor import collector
 from mantis_monitor import formatter
+from mantis_monitor import scheduler
+from mantis_monitor import distributed
+from mantis_monitor import live
+from mantis_monitor import overhead
 
-import pandas
 import argparse
-import collections.abc
 import asyncio
+import functools
 import os
 
 
-
 async def main():
     """
     Main run script for Mantis Monitor
@@ -51,15 +55,32 @@ async def main():
                         description = 'Monitoring suite for program performance profiling',
                         epilog = 'Please contact melanie.e.cornelius@gmail.com for additional information.')
 
-    parser.add_argument("config", type=str,
+    parser.add_argument("config", type=str, nargs="?",
                         help="Location of configuration file")
     parser.add_argument("--log", type=bool, default=False, 
                         help="print logs to file, defaults to false")
     parser.add_argument("--v", action="store_true",
                         help="print verbose information to std out")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint log, skipping completed collector runs")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="start afresh, discarding the checkpoint log of an interrupted run")
+    parser.add_argument("--consolidate", action="store_true",
+                        help="write the output of an interrupted run from its checkpoint log, without running anything")
+    parser.add_argument("--coordinator", type=str, metavar="HOST:PORT",
+                        help="hand the campaign's collector runs out to workers connecting on this address")
+    parser.add_argument("--worker", type=str, metavar="HOST:PORT",
+                        help="run collector runs for the coordinator at this address; no config file is needed")
 
     args = parser.parse_args()
 
+    if args.worker:
+        print("Welcome to Mantis-Monitor! Working for coordinator", args.worker)
+        await distributed.run_worker(args.worker)
+        return
+    if not args.config:
+        parser.error("a configuration file is required unless running with --worker")
+
     config_location = args.config
     config = configuration.Configuration(location=config_location)
     
@@ -69,80 +90,94 @@ async def main():
     print("Now beginning the data collection process...")
 
     dataframe_columns = ["benchmark_name", "collector_name", "iteration", "timescale", "units", "measurements"]
-    data = pandas.DataFrame(columns = dataframe_columns)
+    data_accumulator = accumulator.ResultAccumulator(dataframe_columns)
 
-    run_benchmarks = []
-    
-    # Process benchmark matrix configuration
-    if isinstance(config.benchmark_matrix, collections.abc.Sequence):
-        bench_sets = []
-        for benchmark_set in config.benchmark_matrix:
-            benchmarks = []
-            for bench in benchmark_set:
-                bench_datas = [ b for b in config.contents["benchmarks"] if b["name"] == bench ]
-                if len(bench_datas) != 1:
-                    raise Exception("Could not match benchmark name " + bench + " to a single configured benchmark")
-                bench_data = bench_datas[0]
-                if "type" not in bench_data:
-                    bench_data["type"] = "generic_benchmark"
-                benchmarks.extend(benchmark.benchmark.Benchmark.get_benchmarks(bench_data["type"], bench_data))
-            bench_sets.append((':'.join(benchmark_set),benchmarks))
-        run_benchmarks = bench_sets
-    else:
-        for bench in config.contents["benchmarks"]:
-            if "type" not in bench:
-                bench["type"] = "generic_benchmark"
-            print("Adding benchmark ", bench["type"], bench["name"])
-            run_benchmarks.extend(benchmark.benchmark.Benchmark.get_benchmarks(bench["type"], bench) or [])
-
-    for each_benchmark in run_benchmarks:
-        benchmarks = each_benchmark
-        if type(benchmarks) is not tuple:
-            benchmarks = ('solo', [benchmarks])
-
-        for bench in benchmarks[1]:
-            bench.before_all()
+    run_benchmarks = benchmark.benchmark.Benchmark.get_benchmark_sets(config)
 
+    # Every finished TestRun is appended here, so a crash loses at most the TestRuns in flight
+    checkpoint_log = checkpoint.CheckpointLog(config.test_name + '_incomplete')
+    if args.consolidate:
+        # The log is kept, so the run can still be resumed
+        if not os.path.exists(checkpoint_log.filename):
+            parser.error("no checkpoint log {} to consolidate".format(checkpoint_log.filename))
+        filename = config.test_name + '_incomplete'
+        print("Consolidating {} into {}".format(checkpoint_log.filename, filename))
+        for mode in config.formatter_modes or []:
+            formatter.formatter.Formatter.get_formatter(mode).consolidate(filename, checkpoint_log)
+        return
+    skip_cells = set()
+    if args.resume:
+        # A co-running cell is only skipped if every benchmark in it finished
+        completed = checkpoint_log.completed()
+        for benchmarks in run_benchmarks:
+            for iteration in range(config.iterations):
+                for mode in config.collector_modes:
+                    cells = [checkpoint_log.cell(bench.name, benchmarks[0], mode, iteration) for bench in benchmarks[1]]
+                    if all(cell in completed for cell in cells):
+                        skip_cells.update(cells)
+        print("Resuming from {}: skipping {} completed collector runs".format(checkpoint_log.filename, len(skip_cells)))
+        for records in checkpoint_log.resume(skip_cells):
+            data_accumulator.extend(records)
+    else:
+        try:
+            checkpoint_log.open(overwrite = args.overwrite)
+        except FileExistsError:
+            parser.error("{} is left from an interrupted run; use --resume to continue it, or --overwrite to " \
+                "discard it".format(checkpoint_log.filename))
+
+    # Build every cell still to run, as (set index, iteration, mode); with
+    # multiplex, the modes able to share a launch form one cell, with a tuple
+    # of modes
+    todo = []
+    for group, benchmarks in enumerate(run_benchmarks):
         for iteration in range(config.iterations):
+            modes = []
             for mode in config.collector_modes:
-                generators = []
-                collectors = []
+                keys = [checkpoint_log.cell(bench.name, benchmarks[0], mode, iteration) for bench in benchmarks[1]]
+                if not all(key in skip_cells for key in keys):
+                    modes.append(mode)
+            shared = [mode for mode in modes if config.multiplex and collector.collector.Collector.is_multiplexable(mode)]
+            if len(shared) > 1:
+                todo.append((group, iteration, tuple(shared)))
+                modes = [mode for mode in modes if mode not in shared]
+            for mode in modes:
+                todo.append((group, iteration, mode))
+
+    # The coordinator runs nothing itself, so only serve live metrics where cells run
+    live_server = None if args.coordinator else live.LiveServer.from_configuration(config)
+    if live_server:
+        await live_server.start()
+
+    if args.coordinator:
+        await distributed.Coordinator(config, todo, checkpoint_log, data_accumulator, args.coordinator).run()
+    else:
+        # before_all() and after_all() bracket the cells of each set
+        async def run_group_cell(group, iteration, mode):
+            benchmarks = group["benchmarks"]
+            if not group["started"]:
+                group["started"] = True
+                for bench in benchmarks[1]:
+                    bench.before_all()
+            await scheduler.run_cell(config, benchmarks, iteration, mode, checkpoint_log, data_accumulator)
+            group["remaining"] -= 1
+            if group["remaining"] == 0:
                 for bench in benchmarks[1]:
-                    this_collector = collector.collector.Collector.get_collector(mode, config, iteration, bench, benchmarks[0])
-                    if this_collector:
-                        collectors.append(this_collector)
-                        generators.append(this_collector.run_all())
-                running_collectors = True
-                while running_collectors:
-                    testruns = list(map(lambda x: x.asend(None), generators))
-                    print("Running testruns:", testruns)
-                    results = await asyncio.gather(*testruns, return_exceptions=True)
-                    print("Results:", results)
-                    running_collectors = False
-                    for result in results:
-                        if not isinstance(result, StopAsyncIteration):
-                            running_collectors = True
-                    
-
-                for this_collector in collectors:
-                    new_data = pandas.DataFrame(this_collector.data)
-                    data = pandas.concat([data, new_data])
-
-        for bench in benchmarks[1]:
-            bench.after_all()
-
-        temp_data = data.reset_index()
+                    bench.after_all()
 
-        filename = config.test_name + '_incomplete'
-        if config.formatter_modes:
-            for mode in config.formatter_modes:
-                this_formatter = formatter.formatter.Formatter.get_formatter(mode)
-                if this_formatter is None:
-                    print(f"Formatter {mode} not found, skipping.")
-                    print("Available formatters:", formatter.formatter.Formatter.implementations.keys())
-                this_formatter.save(filename, temp_data)
+        groups = [{"benchmarks": benchmarks, "started": False, "remaining": 0} for benchmarks in run_benchmarks]
+        cells = []
+        for group, iteration, mode in todo:
+            groups[group]["remaining"] += 1
+            cells.append((scheduler.is_exclusive_cell(mode), \
+                functools.partial(run_group_cell, groups[group], iteration, mode)))
+
+        try:
+            await scheduler.CellScheduler.from_configuration(config).run(cells)
+        finally:
+            if live_server:
+                await live_server.close()
 
-    data = data.reset_index()
+    data = data_accumulator.to_dataframe().reset_index()
 
     filename = config.test_name
     if config.formatter_modes:
@@ -151,11 +186,13 @@ async def main():
             print(data)
             this_formatter.save(filename, data)
 
-    # Now removing any files with "incomplete" in their name
-    for file in os.listdir('.'):
-        if "incomplete" in file:
-            print("Removing incomplete file:", file)
-            os.remove(file)
+    if config.overhead:
+        print("Benchmark runtime under each collector, compared to ttc:")
+        print(overhead.duration_overhead(data).to_string())
+
+    # All data is now in the consolidated output, so the checkpoint is no longer needed
+    print("Removing checkpoint log:", checkpoint_log.filename)
+    checkpoint_log.remove()
 
 def run():
     """
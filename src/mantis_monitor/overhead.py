@@ -0,0 +1,60 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains helpers for measuring how much mantis-monitor perturbs
+the benchmarks it watches.
+
+There are two views of this. With "overhead: true" in the config.yaml,
+sampling Collectors time every tick of their sampling loop (see
+OverheadRecorder) and add "<name>_overhead" records to the UDF. And the ttc
+Collector runs each benchmark with nothing attached, so comparing every
+other Collector's benchmark runtime against ttc's, per benchmark and
+iteration, shows the slowdown each Collector causes end to end;
+duration_overhead() builds that comparison.
+"""
+
+import pandas
+
+def duration_overhead(data):
+    """
+    Compare each Collector's benchmark runtime against the ttc baseline
+
+    :param data: UDF Pandas DataFrame, which must include ttc records
+    :type data: pandas.DataFrame()
+
+    :return: One row per non-ttc record with a matching baseline, with the
+    columns benchmark_name, benchmark_set, iteration, collector_name,
+    duration, baseline_duration and slowdown (duration / baseline - 1)
+    :rtype: pandas.DataFrame()
+    """
+    keys = ["benchmark_name", "benchmark_set", "iteration"]
+    columns = keys + ["collector_name", "duration", "baseline_duration", "slowdown"]
+    if "measurements" not in data.columns:
+        return pandas.DataFrame(columns = columns)
+
+    is_baseline = data["measurements"].map(lambda value: value == "baseline_duration")
+    is_overhead = data["collector_name"].astype(str).str.endswith("_overhead")
+    baselines = data.loc[is_baseline, keys + ["duration"]] \
+        .rename(columns = {"duration": "baseline_duration"}) \
+        .groupby(keys, as_index = False).mean()
+    runs = data.loc[~is_baseline & ~is_overhead, keys + ["collector_name", "duration"]]
+
+    comparison = runs.merge(baselines, on = keys)
+    comparison["slowdown"] = comparison["duration"] / comparison["baseline_duration"] - 1
+    return comparison[columns]
+
+__all__ = ['duration_overhead']
@@ -0,0 +1,324 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+This file contains the implementation of the CellScheduler.
+
+A cell is one collection mode run against one benchmark set for one
+iteration. By default cells run one after another, as they always have.
+The scheduler lets cells whose Collectors are not exclusive (see
+Collector.exclusive) run side by side, up to a configured limit, with each
+running cell optionally pinned to its own set of CPUs.
+
+Configured via the optional ``scheduler`` key in the config.yaml::
+
+    scheduler:
+      max_parallel: 4        # cells allowed to run at once, default 1
+      cpusets:               # optional, one CPU list per parallel slot
+        - 0-7
+        - 8-15
+        - 16-23
+        - 24-31
+
+When ``cpusets`` is given and ``max_parallel`` is not, one cell runs per CPU
+set. Exclusive cells always wait for the node to drain and run alone,
+unpinned.
+
+Cells are started strictly in order, so an exclusive cell is never starved by
+the shareable cells queued behind it.
+
+With ``multiplex: true`` in the config.yaml, the multiplexable collection
+modes (see Collector.multiplexable) of each benchmark set and iteration are
+put in one cell, whose Collectors all observe a single launch of each
+benchmark (see LaunchHandle). A Collector which needs more than one launch
+(ex, perf with more counters than the PMUs hold at once) still runs on its own, after
+the shared launch.
+"""
+
+import asyncio
+import os
+
+from mantis_monitor.checkpoint import CheckpointLog
+from mantis_monitor.collector.collector import Collector, current_cpuset
+from mantis_monitor.collector.launch import LaunchHandle
+
+def parse_cpuset(cpuset):
+    """
+    Turn a Linux-style CPU list (ex, "0-3,8,10-11") into a set of CPU numbers
+
+    :param cpuset: CPU list string, a single int, or a list of ints
+    :type cpuset: str
+
+    :return: The CPU numbers
+    :rtype: set
+    """
+    if isinstance(cpuset, int):
+        return {cpuset}
+    if not isinstance(cpuset, str):
+        return set(int(cpu) for cpu in cpuset)
+
+    cpus = set()
+    for part in cpuset.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+async def _step_collectors(entries, benchmarks, iteration, checkpoint_log, shared, tracker_interval = 0.1):
+    """
+    Step the given Collectors' TestRuns together until all have finished,
+    checkpointing records as they arrive
+
+    :param entries: (mode, Collector()) pairs
+    :param benchmarks: (benchmark_set, [Benchmark()]) tuple
+    :param iteration: The statistical or experimental iteration
+    :param checkpoint_log: CheckpointLog() to append records to
+    :param shared: Whether the Collectors observe one LaunchHandle() per
+    benchmark instead of launching their own; each then runs one TestRun
+    :param tracker_interval: Seconds between polls of each shared launch's
+    process tree
+
+    :return: None
+    """
+    generators = [this_collector.run_all() for _, this_collector in entries]
+    handles = []
+    try:
+        if shared:
+            for bench in benchmarks[1]:
+                attached = [this_collector for _, this_collector in entries if this_collector.benchmark is bench]
+                if not attached:
+                    continue
+                bench.before_each()
+                handle = LaunchHandle(bench, tracker_interval)
+                handles.append((handle, attached))
+                await handle.launch()
+                for this_collector in attached:
+                    this_collector.launch = handle
+
+        checkpointed = [0] * len(entries)
+        finished = [False] * len(entries)
+        running_collectors = True
+        while running_collectors:
+            testruns = [asyncio.ensure_future(generator.asend(None)) for generator in generators]
+            print("Running testruns:", testruns)
+            if handles:
+                # Start every benchmark once all of its observers are in place
+                try:
+                    for handle, attached in handles:
+                        await handle.wait_attached(len(attached), \
+                            [testrun for testrun, (_, this_collector) in zip(testruns, entries) if this_collector in attached])
+                finally:
+                    for handle, _ in handles:
+                        handle.release()
+            results = await asyncio.gather(*testruns, return_exceptions=True)
+            print("Results:", results)
+            if handles:
+                for handle, attached in handles:
+                    await handle.close()
+                    handle.benchmark.after_each()
+                    for this_collector in attached:
+                        this_collector.launch = None
+                handles = []
+            running_collectors = False
+            for result in results:
+                if not isinstance(result, StopAsyncIteration):
+                    running_collectors = True
+
+            # Checkpoint only the records added by the TestRuns which just finished
+            for index, (mode, this_collector) in enumerate(entries):
+                cell = CheckpointLog.cell(this_collector.benchmark.name, benchmarks[0], mode, iteration)
+                new_records = (this_collector.data or [])[checkpointed[index]:]
+                if new_records:
+                    checkpoint_log.write(new_records, cell)
+                    checkpointed[index] += len(new_records)
+                if finished[index]:
+                    continue
+                if isinstance(results[index], StopAsyncIteration):
+                    checkpoint_log.mark_done(cell)
+                    finished[index] = True
+                elif isinstance(results[index], BaseException):
+                    # A failed collector is left unfinished so --resume reruns it
+                    finished[index] = True
+    finally:
+        for handle, _ in handles:
+            await handle.close()
+
+async def run_cell(config, benchmarks, iteration, mode, checkpoint_log, data_accumulator = None):
+    """
+    Run one collection mode against one benchmark set for one iteration
+
+    Co-running benchmarks in the set each get their own Collector, and their
+    TestRuns are stepped together. The records of every finished TestRun are
+    checkpointed as they arrive; each Collector's cell is marked done once
+    it has run all of its TestRuns.
+
+    mode may also be a list of modes (see Configuration.multiplex). The
+    Collectors which can attach to a shared launch (see
+    Collector.can_attach()) then all observe a single execution of each
+    benchmark; any others run afterwards, one mode at a time, as usual.
+
+    :param config: Configuration object from this mantis-monitor instance
+    :param benchmarks: (benchmark_set, [Benchmark()]) tuple
+    :param iteration: The statistical or experimental iteration
+    :param mode: Name of the Collector to run, or a list of names
+    :param checkpoint_log: CheckpointLog() to append records to, or any
+    object with the same write() and mark_done() methods
+    :param data_accumulator: ResultAccumulator() holding the UDF, if any
+
+    :return: None
+    """
+    modes = [mode] if isinstance(mode, str) else list(mode)
+    entries = []
+    for this_mode in modes:
+        for bench in benchmarks[1]:
+            this_collector = Collector.get_collector(this_mode, config, iteration, bench, benchmarks[0])
+            if this_collector:
+                entries.append((this_mode, this_collector))
+
+    shared = [entry for entry in entries if len(modes) > 1 and entry[1].can_attach()]
+    if shared:
+        print("Running {} on one launch per benchmark".format(", ".join(sorted(set(entry[0] for entry in shared)))))
+        await _step_collectors(shared, benchmarks, iteration, checkpoint_log, True, min(0.1, config.timescale / 1000))
+    for this_mode in modes:
+        alone = [entry for entry in entries if entry[0] == this_mode and entry not in shared]
+        if alone:
+            await _step_collectors(alone, benchmarks, iteration, checkpoint_log, False)
+
+    if data_accumulator is not None:
+        for _, this_collector in entries:
+            data_accumulator.extend(this_collector.data)
+
+def is_exclusive_cell(mode):
+    """
+    Check whether a cell's mode, or any of its list of modes, must run alone
+
+    :param mode: Name of the Collector, or a list of names
+    :type mode: str
+
+    :return: True if the cell needs the node to itself
+    :rtype: bool
+    """
+    modes = [mode] if isinstance(mode, str) else mode
+    return any(Collector.is_exclusive(this_mode) for this_mode in modes)
+
+class CellScheduler():
+    """
+    Runs cells with bounded concurrency and per-cell CPU pinning
+
+    :ivar max_parallel: How many cells may run at once
+    :type max_parallel: int
+    :ivar cpusets: CPU sets handed out to running shareable cells, if any
+    :type cpusets: list
+    """
+
+    def __init__(self, max_parallel = None, cpusets = None):
+        """
+        Init the object
+
+        :param max_parallel: How many cells may run at once; defaults to the
+        number of cpusets, or 1
+        :type max_parallel: int
+        :param cpusets: CPU lists (see parse_cpuset()) to pin parallel cells to
+        :type cpusets: list
+
+        :return: None
+        """
+        self.cpusets = [parse_cpuset(cpuset) for cpuset in cpusets or []]
+        available = os.sched_getaffinity(0)
+        for cpuset in self.cpusets:
+            if not cpuset or not cpuset <= available:
+                raise ValueError("scheduler cpuset {} is not within the CPUs available to mantis-monitor ({})".format( \
+                    sorted(cpuset), sorted(available)))
+        if max_parallel is None:
+            max_parallel = len(self.cpusets) or 1
+        if self.cpusets and max_parallel > len(self.cpusets):
+            raise ValueError("scheduler max_parallel is larger than the number of cpusets")
+        self.max_parallel = max(1, int(max_parallel))
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        """
+        Build the scheduler described by a Configuration()
+
+        :param configuration: Configuration object from this mantis-monitor instance
+        :type configuration: Configuration()
+
+        :return: A CellScheduler
+        :rtype: CellScheduler()
+        """
+        return cls(configuration.scheduler.get("max_parallel"), configuration.scheduler.get("cpusets"))
+
+    async def run(self, cells):
+        """
+        Run every cell, returning once all have finished
+
+        :param cells: (exclusive, coroutine function) pairs, in the order
+        they should be started. Each function is called with no arguments.
+        :type cells: list
+
+        :return: None
+        :raises Exception: the first exception raised by a cell, after the
+        cells running alongside it have finished
+        """
+        condition = asyncio.Condition()
+        free_cpusets = list(self.cpusets)
+        running = set()
+        failures = []
+        state = {"exclusive": False}
+
+        async def run_cell(function, cpus):
+            current_cpuset.set(cpus)
+            try:
+                await function()
+            except Exception as error:
+                failures.append(error)
+            finally:
+                async with condition:
+                    state["exclusive"] = False
+                    if cpus is not None:
+                        free_cpusets.append(cpus)
+                    running.discard(asyncio.current_task())
+                    condition.notify_all()
+
+        for exclusive, function in cells:
+            if failures:
+                break
+            async with condition:
+                if exclusive:
+                    await condition.wait_for(lambda: not running)
+                else:
+                    await condition.wait_for(lambda: not state["exclusive"] and len(running) < self.max_parallel)
+
+                cpus = None
+                if not exclusive and free_cpusets:
+                    cpus = free_cpusets.pop(0)
+                state["exclusive"] = exclusive
+                running.add(asyncio.create_task(run_cell(function, cpus)))
+
+        async with condition:
+            await condition.wait_for(lambda: not running)
+
+        # Like the sequential loop, a failing cell stops the campaign; cells
+        # already running are allowed to finish first
+        if failures:
+            raise failures[0]
+
+__all__ = ['CellScheduler', 'is_exclusive_cell', 'parse_cpuset', 'run_cell']
@@ -0,0 +1,128 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Tests for DoubleBufferedCounters, draining fake per-CPU tables with bcc's
+table methods while simulated events are counted. Some events look their
+slot up before a drain and only write to it after, as a BPF program can.
+"""
+
+import ctypes
+import random
+
+import pytest
+
+from mantis_monitor.collector.bpf_maps import DoubleBufferedCounters
+
+class FakePerCPUArray():
+    """
+    A per-CPU array with bcc's table methods, optionally without the batch
+    operations
+    """
+
+    Key = ctypes.c_int
+    Leaf = ctypes.c_ulonglong
+
+    def __init__(self, size, cpus, batch):
+        self.values = [[0] * cpus for _ in range(size)]
+        self.batch = batch
+
+    def items(self):
+        return [(self.Key(index), list(values)) for index, values in enumerate(self.values)]
+
+    def items_lookup_batch(self):
+        if not self.batch:
+            raise OSError("batch operations not supported")
+        return self.items()
+
+    def items_update_batch(self, keys, leaves):
+        if not self.batch:
+            raise OSError("batch operations not supported")
+        for key, leaf in zip(keys, leaves):
+            self.values[key] = [leaf] * len(self.values[key])
+
+    def clear(self):
+        for values in self.values:
+            values[:] = [0] * len(values)
+
+class FakeSelector():
+    """
+    A one-entry array with bcc's item assignment
+    """
+
+    Key = ctypes.c_int
+    Leaf = ctypes.c_uint
+
+    def __init__(self):
+        self.slot = 0
+
+    def __setitem__(self, key, leaf):
+        self.slot = leaf.value
+
+def make_counters(size, cpus, batch):
+    slots = (FakePerCPUArray(size, cpus, batch), FakePerCPUArray(size, cpus, batch))
+    selector = FakeSelector()
+    return slots, selector, DoubleBufferedCounters(slots, selector, size)
+
+@pytest.mark.parametrize("batch", [True, False], ids = ["batch", "per_entry"])
+def test_late_writes_counted_once(batch, intervals = 1000, size = 8, cpus = 4):
+    rng = random.Random(0)
+    slots, selector, counters = make_counters(size, cpus, batch)
+    assert counters.batch == batch
+    sent = [0] * size
+    counted = [0] * size
+    late = []
+    for interval in range(intervals):
+        # Events which looked their slot up before the last drain land now
+        for slot, cpu, index in late:
+            slots[slot].values[index][cpu] += 1
+        late = []
+        for _ in range(rng.randrange(50)):
+            slot, cpu, index = selector.slot, rng.randrange(cpus), rng.randrange(size)
+            sent[index] += 1
+            if rng.random() < 0.1:
+                late.append((slot, cpu, index))
+            else:
+                slots[slot].values[index][cpu] += 1
+        drained = counters.drain()
+        assert all(count >= 0 for count in drained)
+        counted = [total + count for total, count in zip(counted, drained)]
+        pending = [0] * size
+        for _, _, index in late:
+            pending[index] += 1
+        assert [total + waiting for total, waiting in zip(counted, pending)] == sent, interval
+    for slot, cpu, index in late:
+        slots[slot].values[index][cpu] += 1
+    counted = [total + count for total, count in zip(counted, counters.drain())]
+    assert counted == sent
+
+def test_drain_sums_cpus_and_flips_slots():
+    slots, selector, counters = make_counters(3, 2, True)
+    slots[0].values[1] = [2, 5]
+    assert counters.drain() == [0, 7, 0]
+    assert selector.slot == 1 and counters.active == 1
+    slots[1].values[2] = [1, 1]
+    assert counters.drain() == [0, 0, 2]
+    assert selector.slot == 0 and slots[0].values[1] == [0, 0]
+
+def test_reset_zeroes_a_reused_program():
+    slots, selector, counters = make_counters(2, 2, False)
+    slots[0].values[0] = [3, 4]
+    slots[1].values[1] = [1, 0]
+    selector.slot = 1
+    counters.reset()
+    assert selector.slot == 0
+    assert counters.drain() == [0, 0]
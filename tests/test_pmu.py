@@ -0,0 +1,91 @@
+# This file is part of the Mantis-Monitor data collection suite.
+# Mantis, including the data collection suite (mantis-monitor) and is
+
+# Mantis is free software:
+# you can redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation,
+# either version 3 of the License, or (at your option) any later version.
+
+# Mantis is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with Mantis. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Tests for PMUTopology, packing perf counters against fake sysfs and procfs
+trees: an Intel core with and without the NMI watchdog, a hybrid part, and
+a VM which publishes no PMU.
+"""
+
+import os
+
+import pytest
+
+from mantis_monitor.collector.pmu import CORE_PMUS, PMUTopology
+
+INTEL = {"cpu-cycles": "event=0x3c", "instructions": "event=0xc0", "ref-cycles": "event=0x00,umask=0x03", \
+    "cache-misses": "event=0x2e,umask=0x41"}
+MSR = {"tsc": "event=0x00"}
+
+COUNTERS = ["instructions", "cycles", "ref-cycles", "cache-misses", "branch-misses", "branches", \
+    "cache-references", "page-faults", "msr/tsc/", "sched:sched_switch"]
+
+def fake_tree(root, pmus, watchdog):
+    """
+    Write a fake sysfs and procfs under root
+
+    :param pmus: PMU name -> {event alias: encoding}; core PMUs are given
+    caps/pmu_name
+    :param watchdog: Contents of nmi_watchdog
+    """
+    for name, events in pmus.items():
+        device = os.path.join(root, "sys/bus/event_source/devices", name)
+        os.makedirs(os.path.join(device, "events"))
+        if name in CORE_PMUS:
+            os.makedirs(os.path.join(device, "caps"))
+            with open(os.path.join(device, "caps/pmu_name"), "w") as pmu_name:
+                pmu_name.write("skylake\n")
+        for alias, encoding in events.items():
+            with open(os.path.join(device, "events", alias), "w") as alias_file:
+                alias_file.write(encoding + "\n")
+    os.makedirs(os.path.join(root, "proc/sys/kernel"))
+    with open(os.path.join(root, "proc/sys/kernel/nmi_watchdog"), "w") as nmi_watchdog:
+        nmi_watchdog.write(watchdog + "\n")
+
+@pytest.mark.parametrize("pmus, watchdog, general_counters, expected", [
+    # The fixed counters take instructions, cycles and ref-cycles, the rest
+    # need 4 general-purpose counters; software events, tracepoints and
+    # other PMUs' events join the first run
+    ({"cpu": INTEL, "msr": MSR}, "0", 2, [
+        ["instructions", "cycles", "ref-cycles", "cache-misses", "branch-misses", "page-faults", "msr/tsc/", \
+            "sched:sched_switch"],
+        ["branches", "cache-references"]]),
+    # The NMI watchdog holds the cycles fixed counter
+    ({"cpu": INTEL, "msr": MSR}, "1", 2, [
+        ["instructions", "cycles", "ref-cycles", "cache-misses", "page-faults", "msr/tsc/", "sched:sched_switch"],
+        ["branch-misses", "branches"],
+        ["cache-references"]]),
+    # Hybrid: unprefixed events take a counter on both core PMUs
+    ({"cpu_core": INTEL, "cpu_atom": INTEL, "msr": MSR}, "0", 4, [COUNTERS]),
+    # No PMU published: every hardware event takes a general-purpose counter,
+    # and msr/tsc/ is assumed to as well
+    ({}, "0", 3, [
+        ["instructions", "cycles", "ref-cycles", "page-faults", "sched:sched_switch"],
+        ["cache-misses", "branch-misses", "branches"],
+        ["cache-references", "msr/tsc/"]]),
+], ids = ["intel", "nmi_watchdog", "hybrid", "no_pmu"])
+def test_pack(tmp_path, pmus, watchdog, general_counters, expected):
+    fake_tree(str(tmp_path), pmus, watchdog)
+    assert PMUTopology(str(tmp_path)).pack(COUNTERS, general_counters) == expected
+
+def test_fixed_counters(tmp_path):
+    fake_tree(str(tmp_path), {"cpu": INTEL}, "0")
+    topology = PMUTopology(str(tmp_path))
+    assert topology.core_pmus == ["cpu"]
+    assert topology.fixed["cpu"] == {"instructions", "cycles", "ref-cycles"}
+    assert topology.classify("cycles:u") == [("cpu", "cycles")]
+    assert topology.classify("cache-misses") == [("cpu", None)]
+    assert topology.classify("page-faults") == []